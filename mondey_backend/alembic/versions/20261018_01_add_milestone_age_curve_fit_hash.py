@@ -0,0 +1,48 @@
+"""Store a hash of what each milestone age curve was fitted to.
+
+Revision ID: 20261018_01
+Revises: 20260730_01
+Create Date: 2026-10-18
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "20261018_01"
+down_revision: str | Sequence[str] | None = "20260730_01"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()[f"upgrade_{engine_name}"]()
+
+
+def upgrade_mondey() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    table_name = "milestoneagescorecollection"
+    if not inspector.has_table(table_name):
+        # A new installation creates its tables during application startup.
+        return
+
+    existing_columns = {column["name"] for column in inspector.get_columns(table_name)}
+    if "curve_fit_hash" not in existing_columns:
+        # an empty hash matches no answer counts, so every curve is refitted once
+        op.add_column(
+            table_name,
+            sa.Column(
+                "curve_fit_hash",
+                sa.String(),
+                nullable=False,
+                server_default="",
+            ),
+        )
+
+
+def upgrade_users() -> None:
+    pass
@@ -0,0 +1,94 @@
+"""Store the milestone and milestone group statistics in versions.
+
+Revision ID: 20261018_02
+Revises: 20261018_01
+Create Date: 2026-10-18
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "20261018_02"
+down_revision: str | Sequence[str] | None = "20261018_01"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# each statistics table with its primary key, and for the score tables the collection
+# table they belong to, in the order their foreign keys have to be created
+STATISTICS_TABLES = {
+    "milestoneagescorecollection": (["milestone_id"], None),
+    "milestoneagescore": (["milestone_id", "age"], "milestoneagescorecollection"),
+    "milestonegroupagescorecollection": (["milestone_group_id"], None),
+    "milestonegroupagescore": (
+        ["age", "milestone_group_id"],
+        "milestonegroupagescorecollection",
+    ),
+}
+
+
+def upgrade(engine_name: str) -> None:
+    globals()[f"upgrade_{engine_name}"]()
+
+
+def upgrade_mondey() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # the statistics stored so far become version 0, which is the current version.
+    # statisticsstate only exists if the application was started since it was added,
+    # otherwise it is created along with its version column at application startup.
+    if inspector.has_table("statisticsstate") and "version" not in {
+        column["name"] for column in inspector.get_columns("statisticsstate")
+    }:
+        op.add_column(
+            "statisticsstate",
+            sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+    if not inspector.has_table("milestoneagescore"):
+        # A new installation creates its tables during application startup.
+        return
+    if "version" in {
+        column["name"] for column in inspector.get_columns("milestoneagescore")
+    }:
+        return
+
+    # the foreign keys of the score tables reference the primary keys of the
+    # collection tables, so they are dropped before those are changed. Constraints
+    # without a reflected name have the default postgres name.
+    for table_name, (_, collection_table_name) in STATISTICS_TABLES.items():
+        for foreign_key in inspector.get_foreign_keys(table_name):
+            if foreign_key["referred_table"] == collection_table_name:
+                op.drop_constraint(
+                    foreign_key["name"]
+                    or f"{table_name}_{foreign_key['constrained_columns'][0]}_fkey",
+                    table_name,
+                    type_="foreignkey",
+                )
+    for table_name, (primary_key, collection_table_name) in STATISTICS_TABLES.items():
+        op.add_column(
+            table_name,
+            sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+        )
+        primary_key_name = (
+            inspector.get_pk_constraint(table_name)["name"] or f"{table_name}_pkey"
+        )
+        op.drop_constraint(primary_key_name, table_name, type_="primary")
+        op.create_primary_key(primary_key_name, table_name, ["version", *primary_key])
+        if collection_table_name is not None:
+            collection_key = ["version", STATISTICS_TABLES[collection_table_name][0][0]]
+            op.create_foreign_key(
+                f"{table_name}_{'_'.join(collection_key)}_fkey",
+                table_name,
+                collection_table_name,
+                collection_key,
+                collection_key,
+                ondelete="CASCADE",
+            )
+
+
+def upgrade_users() -> None:
+    pass
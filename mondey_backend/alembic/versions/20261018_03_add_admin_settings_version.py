@@ -0,0 +1,42 @@
+"""Add a version to the admin settings, incremented whenever they change.
+
+Revision ID: 20261018_03
+Revises: 20261018_02
+Create Date: 2026-10-18
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "20261018_03"
+down_revision: str | Sequence[str] | None = "20261018_02"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()[f"upgrade_{engine_name}"]()
+
+
+def upgrade_mondey() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    table_name = "adminsettings"
+    if not inspector.has_table(table_name):
+        # A new installation creates its tables during application startup.
+        return
+
+    existing_columns = {column["name"] for column in inspector.get_columns(table_name)}
+    if "version" not in existing_columns:
+        op.add_column(
+            table_name,
+            sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+
+def upgrade_users() -> None:
+    pass
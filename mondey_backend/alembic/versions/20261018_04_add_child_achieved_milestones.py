@@ -0,0 +1,62 @@
+"""Add the milestones achieved by each child, filled from their completed answer sessions.
+
+Revision ID: 20261018_04
+Revises: 20261018_03
+Create Date: 2026-10-18
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "20261018_04"
+down_revision: str | Sequence[str] | None = "20261018_03"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()[f"upgrade_{engine_name}"]()
+
+
+def upgrade_mondey() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("milestoneanswersession"):
+        # A new installation creates its tables during application startup.
+        return
+
+    table_name = "childachievedmilestone"
+    if not inspector.has_table(table_name):
+        op.create_table(
+            table_name,
+            sa.Column("child_id", sa.Integer(), nullable=False),
+            sa.Column("milestone_id", sa.Integer(), nullable=False),
+            sa.Column("achieved_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["child_id"], ["child.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(
+                ["milestone_id"], ["milestone.id"], ondelete="CASCADE"
+            ),
+            sa.PrimaryKeyConstraint("child_id", "milestone_id"),
+        )
+    # the table may also have been created empty by starting the application
+    if bind.execute(sa.text(f"SELECT 1 FROM {table_name} LIMIT 1")).first() is None:
+        op.execute(
+            sa.text(
+                f"""
+            INSERT INTO {table_name} (child_id, milestone_id, achieved_at)
+            SELECT s.child_id, a.milestone_id, MIN(s.created_at)
+            FROM milestoneanswer a
+            JOIN milestoneanswersession s ON s.id = a.answer_session_id
+            WHERE s.completed AND a.answer = 3
+            GROUP BY s.child_id, a.milestone_id
+            """
+            )
+        )
+
+
+def upgrade_users() -> None:
+    pass
@@ -0,0 +1,41 @@
+"""Add the heartbeat of its worker process to the statistics update job.
+
+Revision ID: 20261018_06
+Revises: 20261018_05
+Create Date: 2026-10-18
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "20261018_06"
+down_revision: str | Sequence[str] | None = "20261018_05"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()[f"upgrade_{engine_name}"]()
+
+
+def upgrade_mondey() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    table_name = "statisticsupdatejob"
+    if not inspector.has_table(table_name):
+        # A new installation creates its tables during application startup.
+        return
+
+    existing_columns = {column["name"] for column in inspector.get_columns(table_name)}
+    if "heartbeat_at" not in existing_columns:
+        op.add_column(
+            table_name, sa.Column("heartbeat_at", sa.DateTime(), nullable=True)
+        )
+
+
+def upgrade_users() -> None:
+    pass
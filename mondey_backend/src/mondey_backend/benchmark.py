@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import pathlib
+import statistics as stats
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+
+import click
+import numpy as np
+from sqlalchemy import Engine
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session
+from sqlmodel import SQLModel
+from sqlmodel import col
+from sqlmodel import create_engine
+from sqlmodel import delete
+from sqlmodel import select
+
+from .generate_dataset import generate_dataset
+from .models.children import Child
+from .models.milestones import Language
+from .models.milestones import Milestone
+from .models.milestones import MilestoneAnswer
+from .models.milestones import MilestoneAnswerSession
+from .models.milestones import SuspiciousState
+from .models.users import Base
+from .models.users import User
+from .routers.scores import compute_milestonegroup_feedback_detailed
+from .routers.scores import compute_milestonegroup_feedback_summary
+from .routers.utils import fit_milestone_age_curve
+from .routers.utils import get_or_create_current_milestone_answer_session
+from .settings import app_settings
+from .statistics import IdIndex
+from .statistics import analyse_answer_session
+from .statistics import async_update_stats
+from .statistics import flag_suspicious_answer_sessions
+from .statistics import load_milestone_counts
+
+# the number of children in the datasets each benchmark is run on by default
+DEFAULT_SIZES = (1000, 10000)
+# the number of answer sessions or children that the per-request benchmarks time, which
+# is the same at every dataset size so that their times are comparable
+REQUESTS_PER_REPEAT = 100
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    children: int
+    # the median wall time of the repeats
+    seconds: float
+    # the peak memory allocated while it ran, as traced by tracemalloc in a separate run
+    peak_memory_bytes: int
+    repeats: int
+    times: list[float] = field(default_factory=list)
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.children}]"
+
+
+@dataclass
+class BenchmarkDataset:
+    children: int
+    engine: Engine
+    users_db_url: str
+
+    def user_session(self) -> AsyncSession:
+        return AsyncSession(create_async_engine(self.users_db_url))
+
+
+# a benchmark returns the function to time, after doing any setup that is not timed:
+# it is called again before each repeat
+Benchmark = Callable[
+    [Session, BenchmarkDataset, np.random.Generator], Callable[[], None]
+]
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> Callable[[Benchmark], Benchmark]:
+    def register(function: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = function
+        return function
+
+    return register
+
+
+def run_update_stats(dataset: BenchmarkDataset, session: Session, **kwargs) -> None:
+    async def run() -> None:
+        async with dataset.user_session() as user_session:
+            await async_update_stats(session, user_session, **kwargs)
+
+    asyncio.run(run())
+
+
+def sample_answer_sessions(
+    session: Session, rng: np.random.Generator
+) -> list[MilestoneAnswerSession]:
+    answer_session_ids = session.exec(
+        select(MilestoneAnswerSession.id).where(col(MilestoneAnswerSession.completed))
+    ).all()
+    return [
+        session.get(MilestoneAnswerSession, answer_session_id)  # type: ignore
+        for answer_session_id in rng.choice(
+            np.array(answer_session_ids),
+            min(REQUESTS_PER_REPEAT, len(answer_session_ids)),
+        ).tolist()
+    ]
+
+
+@benchmark("fit_milestone_age_curve")
+def fit_curves(session: Session, dataset: BenchmarkDataset, rng: np.random.Generator):
+    milestone_index = IdIndex.from_ids(session.exec(select(Milestone.id)).all())  # type: ignore
+    m_counts = np.zeros(
+        (len(milestone_index), app_settings.MAX_CHILD_AGE_MONTHS + 1, 4),
+        dtype=np.uint32,
+    )
+    load_milestone_counts(session, m_counts, milestone_index)
+
+    def run() -> None:
+        for counts in m_counts:
+            fit_milestone_age_curve(counts)
+
+    return run
+
+
+@benchmark("async_update_stats_full_rebuild")
+def update_stats_full_rebuild(
+    session: Session, dataset: BenchmarkDataset, rng: np.random.Generator
+):
+    return lambda: run_update_stats(dataset, session, full_rebuild=True)
+
+
+@benchmark("async_update_stats_incremental")
+def update_stats_incremental(
+    session: Session, dataset: BenchmarkDataset, rng: np.random.Generator
+):
+    # with nothing to add or remove, this is the fixed cost of every weekly update
+    return lambda: run_update_stats(dataset, session)
+
+
+@benchmark("analyse_answer_session")
+def analyse(session: Session, dataset: BenchmarkDataset, rng: np.random.Generator):
+    answer_sessions = sample_answer_sessions(session, rng)
+
+    def run() -> None:
+        for answer_session in answer_sessions:
+            analyse_answer_session(session, answer_session)
+
+    return run
+
+
+@benchmark("flag_suspicious_answer_sessions")
+def flag_suspicious(
+    session: Session, dataset: BenchmarkDataset, rng: np.random.Generator
+):
+    session.execute(
+        update(MilestoneAnswerSession).values(suspicious_state=SuspiciousState.unknown)
+    )
+    session.commit()
+    return lambda: flag_suspicious_answer_sessions(session, [])
+
+
+@benchmark("compute_milestonegroup_feedback_summary")
+def feedback_summary(
+    session: Session, dataset: BenchmarkDataset, rng: np.random.Generator
+):
+    answer_sessions = sample_answer_sessions(session, rng)
+
+    def run() -> None:
+        for answer_session in answer_sessions:
+            compute_milestonegroup_feedback_summary(session, answer_session)
+
+    return run
+
+
+@benchmark("compute_milestonegroup_feedback_detailed")
+def feedback_detailed(
+    session: Session, dataset: BenchmarkDataset, rng: np.random.Generator
+):
+    answer_sessions = sample_answer_sessions(session, rng)
+
+    def run() -> None:
+        for answer_session in answer_sessions:
+            compute_milestonegroup_feedback_detailed(session, answer_session)
+
+    return run
+
+
+@benchmark("get_or_create_current_milestone_answer_session")
+def get_or_create_answer_session(
+    session: Session, dataset: BenchmarkDataset, rng: np.random.Generator
+):
+    child_ids = np.array(session.exec(select(Child.id)).all())
+    child_ids = rng.choice(
+        child_ids, min(REQUESTS_PER_REPEAT, len(child_ids)), replace=False
+    ).tolist()
+    children = session.exec(select(Child).where(col(Child.id).in_(child_ids))).all()
+    # the generated answer sessions have all expired, so each call creates a new one:
+    # remove those created by a previous repeat again
+    created_answer_session_ids = session.exec(
+        select(MilestoneAnswerSession.id)
+        .where(col(MilestoneAnswerSession.child_id).in_(child_ids))
+        .where(~col(MilestoneAnswerSession.expired))
+    ).all()
+    session.execute(
+        delete(MilestoneAnswer).where(
+            col(MilestoneAnswer.answer_session_id).in_(created_answer_session_ids)
+        )
+    )
+    session.execute(
+        delete(MilestoneAnswerSession).where(
+            col(MilestoneAnswerSession.id).in_(created_answer_session_ids)
+        )
+    )
+    session.commit()
+
+    def run() -> None:
+        for child in children:
+            get_or_create_current_milestone_answer_session(
+                session,
+                User(id=child.user_id),  # type: ignore
+                child,
+            )
+
+    return run
+
+
+def prepare_dataset(
+    directory: pathlib.Path, children: int, seed: int
+) -> BenchmarkDataset:
+    """
+    The benchmark dataset with this many children, generated with `generate_dataset`
+    the first time, with its statistics calculated. It is kept in `directory` for the
+    next run: generating a large one takes longer than the benchmarks.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    mondey_db = directory / f"mondey-{children}-{seed}.db"
+    users_db = directory / f"users-{children}-{seed}.db"
+    dataset = BenchmarkDataset(
+        children=children,
+        engine=create_engine(f"sqlite:///{mondey_db}"),
+        users_db_url=f"sqlite+aiosqlite:///{users_db}",
+    )
+    if mondey_db.exists():
+        return dataset
+    click.echo(f"Generating a benchmark dataset of {children} children...")
+    Base.metadata.create_all(create_engine(f"sqlite:///{users_db}"))
+    SQLModel.metadata.create_all(dataset.engine)
+    with Session(dataset.engine) as session:
+        session.add_all([Language(id="de"), Language(id="en")])
+        session.commit()
+        generate_dataset(session, children, seed=seed)
+        run_update_stats(dataset, session)
+    return dataset
+
+
+def measure(
+    name: str,
+    dataset: BenchmarkDataset,
+    repeats: int,
+    seed: int,
+) -> BenchmarkResult:
+    """
+    Time a benchmark `repeats` times, and then run it once more with tracemalloc
+    tracing its allocations, which would distort the times.
+    """
+    rng = np.random.default_rng(seed)
+    times = []
+    peak_memory_bytes = 0
+    for repeat in range(repeats + 1):
+        with Session(dataset.engine) as session:
+            run = BENCHMARKS[name](session, dataset, rng)
+            if repeat < repeats:
+                start_time = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start_time)
+            else:
+                tracemalloc.start()
+                try:
+                    run()
+                    peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+    return BenchmarkResult(
+        name=name,
+        children=dataset.children,
+        seconds=stats.median(times),
+        peak_memory_bytes=peak_memory_bytes,
+        repeats=repeats,
+        times=times,
+    )
+
+
+def compare_to_baseline(
+    results: list[BenchmarkResult],
+    baseline: dict[str, dict],
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> list[str]:
+    """The benchmarks that took longer or allocated more than their baseline allows."""
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.key)
+        if reference is None:
+            continue
+        if result.seconds > reference["seconds"] * (1 + time_tolerance):
+            regressions.append(
+                f"{result.key} took {result.seconds:.3f}s, baseline {reference['seconds']:.3f}s"
+            )
+        if result.peak_memory_bytes > reference["peak_memory_bytes"] * (
+            1 + memory_tolerance
+        ):
+            regressions.append(
+                f"{result.key} allocated {result.peak_memory_bytes} bytes, baseline {reference['peak_memory_bytes']}"
+            )
+    return regressions
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default=",".join(str(size) for size in DEFAULT_SIZES),
+    show_default=True,
+    help="The numbers of children in the datasets to run the benchmarks on",
+)
+@click.option(
+    "--only",
+    multiple=True,
+    type=click.Choice(list(BENCHMARKS)),
+    help="Only run these benchmarks",
+)
+@click.option("--repeats", default=3, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+@click.option(
+    "--data-dir",
+    type=click.Path(path_type=pathlib.Path),
+    default="benchmarks/data",
+    show_default=True,
+    help="Where the generated datasets are kept between runs",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(path_type=pathlib.Path),
+    default="benchmarks/baseline.json",
+    show_default=True,
+)
+@click.option(
+    "--update-baseline",
+    is_flag=True,
+    help="Store the results as the new baseline, rather than comparing them to it",
+)
+@click.option(
+    "--time-tolerance",
+    default=0.5,
+    show_default=True,
+    help="The fraction by which a benchmark may be slower than its baseline",
+)
+@click.option(
+    "--memory-tolerance",
+    default=0.2,
+    show_default=True,
+    help="The fraction by which a benchmark may allocate more than its baseline",
+)
+def benchmark_command(
+    sizes: str,
+    only: tuple[str, ...],
+    repeats: int,
+    seed: int,
+    data_dir: pathlib.Path,
+    baseline: pathlib.Path,
+    update_baseline: bool,
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> None:
+    results = []
+    for children in [int(size) for size in sizes.split(",")]:
+        dataset = prepare_dataset(data_dir, children, seed)
+        for name in only or BENCHMARKS:
+            result = measure(name, dataset, repeats, seed)
+            click.echo(
+                f"{result.key:<60} {result.seconds:>9.3f}s {result.peak_memory_bytes / 2**20:>9.1f} MiB"
+            )
+            results.append(result)
+    if update_baseline:
+        stored = json.loads(baseline.read_text()) if baseline.exists() else {}
+        stored.update({result.key: asdict(result) for result in results})
+        baseline.parent.mkdir(parents=True, exist_ok=True)
+        baseline.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        click.echo(f"Stored the results as the baseline in {baseline}")
+        return
+    if not baseline.exists():
+        click.echo(f"No baseline found in {baseline}")
+        return
+    regressions = compare_to_baseline(
+        results, json.loads(baseline.read_text()), time_tolerance, memory_tolerance
+    )
+    for regression in regressions:
+        click.echo(f"REGRESSION: {regression}")
+    if regressions:
+        raise SystemExit(1)
+    click.echo("No regressions compared to the baseline.")
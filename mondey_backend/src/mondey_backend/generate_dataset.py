@@ -0,0 +1,541 @@
+from __future__ import annotations
+
+import datetime
+import time
+from collections.abc import Sequence
+
+import click
+import numpy as np
+from scipy.special import expit
+from sqlalchemy import Engine
+from sqlalchemy import insert
+from sqlmodel import Session
+from sqlmodel import SQLModel
+from sqlmodel import col
+from sqlmodel import create_engine
+from sqlmodel import func
+from sqlmodel import select
+
+from .logging import logger
+from .models.children import Child
+from .models.milestones import Language
+from .models.milestones import Milestone
+from .models.milestones import MilestoneAnswer
+from .models.milestones import MilestoneAnswerSession
+from .models.milestones import MilestoneGroup
+from .models.milestones import MilestoneGroupText
+from .models.milestones import MilestoneText
+from .models.milestones import SuspiciousState
+from .models.questions import ChildAnswer
+from .models.questions import ChildQuestion
+from .models.questions import ChildQuestionText
+from .models.questions import UserAnswer
+from .models.questions import UserQuestion
+from .models.questions import UserQuestionText
+from .models.users import Base
+from .models.users import User
+from .routers.utils import update_child_achieved_milestones
+from .settings import app_settings
+
+# the children are generated and inserted in batches of this many, which bounds the
+# memory used however large the dataset is
+CHILDREN_PER_BATCH = 5000
+# a child is asked about the milestones whose midpoint is within this many months of
+# its age, roughly what the relevant age range of a fitted curve covers
+RELEVANT_AGE_MARGIN_MONTHS = 12
+# the months between two answer sessions of the same child
+MIN_MONTHS_BETWEEN_SESSIONS = 3
+MAX_MONTHS_BETWEEN_SESSIONS = 9
+# the last answer session of a child is in one of this many months before the end date
+MAX_MONTHS_BEFORE_END = 36
+QUESTION_OPTIONS = ["a", "b", "c", "other"]
+
+
+def month_index(date: datetime.date) -> int:
+    return 12 * date.year + date.month - 1
+
+
+def insert_returning_ids(
+    session: Session, model: type[SQLModel], rows: Sequence[dict]
+) -> np.ndarray:
+    """Insert these rows with a single bulk INSERT, returning their ids in order."""
+    if not rows:
+        return np.zeros(0, dtype=np.int64)
+    return np.array(
+        session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),  # type: ignore
+            rows,
+        ).all(),
+        dtype=np.int64,
+    )
+
+
+def generate_milestones(
+    session: Session,
+    rng: np.random.Generator,
+    milestone_groups: int,
+    milestones_per_group: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Add milestone groups with the given number of milestones each, with midpoints spread
+    evenly over the supported child ages. Returns the id, group id, midpoint and
+    steepness of the logistic age curve of each milestone.
+    """
+    languages = session.exec(select(Language.id)).all()
+    n_milestones = milestone_groups * milestones_per_group
+    max_age = app_settings.MAX_CHILD_AGE_MONTHS
+    midpoints = np.linspace(1.0, max_age - 6.0, num=n_milestones)
+    steepnesses = rng.uniform(0.2, 0.6, n_milestones)
+    group_ids = insert_returning_ids(
+        session,
+        MilestoneGroup,
+        [{"order": order} for order in range(milestone_groups)],
+    )
+    # milestones in a group cover the whole age range, as they do in practice
+    milestone_group_ids = np.tile(group_ids, milestones_per_group)
+    milestone_ids = insert_returning_ids(
+        session,
+        Milestone,
+        [
+            {
+                "group_id": group_id,
+                "order": order,
+                "name": f"milestone {order}",
+                "expected_age_months": round(midpoint),
+                "relevant_age_min": max(round(midpoint) - 6, 0),
+                "relevant_age_max": min(round(midpoint) + 6, max_age),
+            }
+            for order, (group_id, midpoint) in enumerate(
+                zip(milestone_group_ids.tolist(), midpoints.tolist(), strict=True)
+            )
+        ],
+    )
+    if languages:
+        session.execute(
+            insert(MilestoneGroupText),
+            [
+                {"group_id": group_id, "lang_id": lang_id, "title": f"group {group_id}"}
+                for group_id in group_ids.tolist()
+                for lang_id in languages
+            ],
+        )
+        session.execute(
+            insert(MilestoneText),
+            [
+                {
+                    "milestone_id": milestone_id,
+                    "lang_id": lang_id,
+                    "title": f"milestone {milestone_id}",
+                }
+                for milestone_id in milestone_ids.tolist()
+                for lang_id in languages
+            ],
+        )
+    return milestone_ids, milestone_group_ids, midpoints, steepnesses
+
+
+def generate_questions(
+    session: Session, model: type[SQLModel], text_model: type[SQLModel], n: int
+) -> np.ndarray:
+    """Add `n` select questions with the `QUESTION_OPTIONS`, returning their ids."""
+    question_ids = insert_returning_ids(
+        session,
+        model,
+        [
+            {
+                "order": order,
+                "name": f"question {order}",
+                "component": "select",
+                "options": f"[{','.join(QUESTION_OPTIONS)}]",
+                "additional_option": QUESTION_OPTIONS[-1],
+                "visibility": True,
+            }
+            for order in range(n)
+        ],
+    )
+    id_column = (
+        "child_question_id" if text_model is ChildQuestionText else "user_question_id"
+    )
+    languages = session.exec(select(Language.id)).all()
+    if languages:
+        session.execute(
+            insert(text_model),
+            [
+                {
+                    id_column: question_id,
+                    "lang_id": lang_id,
+                    "question": f"question {question_id}",
+                    "options": f"[{','.join(QUESTION_OPTIONS)}]",
+                    "options_json": "",
+                }
+                for question_id in question_ids.tolist()
+                for lang_id in languages
+            ],
+        )
+    return question_ids
+
+
+def question_answers(
+    rng: np.random.Generator, question_ids: np.ndarray, n: int
+) -> list[tuple[int, str, str | None]]:
+    """A random answer to each of these questions for each of `n` respondents."""
+    options = rng.integers(0, len(QUESTION_OPTIONS), (n, question_ids.size))
+    return [
+        (
+            question_id,
+            QUESTION_OPTIONS[option],
+            "something else" if option == len(QUESTION_OPTIONS) - 1 else None,
+        )
+        for respondent_options in options.tolist()
+        for question_id, option in zip(
+            question_ids.tolist(), respondent_options, strict=True
+        )
+    ]
+
+
+def generate_parents(
+    users_engine: Engine | None, mondey_session: Session, n: int, research_groups: int
+) -> np.ndarray:
+    """
+    The user ids of `n` parents. With a users database they are added to it, spread over
+    the given number of research groups; otherwise they are just ids after those of the
+    users that already have children.
+    """
+    if users_engine is None:
+        first_id = (
+            mondey_session.exec(select(func.max(col(Child.user_id)))).one() or 0
+        ) + 1
+        return np.arange(first_id, first_id + n, dtype=np.int64)
+    Base.metadata.create_all(users_engine)
+    with Session(users_engine) as users_session:
+        first_id = (users_session.exec(select(func.max(User.id))).one() or 0) + 1
+        user_ids = np.array(
+            users_session.scalars(
+                insert(User).returning(User.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "email": f"parent{first_id + i}@mondey.example",
+                        "hashed_password": "",
+                        "is_active": True,
+                        "is_superuser": False,
+                        "is_verified": True,
+                        "is_researcher": False,
+                        "full_data_access": False,
+                        "research_group_id": 1 + i % research_groups
+                        if research_groups
+                        else 0,
+                    }
+                    for i in range(n)
+                ],
+            ).all(),
+            dtype=np.int64,
+        )
+        users_session.commit()
+    return user_ids
+
+
+def generate_children(
+    session: Session,
+    rng: np.random.Generator,
+    parent_ids: np.ndarray,
+    child_question_ids: np.ndarray,
+    milestone_ids: np.ndarray,
+    milestone_group_ids: np.ndarray,
+    midpoints: np.ndarray,
+    steepnesses: np.ndarray,
+    max_answer_sessions_per_child: int,
+    noisy_fraction: float,
+    end_date: datetime.date,
+) -> tuple[int, int]:
+    """
+    Add a batch of children of these parents, with their answers to the child questions
+    and their answer sessions. Each child is first asked about its milestones at a
+    random age, and then every few months until it has had up to
+    `max_answer_sessions_per_child` sessions or is too old. Each answer is drawn from a
+    binomial distribution whose mean follows the logistic age curve of the milestone,
+    except in the `noisy_fraction` of answer sessions whose answers are uniformly random.
+
+    Returns the number of answer sessions and milestone answers added.
+    """
+    n = parent_ids.size
+    max_age = app_settings.MAX_CHILD_AGE_MONTHS
+    n_sessions = rng.integers(1, max_answer_sessions_per_child + 1, n)
+    session_child = np.repeat(np.arange(n), n_sessions)
+    first_session = np.cumsum(n_sessions) - n_sessions
+    gaps = rng.integers(
+        MIN_MONTHS_BETWEEN_SESSIONS, MAX_MONTHS_BETWEEN_SESSIONS + 1, session_child.size
+    )
+    gaps[first_session] = 0
+    months_since_first = np.cumsum(gaps) - np.repeat(
+        np.cumsum(gaps)[first_session], n_sessions
+    )
+    first_age = rng.integers(0, max_age + 1, n)
+    ages = first_age[session_child] + months_since_first
+    kept = ages <= max_age
+    session_child, months_since_first, ages = (
+        session_child[kept],
+        months_since_first[kept],
+        ages[kept],
+    )
+    last_months_since_first = np.zeros(n, dtype=np.int64)
+    np.maximum.at(last_months_since_first, session_child, months_since_first)
+    first_month = (
+        month_index(end_date)
+        - 1
+        - rng.integers(0, MAX_MONTHS_BEFORE_END, n)
+        - last_months_since_first
+    )
+    birth_month = first_month - first_age
+    session_month = first_month[session_child] + months_since_first
+
+    child_ids = insert_returning_ids(
+        session,
+        Child,
+        [
+            {
+                "user_id": user_id,
+                "name": "",
+                "birth_year": month // 12,
+                "birth_month": month % 12 + 1,
+                "has_image": False,
+            }
+            for user_id, month in zip(
+                parent_ids.tolist(), birth_month.tolist(), strict=True
+            )
+        ],
+    )
+    answers = question_answers(rng, child_question_ids, n)
+    session.execute(
+        insert(ChildAnswer),
+        [
+            {
+                "child_id": child_id,
+                "question_id": question_id,
+                "answer": answer,
+                "additional_answer": additional_answer,
+            }
+            for child_id, (question_id, answer, additional_answer) in zip(
+                np.repeat(child_ids, child_question_ids.size).tolist(),
+                answers,
+                strict=True,
+            )
+        ],
+    )
+    answer_session_ids = insert_returning_ids(
+        session,
+        MilestoneAnswerSession,
+        [
+            {
+                "child_id": child_id,
+                "user_id": user_id,
+                "created_at": datetime.datetime(month // 12, month % 12 + 1, 15),
+                "expired": True,
+                "completed": True,
+                "included_in_statistics": False,
+                "suspicious_state": SuspiciousState.unknown,
+            }
+            for child_id, user_id, month in zip(
+                child_ids[session_child].tolist(),
+                parent_ids[session_child].tolist(),
+                session_month.tolist(),
+                strict=True,
+            )
+        ],
+    )
+
+    asked = (
+        np.abs(ages[:, np.newaxis] - midpoints[np.newaxis, :])
+        <= RELEVANT_AGE_MARGIN_MONTHS
+    )
+    achieved = expit(steepnesses * (ages[:, np.newaxis] - midpoints))
+    milestone_answers = rng.binomial(3, achieved)
+    noisy = rng.random(ages.size) < noisy_fraction
+    milestone_answers[noisy] = rng.integers(0, 4, (int(noisy.sum()), midpoints.size))
+    session_rows, milestone_rows = np.nonzero(asked)
+    session.execute(
+        insert(MilestoneAnswer),
+        [
+            {
+                "answer_session_id": answer_session_id,
+                "milestone_id": milestone_id,
+                "milestone_group_id": milestone_group_id,
+                "answer": answer,
+            }
+            for answer_session_id, milestone_id, milestone_group_id, answer in zip(
+                answer_session_ids[session_rows].tolist(),
+                milestone_ids[milestone_rows].tolist(),
+                milestone_group_ids[milestone_rows].tolist(),
+                milestone_answers[session_rows, milestone_rows].tolist(),
+                strict=True,
+            )
+        ],
+    )
+    return answer_session_ids.size, session_rows.size
+
+
+def generate_dataset(
+    session: Session,
+    children: int,
+    seed: int = 0,
+    milestone_groups: int = 6,
+    milestones_per_group: int = 15,
+    max_answer_sessions_per_child: int = 3,
+    children_per_parent: float = 1.5,
+    noisy_fraction: float = 0.02,
+    end_date: datetime.date = datetime.date(2026, 1, 1),
+    users_engine: Engine | None = None,
+    research_groups: int = 10,
+) -> dict[str, int]:
+    """
+    Add a synthetic dataset of milestones, parents, children and their answer sessions
+    to the database, for benchmarking with realistic volumes of data. The same
+    arguments always generate the same dataset.
+
+    Returns the number of rows added for each kind of data.
+    """
+    rng = np.random.default_rng(seed)
+    milestone_ids, milestone_group_ids, midpoints, steepnesses = generate_milestones(
+        session, rng, milestone_groups, milestones_per_group
+    )
+    child_question_ids = generate_questions(
+        session, ChildQuestion, ChildQuestionText, 3
+    )
+    user_question_ids = generate_questions(session, UserQuestion, UserQuestionText, 2)
+    n_parents = max(round(children / children_per_parent), 1)
+    parent_ids = generate_parents(users_engine, session, n_parents, research_groups)
+    session.execute(
+        insert(UserAnswer),
+        [
+            {
+                "user_id": user_id,
+                "question_id": question_id,
+                "answer": answer,
+                "additional_answer": additional_answer,
+            }
+            for user_id, (question_id, answer, additional_answer) in zip(
+                np.repeat(parent_ids, user_question_ids.size).tolist(),
+                question_answers(rng, user_question_ids, n_parents),
+                strict=True,
+            )
+        ],
+    )
+    session.commit()
+    # each parent has at least one child, and the rest are spread randomly among them
+    child_parent_ids = np.sort(
+        np.concatenate(
+            [
+                parent_ids,
+                rng.choice(parent_ids, max(children - n_parents, 0)),
+            ]
+        )[:children]
+    )
+    counts = {
+        "milestones": milestone_ids.size,
+        "parents": n_parents,
+        "children": children,
+        "answer_sessions": 0,
+        "milestone_answers": 0,
+    }
+    for start in range(0, children, CHILDREN_PER_BATCH):
+        answer_sessions, milestone_answers = generate_children(
+            session,
+            rng,
+            child_parent_ids[start : start + CHILDREN_PER_BATCH],
+            child_question_ids,
+            milestone_ids,
+            milestone_group_ids,
+            midpoints,
+            steepnesses,
+            max_answer_sessions_per_child,
+            noisy_fraction,
+            end_date,
+        )
+        session.commit()
+        counts["answer_sessions"] += answer_sessions
+        counts["milestone_answers"] += milestone_answers
+        logger.info(
+            f"Generated {min(start + CHILDREN_PER_BATCH, children)} of {children} children"
+        )
+    update_child_achieved_milestones(session)
+    session.commit()
+    return counts
+
+
+@click.command()
+@click.option("--children", default=100000, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+@click.option("--milestone-groups", default=6, show_default=True)
+@click.option("--milestones-per-group", default=15, show_default=True)
+@click.option("--max-answer-sessions-per-child", default=3, show_default=True)
+@click.option("--children-per-parent", default=1.5, show_default=True)
+@click.option(
+    "--noisy-fraction",
+    default=0.02,
+    show_default=True,
+    help="The fraction of answer sessions with random answers",
+)
+@click.option(
+    "--end-date",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    default="2026-01-01",
+    show_default=True,
+    help="The date the answer sessions are generated up to",
+)
+@click.option(
+    "--database-url",
+    default=None,
+    help="The mondey database to add the dataset to, by default the configured one",
+)
+@click.option(
+    "--users-database-url",
+    default=None,
+    help="A users database to add the parents to, with a synchronous driver",
+)
+@click.option("--research-groups", default=10, show_default=True)
+def generate_dataset_command(
+    children: int,
+    seed: int,
+    milestone_groups: int,
+    milestones_per_group: int,
+    max_answer_sessions_per_child: int,
+    children_per_parent: float,
+    noisy_fraction: float,
+    end_date: datetime.datetime,
+    database_url: str | None,
+    users_database_url: str | None,
+    research_groups: int,
+) -> None:
+    if database_url is None:
+        if not app_settings.DATABASE_HOST_MONDEYDB:
+            # without one the backend uses a temporary database, which is of no use here
+            raise click.UsageError(
+                "Either configure a mondey database or pass --database-url"
+            )
+        from .databases.mondey import db_url
+
+        database_url = db_url
+    engine = create_engine(database_url)
+    SQLModel.metadata.create_all(engine)
+    users_engine = create_engine(users_database_url) if users_database_url else None
+    click.echo(f"Generating a dataset of {children} children in {engine.url}...")
+    start_time = time.monotonic()
+    with Session(engine) as session:
+        if session.exec(select(Language)).first() is None:
+            session.add_all([Language(id="de"), Language(id="en")])
+            session.commit()
+        counts = generate_dataset(
+            session,
+            children,
+            seed=seed,
+            milestone_groups=milestone_groups,
+            milestones_per_group=milestones_per_group,
+            max_answer_sessions_per_child=max_answer_sessions_per_child,
+            children_per_parent=children_per_parent,
+            noisy_fraction=noisy_fraction,
+            end_date=end_date.date(),
+            users_engine=users_engine,
+            research_groups=research_groups,
+        )
+    for name, count in counts.items():
+        click.echo(f"  {name}: {count}")
+    click.echo(f"done in {time.monotonic() - start_time:.1f}s.")
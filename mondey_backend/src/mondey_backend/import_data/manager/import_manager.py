@@ -26,6 +26,7 @@ from mondey_backend.models.questions import UserAnswer
 from mondey_backend.models.questions import UserQuestion
 from mondey_backend.models.users import User
 from mondey_backend.models.users import UserCreate
+from mondey_backend.routers.utils import update_child_achieved_milestones
 
 from ...logging import logger
 
@@ -588,6 +589,7 @@ class ImportManager:
         """
         logger.info("Importing children with milestone data")
         children_imported = 0  # Counter for successfully imported children
+        imported_child_ids = []
 
         # Get all milestones
         milestone_query = select(Milestone)
@@ -693,6 +695,7 @@ class ImportManager:
                 # Commit all milestone answers for this child
                 self.data_manager.session.flush()
                 children_imported += 1  # Increment counter on successful import
+                imported_child_ids.append(child.id)
 
             except Exception as e:
                 logger.error(f"Error importing child {child_id}: {e}")
@@ -700,6 +703,7 @@ class ImportManager:
                 # Continue with next child instead of failing entire import
                 continue
 
+        update_child_achieved_milestones(self.data_manager.session, imported_child_ids)
         return children_imported
 
     def import_answers(self, data_df) -> None:
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import datetime
 import logging
 import pathlib
 from contextlib import asynccontextmanager
@@ -21,6 +22,7 @@ from .databases.users import async_session_maker
 from .databases.users import create_user_db_and_tables
 from .databases.users import engine as users_engine
 from .logging import logger
+from .models.milestones import StatisticsUpdateJob
 from .routers import admin
 from .routers import auth
 from .routers import calendarevents
@@ -29,14 +31,16 @@ from .routers import milestones
 from .routers import questions
 from .routers import research
 from .routers import users
+from .routers.utils import update_child_achieved_milestones
 from .settings import app_settings
-from .statistics import async_update_stats
+from .statistics_jobs import async_run_statistics_update_job
+from .statistics_jobs import fail_interrupted_statistics_update_jobs
+from .statistics_jobs import start_statistics_update_job
 
 
-async def scheduled_update_stats():
-    async with async_session_maker() as user_session:
-        with Session(mondey_engine) as session:
-            await async_update_stats(session=session, user_session=user_session)
+def scheduled_update_stats():
+    with Session(mondey_engine) as session:
+        start_statistics_update_job(session)
 
 
 async def import_e2e_test_sql_files():
@@ -60,14 +64,25 @@ async def import_e2e_test_sql_files():
                 for query in queries:
                     con.execute(text(query))
                 con.commit()
+    # in this process, so that the statistics are ready before the first request
     logging.warning("Updating statistics after importing e2e test data")
-    await scheduled_update_stats()
+    async with async_session_maker() as user_session:
+        with Session(mondey_engine) as session:
+            update_child_achieved_milestones(session)
+            job = StatisticsUpdateJob(created_at=datetime.datetime.now())
+            session.add(job)
+            session.commit()
+            await async_run_statistics_update_job(
+                session, user_session, job.id, full_rebuild=False
+            )
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_mondey_db_and_tables()
     await create_user_db_and_tables()
+    with Session(mondey_engine) as session:
+        fail_interrupted_statistics_update_jobs(session)
     if app_settings.E2E_TEST_USER_SQL_FILES and app_settings.E2E_TEST_MONDEY_SQL_FILES:
         await import_e2e_test_sql_files()
     scheduler = AsyncIOScheduler()
@@ -6,7 +6,9 @@ import enum
 import numpy as np
 from pydantic import BaseModel
 from pydantic import model_validator
+from sqlalchemy import JSON
 from sqlalchemy import Column
+from sqlalchemy import ForeignKeyConstraint
 from sqlalchemy import Index
 from sqlalchemy import text
 from sqlalchemy.orm import Mapped
@@ -84,6 +86,8 @@ class AdminSettings(SQLModel, table=True):
     """Admin settings for controlling application behavior. Single row table."""
 
     id: int = Field(default=1, primary_key=True)  # Always 1 - single row table
+    # incremented whenever the settings change, see `get_cached_admin_settings`
+    version: int = 0
     hide_milestone_feedback: bool = Field(default=False)
     hide_milestone_group_feedback: bool = Field(default=False)
     hide_all_feedback: bool = Field(default=False)
@@ -341,6 +345,22 @@ class MilestoneAnswerSessionPublic(SQLModel):
     answers: dict[int, MilestoneAnswerPublic]
 
 
+class MilestoneAnswerSessionFeedbackPublic(SQLModel):
+    answer_session_id: int
+    created_at: datetime.datetime
+    # milestone_group_id -> feedback
+    summary: dict[int, int]
+    # milestone_group_id -> milestone_id -> feedback
+    detailed: dict[int, dict[int, int]]
+
+
+class ChildFeedbackPublic(SQLModel):
+    # the milestone groups of the milestones in any of the answer sessions
+    milestone_groups: dict[int, MilestoneGroupPublic]
+    # the completed answer sessions of the child, oldest first
+    answer_sessions: list[MilestoneAnswerSessionFeedbackPublic]
+
+
 class MilestoneAnswerAnalysis(BaseModel):
     milestone_id: int
     milestone_title: dict[str, str]
@@ -367,21 +387,225 @@ class MilestoneAnswerSessionAnalysis(BaseModel):
     child_answer_flags: list[ChildAnswerAnalysisFlag]
 
 
+class StatisticsUpdatePhaseResult(SQLModel):
+    """What one of the `STATISTICS_UPDATE_PHASES` of a statistics update took."""
+
+    phase: str
+    runtime_seconds: float = 0.0
+    # number of SQL statements executed, and of rows they inserted, updated or deleted
+    queries: int = 0
+    rows: int = 0
+    # the most memory allocated at any point during the phase, as traced by tracemalloc,
+    # or 0 if memory was not traced (see the `STATS_TRACE_MEMORY` setting)
+    peak_memory_bytes: int = 0
+
+
 class StatisticsUpdateResult(BaseModel):
     """Result of a statistics recalculation, used to build a localized summary in the UI."""
 
     answer_sessions: int
     answers: int
     runtime_seconds: float
+    # False if only the answer sessions that changed since the last update were folded
+    # into the existing statistics, True if they were rebuilt from every answer session
+    full_rebuild: bool = True
+    phases: list[StatisticsUpdatePhaseResult] = []
 
 
-class MilestoneAgeScore(SQLModel, table=True):
-    milestone_id: int | None = Field(
+class StatisticsUpdateJobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class StatisticsUpdateJob(SQLModel, table=True):
+    """
+    A statistics update run in a worker process, see `start_statistics_update_job`.
+    The result of the update is stored once it has succeeded.
+    """
+
+    id: int | None = Field(default=None, primary_key=True)
+    status: str = Field(
+        default=StatisticsUpdateJobStatus.queued,
+        sa_column=Column(
+            Enum(StatisticsUpdateJobStatus),
+            nullable=False,
+        ),
+    )
+    # as requested, and once succeeded whether it actually was a full rebuild
+    full_rebuild: bool = False
+    created_at: datetime.datetime = Field(
+        sa_column_kwargs={
+            "server_default": text("CURRENT_TIMESTAMP"),
+        }
+    )
+    started_at: datetime.datetime | None = None
+    finished_at: datetime.datetime | None = None
+    # recorded periodically by the worker process while it runs the update
+    heartbeat_at: datetime.datetime | None = None
+    answer_sessions: int = 0
+    answers: int = 0
+    runtime_seconds: float = 0.0
+    error: str = ""
+    phases: Mapped[list[StatisticsUpdateJobPhase]] = list_relationship(
+        "job", order_by="asc(StatisticsUpdateJobPhase.order)"
+    )
+
+
+class StatisticsUpdateJobPhase(StatisticsUpdatePhaseResult, table=True):
+    job_id: int | None = Field(
         default=None,
         primary_key=True,
-        foreign_key="milestoneagescorecollection.milestone_id",
+        foreign_key="statisticsupdatejob.id",
         ondelete="CASCADE",
     )
+    order: int = Field(default=0, primary_key=True)
+    job: StatisticsUpdateJob = back_populates("phases")
+
+
+class StatisticsUpdateJobPublic(SQLModel):
+    id: int
+    status: StatisticsUpdateJobStatus
+    full_rebuild: bool
+    created_at: datetime.datetime
+    started_at: datetime.datetime | None
+    finished_at: datetime.datetime | None
+    # the phase the update is in, one of `STATISTICS_UPDATE_PHASES`, and the fraction
+    # of the phases that are done
+    phase: str
+    progress: float
+    result: StatisticsUpdateResult | None
+    error: str
+
+
+class StatisticsState(SQLModel, table=True):
+    """
+    What the stored statistics were built from, which an incremental statistics update
+    builds on. Single row table, absent until the first statistics update.
+    """
+
+    id: int = Field(default=1, primary_key=True)  # Always 1 - single row table
+    # the version of the stored statistics that readers use: a statistics update writes
+    # a new version and switches to it by updating this in the same transaction
+    version: int = 0
+    # a hash of which milestones were averaged in which milestone group, see
+    # `milestone_group_statistics_hash`: if this changes, every answer session's
+    # milestone group scores have to be recalculated
+    milestone_groups_hash: str = ""
+    # the number of answer sessions the stored statistics include: if fewer of them are
+    # left, some were deleted without being taken out of the statistics
+    answer_sessions: int = 0
+    updated_at: datetime.datetime = Field(
+        sa_column_kwargs={
+            "server_default": text("CURRENT_TIMESTAMP"),
+        }
+    )
+
+
+class MilestoneAnswerSessionStatistics(SQLModel, table=True):
+    """
+    The child age at which an answer session was counted in the statistics, so that its
+    answers can be taken out of them again if it stops being included.
+    """
+
+    answer_session_id: int = Field(
+        primary_key=True, foreign_key="milestoneanswersession.id", ondelete="CASCADE"
+    )
+    child_age: int
+
+
+class MilestoneGroupAnswerSessionScore(SQLModel, table=True):
+    """
+    The score that an answer session contributed to the statistics of a milestone
+    group, so that it can be taken out of them again if it stops being included.
+    """
+
+    answer_session_id: int = Field(
+        primary_key=True, foreign_key="milestoneanswersession.id", ondelete="CASCADE"
+    )
+    milestone_group_id: int = Field(
+        primary_key=True, foreign_key="milestonegroup.id", ondelete="CASCADE"
+    )
+    age: int
+    score: float
+
+
+class MilestoneExpectedAnswers(SQLModel, table=True):
+    """
+    The expected answer for each milestone and child age of a statistics version, see
+    `ExpectedMilestoneAnswers`. It is always read as a whole, so it is stored as arrays
+    in a single row rather than a row for each milestone and age.
+    """
+
+    version: int = Field(primary_key=True)
+    # the milestone ids of the rows, as int64
+    milestone_ids: bytes
+    # the expected answers as float32, a row for each milestone and a column for each
+    # age, NaN where there is no expected answer
+    answers: bytes
+
+
+class MilestoneAnswerSessionFeedback(SQLModel, table=True):
+    """
+    The feedback computed for an answer session that can no longer be changed, so that
+    it only has to be computed again if the statistics or the child's age in the
+    answer session change. Either kind of feedback is `None` until it is requested.
+    """
+
+    answer_session_id: int = Field(
+        primary_key=True, foreign_key="milestoneanswersession.id", ondelete="CASCADE"
+    )
+    statistics_version: int
+    child_age: int
+    # milestone_group_id -> feedback, see `compute_milestonegroup_feedback_summary`
+    summary: dict[str, int] | None = Field(default=None, sa_column=Column(JSON))
+    # milestone_group_id -> milestone_id -> feedback, see
+    # `compute_milestonegroup_feedback_detailed`
+    detailed: dict[str, dict[str, int]] | None = Field(
+        default=None, sa_column=Column(JSON)
+    )
+
+
+class ChildAchievedMilestone(SQLModel, table=True):
+    """
+    A milestone that a child has achieved, i.e. answered 3 for in a completed answer
+    session, and when they first did, see `update_child_achieved_milestones`.
+    """
+
+    child_id: int = Field(primary_key=True, foreign_key="child.id", ondelete="CASCADE")
+    milestone_id: int = Field(
+        primary_key=True, foreign_key="milestone.id", ondelete="CASCADE"
+    )
+    # the creation time of the first completed answer session with an answer of 3
+    achieved_at: datetime.datetime
+
+
+class MilestoneCatalogueState(SQLModel, table=True):
+    """
+    Single row table, absent until an admin first changes a milestone.
+    """
+
+    id: int = Field(default=1, primary_key=True)  # Always 1 - single row table
+    # incremented whenever a milestone is added, changed or deleted, see
+    # `milestone_catalogue_changed`
+    version: int = 0
+
+
+class MilestoneAgeScore(SQLModel, table=True):
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["version", "milestone_id"],
+            [
+                "milestoneagescorecollection.version",
+                "milestoneagescorecollection.milestone_id",
+            ],
+            ondelete="CASCADE",
+        ),
+    )
+
+    version: int = Field(default=0, primary_key=True)
+    milestone_id: int | None = Field(default=None, primary_key=True)
     age: int = Field(primary_key=True)
     collection: MilestoneAgeScoreCollection = back_populates("scores")
     c0: int
@@ -414,6 +638,8 @@ class MilestoneAgeScore(SQLModel, table=True):
 
 
 class MilestoneAgeScoreCollection(SQLModel, table=True):
+    # the statistics version these scores belong to, see `StatisticsState.version`
+    version: int = Field(default=0, primary_key=True)
     milestone_id: int = Field(
         default=None, primary_key=True, foreign_key="milestone.id", ondelete="CASCADE"
     )
@@ -422,6 +648,9 @@ class MilestoneAgeScoreCollection(SQLModel, table=True):
     curve_steepness: float = 0.0
     curve_fit_ok: bool = False
     curve_n_answers: int = 0
+    # hash of the answer counts and settings the curve was fitted with, so that the fit
+    # can be reused while they are unchanged, see `milestone_age_curve_fit_hash`
+    curve_fit_hash: str = ""
     scores: Mapped[list[MilestoneAgeScore]] = list_relationship("collection")
     created_at: datetime.datetime = Field(
         sa_column_kwargs={
@@ -444,13 +673,20 @@ class MilestoneAgeScoreCollectionPublic(SQLModel):
 
 
 class MilestoneGroupAgeScore(SQLModel, table=True):
-    age: int | None = Field(default=None, primary_key=True)
-    milestone_group_id: int | None = Field(
-        default=None,
-        primary_key=True,
-        foreign_key="milestonegroupagescorecollection.milestone_group_id",
-        ondelete="CASCADE",
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["version", "milestone_group_id"],
+            [
+                "milestonegroupagescorecollection.version",
+                "milestonegroupagescorecollection.milestone_group_id",
+            ],
+            ondelete="CASCADE",
+        ),
     )
+
+    version: int = Field(default=0, primary_key=True)
+    age: int | None = Field(default=None, primary_key=True)
+    milestone_group_id: int | None = Field(default=None, primary_key=True)
     collection: MilestoneGroupAgeScoreCollection = back_populates("scores")
     count: int
     sum_score: float
@@ -480,6 +716,8 @@ class MilestoneGroupAgeScore(SQLModel, table=True):
 
 
 class MilestoneGroupAgeScoreCollection(SQLModel, table=True):
+    # the statistics version these scores belong to, see `StatisticsState.version`
+    version: int = Field(default=0, primary_key=True)
     milestone_group_id: int = Field(
         default=None,
         primary_key=True,
@@ -10,7 +10,6 @@ from sqlmodel import col
 from sqlmodel import select
 
 from ...dependencies import SessionDep
-from ...dependencies import UserAsyncSessionDep
 from ...models.milestones import Language
 from ...models.milestones import Milestone
 from ...models.milestones import MilestoneAdmin
@@ -25,18 +24,23 @@ from ...models.milestones import MilestoneGroupAdmin
 from ...models.milestones import MilestoneGroupText
 from ...models.milestones import MilestoneImage
 from ...models.milestones import MilestoneText
-from ...models.milestones import StatisticsUpdateResult
+from ...models.milestones import StatisticsUpdateJobPublic
 from ...models.milestones import SuspiciousState
 from ...models.utils import DeleteResponse
 from ...models.utils import ItemOrder
 from ...statistics import analyse_answer_session
-from ...statistics import async_update_stats
+from ...statistics_jobs import get_statistics_update_job
+from ...statistics_jobs import get_statistics_update_jobs
+from ...statistics_jobs import start_statistics_update_job
 from ..utils import add
 from ..utils import count_milestone_answers_for_milestone
 from ..utils import get
 from ..utils import get_admin_settings
 from ..utils import get_milestone_age_curve_params
+from ..utils import get_statistics_version
+from ..utils import increment_admin_settings_version
 from ..utils import milestone_age_score_collection_public
+from ..utils import milestone_catalogue_changed
 from ..utils import milestone_group_image_path
 from ..utils import milestone_image_path
 from ..utils import update_item_orders
@@ -106,6 +110,7 @@ def create_router() -> APIRouter:
 
         if not dry_run:
             session.delete(milestone_group)
+            milestone_catalogue_changed(session)
             session.commit()
 
         return {
@@ -138,6 +143,7 @@ def create_router() -> APIRouter:
             session.add(
                 MilestoneText(milestone_id=db_milestone.id, lang_id=language.id)
             )
+        milestone_catalogue_changed(session)
         session.commit()
         session.refresh(db_milestone)
         return db_milestone
@@ -149,6 +155,11 @@ def create_router() -> APIRouter:
     ):
         db_milestone = get(session, Milestone, milestone.id)
         group_changed = milestone.group_id != db_milestone.group_id
+        # the stored feedback does not depend on e.g. the text of the milestone
+        feedback_changed = (
+            group_changed
+            or milestone.expected_age_months != db_milestone.expected_age_months
+        )
         db_milestone.sqlmodel_update(milestone.model_dump(exclude={"text", "images"}))
         if group_changed:
             # place the milestone at the end of its new group's ordering
@@ -160,6 +171,7 @@ def create_router() -> APIRouter:
                 .values(milestone_group_id=milestone.group_id)
             )
         update_milestone_text(session, milestone)
+        milestone_catalogue_changed(session, feedback_changed)
         add(session, db_milestone)
         return db_milestone
 
@@ -176,6 +188,7 @@ def create_router() -> APIRouter:
         if not dry_run:
             milestone = get(session, Milestone, milestone_id)
             session.delete(milestone)
+            milestone_catalogue_changed(session)
             session.commit()
         return {
             "ok": True,
@@ -210,7 +223,11 @@ def create_router() -> APIRouter:
     def get_milestone_age_scores(
         session: SessionDep, milestone_id: int
     ) -> MilestoneAgeScoreCollectionPublic:
-        collection = get(session, MilestoneAgeScoreCollection, milestone_id)
+        collection = get(
+            session,
+            MilestoneAgeScoreCollection,
+            {"version": get_statistics_version(session), "milestone_id": milestone_id},
+        )
         return milestone_age_score_collection_public(
             collection, get_milestone_age_curve_params(session)
         )
@@ -223,21 +240,52 @@ def create_router() -> APIRouter:
         for field, value in params.model_dump().items():
             setattr(settings, field, value)
         session.add(settings)
+        session.flush()
+        increment_admin_settings_version(session)
         session.commit()
 
         return [
             milestone_age_score_collection_public(collection, params)
-            for collection in session.exec(select(MilestoneAgeScoreCollection)).all()
+            for collection in session.exec(
+                select(MilestoneAgeScoreCollection).where(
+                    MilestoneAgeScoreCollection.version
+                    == get_statistics_version(session)
+                )
+            ).all()
         ]
 
     @router.post(
         "/update-stats/",
-        response_model=StatisticsUpdateResult,
+        response_model=StatisticsUpdateJobPublic,
     )
-    async def admin_update_stats(
-        session: SessionDep, user_session: UserAsyncSessionDep
+    def admin_update_stats(
+        session: SessionDep,
+        full_rebuild: bool = Query(
+            False,
+            description="When true, rebuilds the statistics from every answer session instead of only adding the changes since the last update",
+        ),
     ):
-        return await async_update_stats(session, user_session)
+        job = start_statistics_update_job(session, full_rebuild)
+        return get_statistics_update_job(session, job.id)  # type: ignore
+
+    @router.get(
+        "/update-stats/",
+        response_model=list[StatisticsUpdateJobPublic],
+    )
+    def admin_get_update_stats_jobs(
+        session: SessionDep,
+        limit: int = Query(
+            50, ge=1, description="The number of most recent jobs to return"
+        ),
+    ):
+        return get_statistics_update_jobs(session, limit)
+
+    @router.get(
+        "/update-stats/{job_id}",
+        response_model=StatisticsUpdateJobPublic,
+    )
+    def admin_get_update_stats_job(session: SessionDep, job_id: int):
+        return get_statistics_update_job(session, job_id)
 
     @router.get(
         "/milestone-answer-sessions/",
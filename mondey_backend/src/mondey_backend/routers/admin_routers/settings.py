@@ -7,6 +7,7 @@ from ...models.milestones import AdminSettings
 from ...models.milestones import AdminSettingsPublic
 from ...models.milestones import AdminSettingsUpdate
 from ..utils import get
+from ..utils import increment_admin_settings_version
 
 
 def create_router() -> APIRouter:
@@ -30,6 +31,8 @@ def create_router() -> APIRouter:
             setattr(settings, field, value)
 
         session.add(settings)
+        session.flush()
+        increment_admin_settings_version(session)
         session.commit()
         session.refresh(settings)
 
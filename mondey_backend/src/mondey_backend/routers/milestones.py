@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from fastapi import APIRouter
-from sqlalchemy.orm import lazyload
+from sqlalchemy.orm import selectinload
 from sqlmodel import col
 from sqlmodel import select
 
@@ -9,6 +9,7 @@ from ..dependencies import CurrentActiveUserDep
 from ..dependencies import SessionDep
 from ..models.milestones import Language
 from ..models.milestones import Milestone
+from ..models.milestones import MilestoneAnswer
 from ..models.milestones import MilestoneGroup
 from ..models.milestones import MilestoneGroupPublic
 from ..models.milestones import MilestonePublic
@@ -51,15 +52,24 @@ def create_router() -> APIRouter:
         milestone_answer_session = get_or_create_current_milestone_answer_session(
             session, current_active_user, child
         )
-        milestone_ids = list(milestone_answer_session.answers.keys())
+        milestone_ids = session.exec(
+            select(col(MilestoneAnswer.milestone_id)).where(
+                col(MilestoneAnswer.answer_session_id) == milestone_answer_session.id
+            )
+        ).all()
 
+        # load the milestones of the answer session and all of their texts and images
+        # with one query each, rather than one for each milestone group and milestone
+        milestones = selectinload(
+            MilestoneGroup.milestones.and_(col(Milestone.id).in_(milestone_ids))
+        )
         milestone_groups = session.exec(
             select(MilestoneGroup)
             .order_by(col(MilestoneGroup.order))
             .options(
-                lazyload(
-                    MilestoneGroup.milestones.and_(col(Milestone.id).in_(milestone_ids))
-                )
+                selectinload(MilestoneGroup.text),
+                milestones.selectinload(Milestone.text),
+                milestones.selectinload(Milestone.images),
             )
         ).all()
 
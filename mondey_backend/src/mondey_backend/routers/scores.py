@@ -1,19 +1,37 @@
 from __future__ import annotations
 
+import dataclasses
 from collections import defaultdict
+from collections.abc import Callable
+from collections.abc import Sequence
 from enum import Enum
+from typing import Any
 
 import numpy as np
+from fastapi import BackgroundTasks
+from sqlalchemy import Connection
+from sqlalchemy import Engine
+from sqlmodel import Session
+from sqlmodel import col
 from sqlmodel import select
 
 from ..dependencies import SessionDep
 from ..logging import logger
+from ..models.children import Child
 from ..models.milestones import Milestone
 from ..models.milestones import MilestoneAnswerSession
+from ..models.milestones import MilestoneAnswerSessionFeedback
 from ..models.milestones import MilestoneGroupAgeScore
+from ..statistics import IdIndex
+from ..statistics import get_expected_milestone_answers
+from .utils import VersionedCache
 from .utils import get_answer_session_child_age_in_months
-from .utils import get_milestone_curves
+from .utils import get_child_age_in_months
+from .utils import get_milestone_catalogue_version
 from .utils import get_previously_achieved_milestone_ids
+from .utils import get_statistics_version
+from .utils import iter_sessions_with_previously_achieved_milestone_ids
+from .utils import upsert
 
 
 class TrafficLight(Enum):
@@ -110,8 +128,56 @@ def compute_feedback_milestone_group(
         return TrafficLight.green.value
 
 
+@dataclasses.dataclass(frozen=True)
+class MilestoneCatalogue:
+    """
+    The milestones as arrays, with a row for each milestone in `milestone_index`, so that
+    the feedback for an answer session is computed with a few array operations.
+    """
+
+    milestone_index: IdIndex
+    # the milestone group of each milestone, as a row of `milestone_group_index`
+    milestone_group_rows: np.ndarray
+    milestone_group_index: IdIndex
+    expected_age_months: np.ndarray
+
+
+def load_milestone_catalogue(session: SessionDep) -> MilestoneCatalogue:
+    rows = session.exec(
+        select(Milestone.id, Milestone.group_id, Milestone.expected_age_months)
+        .where(col(Milestone.group_id).is_not(None))
+        .order_by(col(Milestone.id))
+    ).all()
+    milestone_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    milestone_group_ids = np.array([row[1] for row in rows], dtype=np.int64)
+    milestone_group_index = IdIndex.from_ids(milestone_group_ids)
+    return MilestoneCatalogue(
+        milestone_index=IdIndex(ids=milestone_ids),
+        milestone_group_rows=milestone_group_index.rows(milestone_group_ids),
+        milestone_group_index=milestone_group_index,
+        expected_age_months=np.array([row[2] for row in rows], dtype=np.int64),
+    )
+
+
+_milestone_catalogue_cache: VersionedCache[MilestoneCatalogue] = VersionedCache()
+
+
+def get_milestone_catalogue(session: SessionDep) -> MilestoneCatalogue:
+    """
+    The milestones, loaded once and then cached in this process until an admin adds,
+    changes or deletes a milestone (see `milestone_catalogue_changed`).
+    """
+    return _milestone_catalogue_cache.get(
+        get_milestone_catalogue_version(session),
+        lambda: load_milestone_catalogue(session),
+    )
+
+
 def compute_milestonegroup_feedback_summary(
-    session: SessionDep, answersession: MilestoneAnswerSession
+    session: SessionDep,
+    answersession: MilestoneAnswerSession,
+    child_age: int | None = None,
+    achieved_milestone_ids: set[int] | None = None,
 ) -> dict[int, int]:
     """
     Compute the summary milestonegroup feedback for each milestonegroup.
@@ -134,6 +200,10 @@ def compute_milestonegroup_feedback_summary(
         database session
     answersession : MilestoneAnswerSession
         answersession to compute feedback for. This contains the answers on which basis the feedback is computed
+    child_age : int | None
+        The age of the child in months when the answersession was created, looked up if not given
+    achieved_milestone_ids : set[int] | None
+        The milestones the child achieved before the answersession, looked up if not given
 
     Returns
     -------
@@ -145,70 +215,108 @@ def compute_milestonegroup_feedback_summary(
         f"  answersession id: {answersession.id}, created_at: {answersession.created_at}"
     )
 
-    child_age = get_answer_session_child_age_in_months(session, answersession)
+    if child_age is None:
+        child_age = get_answer_session_child_age_in_months(session, answersession)
     logger.debug(f"  child age in months: {child_age}")
-
-    # get answers for each MilestoneGroup
-    milestones = session.exec(select(Milestone)).all()
-    milestone_group_answers: dict[int, list[float]] = defaultdict(list)
-    milestone_group_ids = set()
-    achieved_milestone_ids = get_previously_achieved_milestone_ids(
-        session, answersession.child_id, answersession.created_at
+    scores = compute_milestonegroup_scores(
+        session, answersession, child_age, achieved_milestone_ids
     )
-    milestone_curves = get_milestone_curves(session)
-    for milestone in milestones:
-        answer = answersession.answers.get(milestone.id)  # type: ignore
-        if answer is not None:
-            # only provide feedback for a milestone group if the answer session contains at least one milestone in the group
-            milestone_group_ids.add(answer.milestone_group_id)
-        # this score is compared against the milestone group statistics, so it has to be
-        # calculated over the same milestones that those are calculated over: the ones
-        # with a fitted age curve.
-        curve = milestone_curves.get(milestone.id)  # type: ignore
-        if curve is None:
-            continue
-        if answer is not None:
-            answer_value = float(answer.answer)
-        elif milestone.id in achieved_milestone_ids:
-            # the child achieved this milestone in an earlier session, which is why it is
-            # not in this one - we know the answer, so we do not impute it
-            answer_value = 3.0
-        else:
-            # the child was not asked about this milestone, so impute the mean answer of
-            # children of this age for it
-            answer_value = float(curve.mean_answer(child_age))
-        milestone_group_answers[milestone.group_id].append(answer_value)  # type: ignore
-
+    logger.debug(f"  scores: {scores}")
+    # only provide feedback for a milestone group if the answer session contains at
+    # least one milestone in the group
+    milestone_group_ids = sorted(
+        {answer.milestone_group_id for answer in answersession.answers.values()}
+    )
+    statistics_version = get_statistics_version(session)
+    milestone_group_age_scores = {
+        stats.milestone_group_id: stats
+        for stats in session.exec(
+            select(MilestoneGroupAgeScore).where(
+                col(MilestoneGroupAgeScore.version) == statistics_version,
+                col(MilestoneGroupAgeScore.age) == child_age,
+                col(MilestoneGroupAgeScore.milestone_group_id).in_(milestone_group_ids),
+            )
+        ).all()
+    }
     feedback: dict[int, int] = {}
     for milestone_group_id in milestone_group_ids:
-        logger.debug(f"  milestone_group_id: {milestone_group_id}")
-        answers = milestone_group_answers[milestone_group_id]
-        logger.debug(f"  answers: {answers}")
-        if not answers:
+        score = scores.get(milestone_group_id)
+        if score is None:
             # no milestone in this group has a usable age curve, so there is no score to
             # compare against the statistics for this group
             feedback[milestone_group_id] = TrafficLight.invalid.value
             continue
-        avg_score = float(np.mean(answers))
-        logger.debug(f"  mean: {avg_score}")
-        milestone_group_age_score = session.get(
-            MilestoneGroupAgeScore,
-            {"milestone_group_id": milestone_group_id, "age": child_age},
-        )
-        logger.debug(f"  stats: {milestone_group_age_score}")
         feedback[milestone_group_id] = compute_feedback_milestone_group(
-            milestone_group_age_score, avg_score
+            milestone_group_age_scores.get(milestone_group_id), score
         )
     logger.debug(f"summary feedback: {feedback}")
     return feedback
 
 
+def compute_milestonegroup_scores(
+    session: SessionDep,
+    answersession: MilestoneAnswerSession,
+    child_age: int,
+    achieved_milestone_ids: set[int] | None = None,
+) -> dict[int, float]:
+    """
+    The child's mean score for each milestonegroup that has a milestone with a fitted
+    age curve, see `compute_milestonegroup_feedback_summary`.
+    """
+    if achieved_milestone_ids is None:
+        achieved_milestone_ids = get_previously_achieved_milestone_ids(
+            session, answersession.child_id, answersession.created_at
+        )
+    catalogue = get_milestone_catalogue(session)
+    # the expected answers and the milestone group statistics have to be from the same
+    # version
+    expected_answers = get_expected_milestone_answers(
+        session, get_statistics_version(session)
+    )
+    # this score is compared against the milestone group statistics, so it has to be
+    # calculated over the same milestones that those are calculated over: the ones with
+    # a fitted age curve
+    expected_rows = expected_answers.milestone_index.rows(catalogue.milestone_index.ids)
+    averaged = (expected_rows >= 0) & expected_answers.has_curve[expected_rows]
+    # for a milestone the child was not asked about, impute the mean answer of children
+    # of this age for it
+    values = expected_answers.lookup(
+        catalogue.milestone_index.ids,
+        np.full(len(catalogue.milestone_index), child_age),
+    ).astype(np.float64)
+    # the child achieved these milestones in an earlier session, which is why they are
+    # not in this one - we know the answer, so we do not impute it
+    achieved_rows = catalogue.milestone_index.rows(sorted(achieved_milestone_ids))
+    values[achieved_rows[achieved_rows >= 0]] = 3.0
+    answers = answersession.answers.values()
+    answer_rows = catalogue.milestone_index.rows(
+        [answer.milestone_id for answer in answers]  # type: ignore
+    )
+    answer_values = np.array([answer.answer for answer in answers], dtype=np.float64)
+    values[answer_rows[answer_rows >= 0]] = answer_values[answer_rows >= 0]
+
+    milestone_group_rows = catalogue.milestone_group_rows[averaged]
+    n_groups = len(catalogue.milestone_group_index)
+    counts = np.bincount(milestone_group_rows, minlength=n_groups)
+    sums = np.bincount(
+        milestone_group_rows, weights=values[averaged], minlength=n_groups
+    )
+    return {
+        int(milestone_group_id): float(sums[row] / counts[row])
+        for row, milestone_group_id in enumerate(catalogue.milestone_group_index.ids)
+        if counts[row] > 0
+    }
+
+
 def compute_milestonegroup_feedback_detailed(
-    session: SessionDep, answersession: MilestoneAnswerSession
+    session: SessionDep,
+    answersession: MilestoneAnswerSession,
+    child_age: int | None = None,
 ) -> dict[int, dict[int, int]]:
     """
     Compute the per-milestone (detailed) feedback for all answers in a given answersession.
-    See `compute_feedback_milestone` for the feedback logic.
+    See `compute_feedback_milestone` for the feedback logic, which this applies to all
+    answers at once.
     Return a dictionary mapping milestonegroup_id -> [milestone_id -> feedback].
     Parameters
     ----------
@@ -216,6 +324,8 @@ def compute_milestonegroup_feedback_detailed(
         database session
     answersession : MilestoneAnswerSession
         answersession to compute feedback for. This contains the answers on which basis the feedback is computed
+    child_age : int | None
+        The age of the child in months when the answersession was created, looked up if not given
 
     Returns
     -------
@@ -226,16 +336,219 @@ def compute_milestonegroup_feedback_detailed(
     logger.debug(
         f"  answersession id: {answersession.id} created_at: {answersession.created_at}"
     )
-    child_age = get_answer_session_child_age_in_months(session, answersession)
+    if child_age is None:
+        child_age = get_answer_session_child_age_in_months(session, answersession)
     logger.debug(f"  child age in months: {child_age}")
 
-    # for each milestone in the answer session, get the statistics, compute the current mean, and compute the feedback
+    catalogue = get_milestone_catalogue(session)
+    answers = list(answersession.answers.values())
+    rows = catalogue.milestone_index.rows(
+        [answer.milestone_id for answer in answers]  # type: ignore
+    )
+    answer_values = np.array([answer.answer for answer in answers], dtype=np.int64)
+    expected_age_months = np.where(rows >= 0, catalogue.expected_age_months[rows], 0)
+    feedback_values = np.select(
+        [
+            rows < 0,
+            child_age < expected_age_months,
+            answer_values == 0,
+            answer_values == 1,
+        ],
+        [
+            TrafficLight.invalid.value,
+            TrafficLight.green.value,
+            TrafficLight.red.value,
+            TrafficLight.yellow.value,
+        ],
+        TrafficLight.green.value,
+    )
     feedback: dict[int, dict[int, int]] = defaultdict(dict)
-    for milestone_id, answer in answersession.answers.items():
-        logger.debug(f"  milestone_id: {milestone_id}, answer: {answer.answer}")
-        milestone = session.get(Milestone, milestone_id)
-        feedback_value = compute_feedback_milestone(milestone, child_age, answer.answer)
+    for answer, feedback_value in zip(answers, feedback_values.tolist(), strict=True):
         feedback[answer.milestone_group_id][answer.milestone_id] = feedback_value  # type: ignore
     logger.debug(f" detailed feedback: {feedback}")
 
     return feedback
+
+
+def save_feedback(bind: Engine | Connection, rows: list[dict[str, Any]]) -> None:
+    """
+    Store computed feedback in `MilestoneAnswerSessionFeedback`, with a session of its
+    own. This runs as a background task once the response that the feedback was
+    computed for has been sent, so that the requests that read feedback do not write it.
+    """
+    with Session(bind) as session:
+        upsert(session, MilestoneAnswerSessionFeedback, rows, ["answer_session_id"])
+        session.commit()
+
+
+def _stored_feedback(
+    session: SessionDep,
+    answersession: MilestoneAnswerSession,
+    kind: str,
+    compute: Callable[[SessionDep, MilestoneAnswerSession], dict],
+    from_json: Callable[[Any], dict],
+    background_tasks: BackgroundTasks,
+) -> dict:
+    """
+    The feedback of this `kind` for an answer session, computed with `compute` the first
+    time it is requested and stored in `MilestoneAnswerSessionFeedback` (by
+    `save_feedback` in `background_tasks`) for the requests after that. Stored feedback
+    is computed again once the statistics have been updated or the child's age in the
+    answer session has changed (i.e. their birth date was corrected). Feedback for an
+    answer session that can still be answered is not stored.
+    """
+    if not answersession.expired:
+        return compute(session, answersession)
+    statistics_version = get_statistics_version(session)
+    child_age = get_answer_session_child_age_in_months(session, answersession)
+    row: dict[str, Any] = {
+        "answer_session_id": answersession.id,
+        "statistics_version": statistics_version,
+        "child_age": child_age,
+        "summary": None,
+        "detailed": None,
+    }
+    stored = session.get(MilestoneAnswerSessionFeedback, answersession.id)
+    if (
+        stored is not None
+        and stored.statistics_version == statistics_version
+        and stored.child_age == child_age
+    ):
+        if getattr(stored, kind) is not None:
+            return from_json(getattr(stored, kind))
+        row["summary"] = stored.summary
+        row["detailed"] = stored.detailed
+    feedback = compute(session, answersession)
+    row[kind] = feedback
+    background_tasks.add_task(save_feedback, session.get_bind(), [row])
+    return feedback
+
+
+def _summary_from_json(summary: dict[str, int]) -> dict[int, int]:
+    return {
+        int(milestone_group_id): feedback
+        for milestone_group_id, feedback in summary.items()
+    }
+
+
+def _detailed_from_json(
+    detailed: dict[str, dict[str, int]],
+) -> dict[int, dict[int, int]]:
+    return {
+        int(milestone_group_id): {
+            int(milestone_id): feedback
+            for milestone_id, feedback in milestone_feedback.items()
+        }
+        for milestone_group_id, milestone_feedback in detailed.items()
+    }
+
+
+def get_milestonegroup_feedback_summary(
+    session: SessionDep,
+    answersession: MilestoneAnswerSession,
+    background_tasks: BackgroundTasks,
+) -> dict[int, int]:
+    """The summary feedback of `compute_milestonegroup_feedback_summary`, stored."""
+    return _stored_feedback(
+        session,
+        answersession,
+        "summary",
+        compute_milestonegroup_feedback_summary,
+        _summary_from_json,
+        background_tasks,
+    )
+
+
+def get_milestonegroup_feedback_detailed(
+    session: SessionDep,
+    answersession: MilestoneAnswerSession,
+    background_tasks: BackgroundTasks,
+) -> dict[int, dict[int, int]]:
+    """The detailed feedback of `compute_milestonegroup_feedback_detailed`, stored."""
+    return _stored_feedback(
+        session,
+        answersession,
+        "detailed",
+        compute_milestonegroup_feedback_detailed,
+        _detailed_from_json,
+        background_tasks,
+    )
+
+
+def get_child_feedback(
+    session: SessionDep,
+    child: Child,
+    answersessions: Sequence[MilestoneAnswerSession],
+    background_tasks: BackgroundTasks,
+    with_summary: bool = True,
+    with_detailed: bool = True,
+) -> list[tuple[MilestoneAnswerSession, dict[int, int], dict[int, dict[int, int]]]]:
+    """
+    The summary and detailed feedback for each of these answer sessions of a child, in
+    the order they were created. This is what `get_milestonegroup_feedback_summary` and
+    `get_milestonegroup_feedback_detailed` return for each of them, but computed in a
+    single pass over the answer sessions, with the stored feedback of the child read
+    with one query and the newly computed feedback stored with one background task.
+    The summary or detailed feedback that is not asked for is neither computed nor
+    stored, and is returned empty.
+    """
+    statistics_version = get_statistics_version(session)
+    stored_feedback = {
+        stored.answer_session_id: stored
+        for stored in session.exec(
+            select(MilestoneAnswerSessionFeedback)
+            .join(
+                MilestoneAnswerSession,
+                col(MilestoneAnswerSession.id)
+                == col(MilestoneAnswerSessionFeedback.answer_session_id),
+            )
+            .where(col(MilestoneAnswerSession.child_id) == child.id)
+        ).all()
+    }
+    feedback = []
+    rows: list[dict[str, Any]] = []
+    for (
+        answersession,
+        achieved_milestone_ids,
+    ) in iter_sessions_with_previously_achieved_milestone_ids(session, answersessions):
+        child_age = get_child_age_in_months(child, answersession.created_at)
+        row: dict[str, Any] = {
+            "answer_session_id": answersession.id,
+            "statistics_version": statistics_version,
+            "child_age": child_age,
+            "summary": None,
+            "detailed": None,
+        }
+        stored = stored_feedback.get(answersession.id)  # type: ignore
+        if (
+            stored is not None
+            and stored.statistics_version == statistics_version
+            and stored.child_age == child_age
+        ):
+            row["summary"] = stored.summary
+            row["detailed"] = stored.detailed
+        summary: dict[int, int] = {}
+        detailed: dict[int, dict[int, int]] = {}
+        computed = False
+        if with_summary and row["summary"] is not None:
+            summary = _summary_from_json(row["summary"])
+        elif with_summary:
+            summary = compute_milestonegroup_feedback_summary(
+                session, answersession, child_age, achieved_milestone_ids
+            )
+            row["summary"] = summary
+            computed = True
+        if with_detailed and row["detailed"] is not None:
+            detailed = _detailed_from_json(row["detailed"])
+        elif with_detailed:
+            detailed = compute_milestonegroup_feedback_detailed(
+                session, answersession, child_age
+            )
+            row["detailed"] = detailed
+            computed = True
+        feedback.append((answersession, summary, detailed))
+        if computed and answersession.expired:
+            rows.append(row)
+    if rows:
+        background_tasks.add_task(save_feedback, session.get_bind(), rows)
+    return feedback
@@ -5,12 +5,14 @@ from typing import Annotated
 
 import numpy as np
 from fastapi import APIRouter
+from fastapi import BackgroundTasks
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import Query
 from fastapi import UploadFile
 from fastapi.responses import FileResponse
 from sqlalchemy import delete as sqlalchemy_delete
+from sqlalchemy.orm import selectinload
 from sqlmodel import col
 from sqlmodel import delete
 from sqlmodel import select
@@ -23,9 +25,12 @@ from ..models.children import Child
 from ..models.children import ChildCreate
 from ..models.children import ChildPublic
 from ..models.children import ChildSummaryPublic
+from ..models.milestones import ChildAchievedMilestone
+from ..models.milestones import ChildFeedbackPublic
 from ..models.milestones import MilestoneAnswerPublic
 from ..models.milestones import MilestoneAnswerResponse
 from ..models.milestones import MilestoneAnswerSession
+from ..models.milestones import MilestoneAnswerSessionFeedbackPublic
 from ..models.milestones import MilestoneAnswerSessionPublic
 from ..models.milestones import MilestoneGroupPublic
 from ..models.questions import ChildAnswer
@@ -40,21 +45,24 @@ from ..models.utils import DeleteResponse
 from ..users import UserManager
 from ..users import fastapi_users
 from ..users import get_user_manager
-from .scores import compute_milestonegroup_feedback_detailed
-from .scores import compute_milestonegroup_feedback_summary
+from .scores import get_child_feedback
+from .scores import get_milestonegroup_feedback_detailed
+from .scores import get_milestonegroup_feedback_summary
 from .utils import add
 from .utils import child_image_path
 from .utils import count_users_mondey_data
 from .utils import current_milestone_answer_session
 from .utils import delete_users_mondey_data
 from .utils import get
-from .utils import get_admin_settings
+from .utils import get_cached_admin_settings
 from .utils import get_childs_answering_sessions
 from .utils import get_db_child
 from .utils import get_db_milestone_answer_session
 from .utils import get_milestonegroups_for_answersession
+from .utils import get_milestonegroups_for_answersessions
 from .utils import get_or_create_current_milestone_answer_session
 from .utils import session_remaining_seconds
+from .utils import update_child_achieved_milestones
 from .utils import write_image_file
 
 
@@ -198,6 +206,11 @@ def create_router() -> APIRouter:
             col(MilestoneAnswerSession.child_id) == child_id
         )
         session.execute(delete_milestone_statement)
+        session.execute(
+            delete(ChildAchievedMilestone).where(
+                col(ChildAchievedMilestone.child_id) == child_id
+            )
+        )
 
         delete_answers_statement = delete(ChildAnswer).where(
             col(ChildAnswer.child_id) == child_id
@@ -288,6 +301,10 @@ def create_router() -> APIRouter:
             milestone_answer_session.expired = True
             milestone_answer_session.completed = True
             session.add(milestone_answer_session)
+            session.flush()
+            update_child_achieved_milestones(
+                session, [milestone_answer_session.child_id]
+            )
             session.commit()
             session.refresh(milestone_answer_session)
         return MilestoneAnswerResponse(
@@ -410,12 +427,13 @@ def create_router() -> APIRouter:
     def get_summary_feedback_for_answersession(
         session: SessionDep,
         current_active_user: CurrentActiveUserDep,
+        background_tasks: BackgroundTasks,
         answersession_id: int,
     ) -> dict[int, int]:
         answersession = get_db_milestone_answer_session(
             session, current_active_user, answersession_id
         )
-        admin_settings = get_admin_settings(session)
+        admin_settings = get_cached_admin_settings(session)
 
         # Return empty feedback if milestone group feedback or all feedback is disabled
         if (
@@ -424,7 +442,9 @@ def create_router() -> APIRouter:
         ):
             return {}
 
-        feedback = compute_milestonegroup_feedback_summary(session, answersession)
+        feedback = get_milestonegroup_feedback_summary(
+            session, answersession, background_tasks
+        )
         return feedback
 
     @router.get(
@@ -434,18 +454,77 @@ def create_router() -> APIRouter:
     def get_detailed_feedback_for_answersession(
         session: SessionDep,
         current_active_user: CurrentActiveUserDep,
+        background_tasks: BackgroundTasks,
         answersession_id: int,
     ) -> dict[int, dict[int, int]]:
         answersession = get_db_milestone_answer_session(
             session, current_active_user, answersession_id
         )
-        admin_settings = get_admin_settings(session)
+        admin_settings = get_cached_admin_settings(session)
 
         # Return empty feedback if milestone feedback or all feedback is disabled
         if admin_settings.hide_milestone_feedback or admin_settings.hide_all_feedback:
             return {}
 
-        feedback = compute_milestonegroup_feedback_detailed(session, answersession)
+        feedback = get_milestonegroup_feedback_detailed(
+            session, answersession, background_tasks
+        )
         return feedback
 
+    @router.get("/feedback/child={child_id}", response_model=ChildFeedbackPublic)
+    def get_feedback_for_child(
+        session: SessionDep,
+        current_active_user: CurrentActiveUserDep,
+        background_tasks: BackgroundTasks,
+        child_id: int,
+    ):
+        child = get_db_child(session, current_active_user, child_id)
+        answersessions = session.exec(
+            select(MilestoneAnswerSession)
+            .where(
+                (col(MilestoneAnswerSession.child_id) == child_id)
+                & col(MilestoneAnswerSession.completed)
+            )
+            .order_by(
+                col(MilestoneAnswerSession.created_at), col(MilestoneAnswerSession.id)
+            )
+            .options(selectinload(MilestoneAnswerSession.answers))
+        ).all()
+        admin_settings = get_cached_admin_settings(session)
+        hide_summary = (
+            admin_settings.hide_milestone_group_feedback
+            or admin_settings.hide_all_feedback
+        )
+        hide_detailed = (
+            admin_settings.hide_milestone_feedback or admin_settings.hide_all_feedback
+        )
+        feedback: list[
+            tuple[MilestoneAnswerSession, dict[int, int], dict[int, dict[int, int]]]
+        ]
+        if hide_summary and hide_detailed:
+            feedback = [(answersession, {}, {}) for answersession in answersessions]
+        else:
+            feedback = get_child_feedback(
+                session,
+                child,
+                answersessions,
+                background_tasks,
+                with_summary=not hide_summary,
+                with_detailed=not hide_detailed,
+            )
+        return ChildFeedbackPublic(
+            milestone_groups=get_milestonegroups_for_answersessions(
+                session, answersessions
+            ),
+            answer_sessions=[
+                MilestoneAnswerSessionFeedbackPublic(
+                    answer_session_id=answersession.id,
+                    created_at=answersession.created_at,
+                    summary=summary,
+                    detailed=detailed,
+                )
+                for answersession, summary, detailed in feedback
+            ],
+        )
+
     return router
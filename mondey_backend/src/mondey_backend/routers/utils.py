@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import dataclasses
 import datetime
+import hashlib
 import pathlib
+from collections.abc import Callable
 from collections.abc import Iterable
 from collections.abc import Sequence
+from typing import Generic
 from typing import TypeVar
 
 import numpy as np
@@ -14,7 +17,14 @@ from fastapi import UploadFile
 from PIL import Image
 from PIL import ImageOps
 from scipy.optimize import least_squares
+from sqlalchemy import Integer
+from sqlalchemy import cast
+from sqlalchemy import extract
 from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
 from sqlmodel import SQLModel
 from sqlmodel import col
 from sqlmodel import delete
@@ -25,6 +35,8 @@ from ..dependencies import SessionDep
 from ..logging import logger
 from ..models.children import Child
 from ..models.milestones import AdminSettings
+from ..models.milestones import AdminSettingsPublic
+from ..models.milestones import ChildAchievedMilestone
 from ..models.milestones import Milestone
 from ..models.milestones import MilestoneAdmin
 from ..models.milestones import MilestoneAgeCurveParams
@@ -32,10 +44,13 @@ from ..models.milestones import MilestoneAgeScoreCollection
 from ..models.milestones import MilestoneAgeScoreCollectionPublic
 from ..models.milestones import MilestoneAnswer
 from ..models.milestones import MilestoneAnswerSession
+from ..models.milestones import MilestoneAnswerSessionFeedback
+from ..models.milestones import MilestoneCatalogueState
 from ..models.milestones import MilestoneGroup
 from ..models.milestones import MilestoneGroupAdmin
 from ..models.milestones import MilestoneGroupText
 from ..models.milestones import MilestoneText
+from ..models.milestones import StatisticsState
 from ..models.milestones import SuspiciousState
 from ..models.questions import ChildAnswer
 from ..models.questions import ChildQuestion
@@ -99,7 +114,9 @@ def write_pdf_file(file: UploadFile, filename: pathlib.Path | str):
 Entity = TypeVar("Entity")
 
 
-def get(session: SessionDep, entity: type[Entity], ident: int | str) -> Entity:
+def get(
+    session: SessionDep, entity: type[Entity], ident: int | str | dict[str, int]
+) -> Entity:
     instance = session.get(entity, ident)
     if not instance:
         raise HTTPException(
@@ -114,6 +131,33 @@ def add(session: SessionDep, instance: SQLModel):
     session.refresh(instance)
 
 
+def upsert(
+    session: SessionDep,
+    model: type[SQLModel],
+    rows: list[dict],
+    index_elements: list[str],
+) -> None:
+    """
+    Insert these rows into the table of `model`, updating the rows whose `index_elements`
+    already exist instead, with a single INSERT ... ON CONFLICT statement.
+    """
+    if not rows:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        statement = postgresql.insert(model)
+    else:
+        statement = sqlite.insert(model)  # type: ignore
+    updated_columns = [column for column in rows[0] if column not in index_elements]
+    if updated_columns:
+        statement = statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: statement.excluded[column] for column in updated_columns},
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+    session.execute(statement, rows)
+
+
 def update_item_orders(
     session: SessionDep, entity: type[OrderedItem], item_orders: Iterable[ItemOrder]
 ):
@@ -263,67 +307,59 @@ def get_or_create_current_milestone_answer_session(
             included_in_statistics=False,
             suspicious_state=SuspiciousState.unknown,
         )
-        add(session, milestone_answer_session)
+        session.add(milestone_answer_session)
+        session.flush()
         child_age_months = get_child_age_in_months(child)
-        # get all age-relevant milestones for this child
-        milestones = session.exec(
-            select(Milestone)
-            .where(child_age_months >= col(Milestone.relevant_age_min))
-            .where(child_age_months <= col(Milestone.relevant_age_max))
-        ).all()
         prev_answer_session = latest_completed_milestone_answer_session(
             session, current_active_user, child
         )
-        all_prev_answer_session_ids = session.exec(
-            select(MilestoneAnswerSession.id)
-            .where(col(MilestoneAnswerSession.child_id) == child.id)
-            .where(col(MilestoneAnswerSession.completed))
-        ).all()
-        for milestone in milestones:
-            # only include milestones if they have not already been achieved by this child
-            if (
-                prev_answer_session is None
-                or session.exec(
-                    select(MilestoneAnswer)
-                    .where(col(MilestoneAnswer.milestone_id) == milestone.id)
-                    .where(
-                        col(MilestoneAnswer.answer_session_id).in_(
-                            all_prev_answer_session_ids
-                        )
+        achieved_milestone_ids: set[int] = set()
+        unachieved_milestone_ids: list[int | None] = []
+        if prev_answer_session is not None:
+            achieved_milestone_ids = set(
+                session.exec(
+                    select(ChildAchievedMilestone.milestone_id).where(
+                        col(ChildAchievedMilestone.child_id) == child.id
                     )
-                    .where(col(MilestoneAnswer.answer) == 3)
-                ).first()
-                is None
-            ):
-                session.add(
-                    MilestoneAnswer(
-                        answer_session_id=milestone_answer_session.id,
-                        milestone_id=milestone.id,
-                        milestone_group_id=milestone.group_id,
-                        answer=-1,
+                ).all()
+            )
+            unachieved_milestone_ids = list(
+                session.exec(
+                    select(col(MilestoneAnswer.milestone_id))
+                    .where(
+                        col(MilestoneAnswer.answer_session_id) == prev_answer_session.id
                     )
-                )
-        # also include any unachieved milestones from the previous session
-        if prev_answer_session is not None:
-            relevant_milestone_ids = {m.id for m in milestones}
-            for (
-                prev_milestone_id,
-                milestone_answer,
-            ) in prev_answer_session.answers.items():
-                if (
-                    milestone_answer.answer < 3
-                    and prev_milestone_id not in relevant_milestone_ids
-                ):
-                    prev_milestone = session.get(Milestone, prev_milestone_id)
-                    if prev_milestone is not None:
-                        session.add(
-                            MilestoneAnswer(
-                                answer_session_id=milestone_answer_session.id,
-                                milestone_id=prev_milestone_id,
-                                milestone_group_id=prev_milestone.group_id,
-                                answer=-1,
-                            )
-                        )
+                    .where(col(MilestoneAnswer.answer) < 3)
+                ).all()
+            )
+        milestone_age_index = get_milestone_age_index(session)
+        milestone_ids = milestone_age_index.milestone_ids
+        age_relevant = milestone_age_index.is_age_relevant(child_age_months)
+        # include the age-relevant milestones that have not already been achieved by
+        # this child, and any unachieved milestones from the previous session that are
+        # no longer age relevant
+        included = np.where(
+            age_relevant,
+            ~np.isin(
+                milestone_ids, np.array(list(achieved_milestone_ids), dtype=np.int64)
+            ),
+            np.isin(milestone_ids, np.array(unachieved_milestone_ids, dtype=np.int64)),
+        )
+        milestone_answers = [
+            {
+                "answer_session_id": milestone_answer_session.id,
+                "milestone_id": milestone_id,
+                "milestone_group_id": milestone_group_id,
+                "answer": -1,
+            }
+            for milestone_id, milestone_group_id in zip(
+                milestone_ids[included].tolist(),
+                milestone_age_index.milestone_group_ids[included].tolist(),
+                strict=True,
+            )
+        ]
+        if milestone_answers:
+            session.execute(insert(MilestoneAnswer), milestone_answers)
         session.commit()
     return milestone_answer_session
 
@@ -339,17 +375,56 @@ def get_previously_achieved_milestone_ids(
     sessions, but we need to score it as a 3 rather than imputing the value from the curve.
     """
     milestone_ids = session.exec(
-        select(col(MilestoneAnswer.milestone_id))
+        select(col(ChildAchievedMilestone.milestone_id))
+        .where(col(ChildAchievedMilestone.child_id) == child_id)
+        .where(col(ChildAchievedMilestone.achieved_at) < before)
+    ).all()
+    return set(milestone_ids)
+
+
+def update_child_achieved_milestones(
+    session: SessionDep, child_ids: Iterable[int | None] | None = None
+) -> None:
+    """
+    Recalculate the milestones that these children, by default all children, have
+    achieved (`ChildAchievedMilestone`) from their completed answer sessions. This has to
+    be called whenever an answer session is completed.
+    """
+    achieved = (
+        select(
+            col(MilestoneAnswerSession.child_id),
+            col(MilestoneAnswer.milestone_id),
+            func.min(col(MilestoneAnswerSession.created_at)),
+        )
         .join(
-            MilestoneAnswerSession,
-            col(MilestoneAnswer.answer_session_id) == col(MilestoneAnswerSession.id),
+            MilestoneAnswer,
+            col(MilestoneAnswerSession.id) == col(MilestoneAnswer.answer_session_id),
         )
-        .where(col(MilestoneAnswerSession.child_id) == child_id)
         .where(col(MilestoneAnswerSession.completed))
-        .where(col(MilestoneAnswerSession.created_at) < before)
         .where(col(MilestoneAnswer.answer) == 3)
-    ).all()
-    return {milestone_id for milestone_id in milestone_ids if milestone_id is not None}
+        .group_by(
+            col(MilestoneAnswerSession.child_id), col(MilestoneAnswer.milestone_id)
+        )
+    )
+    columns = ["child_id", "milestone_id", "achieved_at"]
+    if child_ids is None:
+        session.execute(delete(ChildAchievedMilestone))
+        session.execute(insert(ChildAchievedMilestone).from_select(columns, achieved))
+        return
+    child_ids = sorted({child_id for child_id in child_ids if child_id is not None})
+    for start in range(0, len(child_ids), MAX_IDS_PER_QUERY):
+        chunk = child_ids[start : start + MAX_IDS_PER_QUERY]
+        session.execute(
+            delete(ChildAchievedMilestone).where(
+                col(ChildAchievedMilestone.child_id).in_(chunk)
+            )
+        )
+        session.execute(
+            insert(ChildAchievedMilestone).from_select(
+                columns,
+                achieved.where(col(MilestoneAnswerSession.child_id).in_(chunk)),
+            )
+        )
 
 
 def iter_sessions_with_previously_achieved_milestone_ids(
@@ -371,21 +446,14 @@ def iter_sessions_with_previously_achieved_milestone_ids(
     child_ids = {answer_session.child_id for answer_session in ordered_sessions}
     achievement_query = (
         select(
-            col(MilestoneAnswerSession.child_id),
-            col(MilestoneAnswerSession.created_at),
-            col(MilestoneAnswer.milestone_id),
-        )
-        .join(
-            MilestoneAnswer,
-            col(MilestoneAnswerSession.id) == col(MilestoneAnswer.answer_session_id),
+            col(ChildAchievedMilestone.child_id),
+            col(ChildAchievedMilestone.achieved_at),
+            col(ChildAchievedMilestone.milestone_id),
         )
-        .where(col(MilestoneAnswerSession.child_id).in_(child_ids))
-        .where(col(MilestoneAnswerSession.completed))
-        .where(col(MilestoneAnswer.answer) == 3)
+        .where(col(ChildAchievedMilestone.child_id).in_(child_ids))
         .order_by(
-            col(MilestoneAnswerSession.child_id),
-            col(MilestoneAnswerSession.created_at),
-            col(MilestoneAnswerSession.id),
+            col(ChildAchievedMilestone.child_id),
+            col(ChildAchievedMilestone.achieved_at),
         )
         .execution_options(yield_per=1000)
     )
@@ -462,16 +530,65 @@ def get_answer_session_child_age_in_months(
     return get_child_age_in_months(child, answer_session.created_at)
 
 
+# The most ids passed to a single IN clause, which keeps a query well below the limit on
+# the number of parameters in a statement (32766 for SQLite)
+MAX_IDS_PER_QUERY = 10000
+
+
+def answer_session_child_age_in_months():
+    """
+    The age in months of the child of an answer session when the answer session was
+    created, as calculated by `get_child_age_in_months`, but as an SQL expression on
+    `MilestoneAnswerSession` joined with its `Child`, so that it is calculated in the
+    database.
+    """
+    created_at = col(MilestoneAnswerSession.created_at)
+    return (cast(extract("year", created_at), Integer) - col(Child.birth_year)) * 12 + (
+        cast(extract("month", created_at), Integer) - col(Child.birth_month)
+    )
+
+
+def get_child_ages_in_months(
+    session: SessionDep, answer_session_ids: Iterable[int]
+) -> dict[int, int]:
+    """
+    The child age in months of each of these answer sessions whose child exists,
+    calculated in the database with one query per `MAX_IDS_PER_QUERY` answer sessions.
+    """
+    answer_session_ids = sorted(answer_session_ids)
+    child_ages: dict[int, int] = {}
+    for start in range(0, len(answer_session_ids), MAX_IDS_PER_QUERY):
+        child_ages.update(
+            session.exec(  # type: ignore
+                select(
+                    col(MilestoneAnswerSession.id), answer_session_child_age_in_months()
+                )
+                .join(Child, col(Child.id) == col(MilestoneAnswerSession.child_id))
+                .where(
+                    col(MilestoneAnswerSession.id).in_(
+                        answer_session_ids[start : start + MAX_IDS_PER_QUERY]
+                    )
+                )
+            ).all()
+        )
+    return child_ages
+
+
 def get_answer_session_child_ages_in_months(
     session: SessionDep, answer_sessions: Sequence[MilestoneAnswerSession]
 ) -> dict[int, int]:
-    return {
-        answer_session.id: get_answer_session_child_age_in_months(
-            session, answer_session
-        )
-        for answer_session in answer_sessions
-        if answer_session.id is not None
-    }
+    child_ages = get_child_ages_in_months(
+        session,
+        [
+            answer_session.id
+            for answer_session in answer_sessions
+            if answer_session.id is not None
+        ],
+    )
+    for answer_session in answer_sessions:
+        if answer_session.id is not None and answer_session.id not in child_ages:
+            raise ValueError("No Child with id: ", answer_session.child_id)
+    return child_ages
 
 
 # The mean answer at the midpoint of the curve, halfway between 0 and 3. The data has to
@@ -510,7 +627,7 @@ def _logistic_mean_answer(
     return 3.0 / (1.0 + np.exp(exponent))
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class MilestoneAgeCurve:
     """
     A logistic fit of the mean answer for a milestone as a function of child age:
@@ -540,8 +657,33 @@ class MilestoneAgeCurve:
         return self.midpoint + _mean_answer_to_logit(mean_answer) / self.steepness
 
 
-def fit_milestone_age_curve(counts: np.ndarray) -> MilestoneAgeCurve:
-    """Fit a logistic curve of mean answer vs child age to the answers for a milestone."""
+def milestone_age_curve_fit_hash(counts: np.ndarray) -> str:
+    """
+    A hash of everything the age curve fitted to these answer counts depends on: the
+    counts themselves and the fit settings. A curve fitted to counts with the same hash
+    does not need to be fitted again.
+    """
+    fit_settings = (
+        app_settings.MILESTONE_MIN_ANSWERS_FOR_CURVE_FIT,
+        app_settings.MAX_CHILD_AGE_MONTHS,
+        MIN_STEEPNESS,
+        MAX_STEEPNESS,
+        counts.shape,
+    )
+    digest = hashlib.sha256(repr(fit_settings).encode())
+    digest.update(np.ascontiguousarray(counts, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def fit_milestone_age_curve(
+    counts: np.ndarray, initial_guess: tuple[float, float] | None = None
+) -> MilestoneAgeCurve:
+    """
+    Fit a logistic curve of mean answer vs child age to the answers for a milestone.
+
+    `initial_guess` is the (midpoint, steepness) to start the fit from, typically the
+    previous fit for this milestone, otherwise the start is estimated from the counts.
+    """
     ages = np.arange(counts.shape[0], dtype=float)
     n_per_age = counts.sum(axis=1)
     n_answers = int(n_per_age.sum())
@@ -586,13 +728,18 @@ def fit_milestone_age_curve(counts: np.ndarray) -> MilestoneAgeCurve:
             _logistic_mean_answer(age, midpoint, steepness) - mean_answer
         )
 
-    # initial guess: the youngest age whose mean answer is at or above the midpoint,
-    # which the check above guarantees exists
-    midpoint_guess = float(age[mean_answer >= MEAN_ANSWER_MIDPOINT][0])
+    if initial_guess is None:
+        # initial guess: the youngest age whose mean answer is at or above the midpoint,
+        # which the check above guarantees exists
+        initial_guess = (float(age[mean_answer >= MEAN_ANSWER_MIDPOINT][0]), 0.3)
+    midpoint_guess, steepness_guess = initial_guess
     try:
         fit = least_squares(
             residuals,
-            x0=[np.clip(midpoint_guess, 0.0, max_age), 0.3],
+            x0=[
+                np.clip(midpoint_guess, 0.0, max_age),
+                np.clip(steepness_guess, MIN_STEEPNESS, MAX_STEEPNESS),
+            ],
             bounds=([0.0, MIN_STEEPNESS], [max_age, MAX_STEEPNESS]),
             loss="soft_l1",
             f_scale=0.5,
@@ -633,10 +780,114 @@ def milestone_age_curve_from_collection(
     )
 
 
-def get_milestone_curves(session: SessionDep) -> dict[int, MilestoneAgeCurve | None]:
+def get_statistics_version(session: SessionDep) -> int:
+    """
+    The version of the stored statistics to read. A statistics update writes its
+    statistics as a new version and only switches to it when it commits, so reading
+    this version never sees a partly written update.
+    """
+    version = session.exec(
+        select(StatisticsState.version).where(StatisticsState.id == 1)
+    ).first()
+    return version if version is not None else 0
+
+
+def get_milestone_catalogue_version(session: SessionDep) -> int:
+    """The version of the milestones, see `milestone_catalogue_changed`."""
+    version = session.exec(
+        select(MilestoneCatalogueState.version).where(MilestoneCatalogueState.id == 1)
+    ).first()
+    return version if version is not None else 0
+
+
+def milestone_catalogue_changed(
+    session: SessionDep, feedback_changed: bool = True
+) -> None:
+    """
+    Mark the milestones as changed after one was added, changed or deleted, for every
+    process that caches them. If `feedback_changed`, i.e. a milestone was added or
+    deleted, or its milestone group or expected age changed, the feedback stored for
+    answer sessions is deleted as well, since it has to be computed again.
+    """
+    # the single row is created by the first change, which two changes can race to make
+    upsert(session, MilestoneCatalogueState, [{"id": 1}], ["id"])
+    session.execute(
+        update(MilestoneCatalogueState)
+        .where(col(MilestoneCatalogueState.id) == 1)
+        .values(version=col(MilestoneCatalogueState.version) + 1)
+    )
+    if feedback_changed:
+        session.execute(delete(MilestoneAnswerSessionFeedback))
+
+
+Cached = TypeVar("Cached")
+_caches: list[VersionedCache] = []
+
+
+class VersionedCache(Generic[Cached]):
+    """
+    A value cached in this process along with the version of the database state it was
+    loaded from. Whatever changes that state also increments its version in the
+    database, so every process loads the value again the next time it reads the version.
+    """
+
+    def __init__(self) -> None:
+        # a single tuple, so that a thread never sees the value of another version
+        self._entry: tuple[int, Cached] | None = None
+        _caches.append(self)
+
+    def get(self, version: int, load: Callable[[], Cached]) -> Cached:
+        entry = self._entry
+        if entry is None or entry[0] != version:
+            entry = (version, load())
+            self._entry = entry
+        return entry[1]
+
+    def clear(self) -> None:
+        self._entry = None
+
+
+# the curves of a statistics version never change once it has been written, so they
+# only have to be loaded again when a statistics update switches to a new version
+_milestone_curves_cache: VersionedCache[dict[int, MilestoneAgeCurve | None]] = (
+    VersionedCache()
+)
+_admin_settings_cache: VersionedCache[AdminSettingsPublic] = VersionedCache()
+
+
+def clear_caches() -> None:
+    for cache in _caches:
+        cache.clear()
+
+
+def get_milestone_curves(
+    session: SessionDep, version: int | None = None
+) -> dict[int, MilestoneAgeCurve | None]:
+    """
+    The milestone age curves of this statistics version, by default the current one.
+    These are cached for the current version and shared between requests, so they must
+    not be modified. They can include the curves of milestones deleted since.
+    """
+    current_version = get_statistics_version(session)
+    if version is None:
+        version = current_version
+    if version != current_version:
+        return load_milestone_curves(session, version)
+    return _milestone_curves_cache.get(
+        version, lambda: load_milestone_curves(session, version)
+    )
+
+
+def load_milestone_curves(
+    session: SessionDep, version: int
+) -> dict[int, MilestoneAgeCurve | None]:
     return {
         collection.milestone_id: milestone_age_curve_from_collection(collection)
-        for collection in session.exec(select(MilestoneAgeScoreCollection)).all()
+        for collection in session.exec(
+            select(MilestoneAgeScoreCollection).where(
+                MilestoneAgeScoreCollection.version == version
+            )
+        ).all()
     }
 
 
@@ -652,6 +903,89 @@ def get_admin_settings(session: SessionDep) -> AdminSettings:
     return settings
 
 
+def get_cached_admin_settings(session: SessionDep) -> AdminSettingsPublic:
+    """
+    The admin settings, cached in this process until their version changes (see
+    `increment_admin_settings_version`), for reading only.
+    """
+    version = session.exec(
+        select(AdminSettings.version).where(AdminSettings.id == 1)
+    ).first()
+    if version is None:
+        return AdminSettingsPublic.model_validate(get_admin_settings(session))
+    return _admin_settings_cache.get(
+        version,
+        lambda: AdminSettingsPublic.model_validate(get_admin_settings(session)),
+    )
+
+
+def increment_admin_settings_version(session: SessionDep) -> None:
+    """
+    Mark the admin settings as changed, for every process that caches them.
+    Incremented in the database, so that concurrent changes each get a new version.
+    """
+    session.execute(
+        update(AdminSettings)
+        .where(col(AdminSettings.id) == 1)
+        .values(version=col(AdminSettings.version) + 1)
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class MilestoneAgeIndex:
+    """
+    The age range over which each milestone is relevant, as arrays with an element for
+    each milestone, so that the milestones to ask about at a given child age are found
+    without a query.
+    """
+
+    milestone_ids: np.ndarray
+    milestone_group_ids: np.ndarray
+    relevant_age_min: np.ndarray
+    relevant_age_max: np.ndarray
+
+    def is_age_relevant(self, child_age_months: int) -> np.ndarray:
+        """Whether each milestone is relevant for a child of this age."""
+        return (self.relevant_age_min <= child_age_months) & (
+            child_age_months <= self.relevant_age_max
+        )
+
+
+def load_milestone_age_index(session: SessionDep) -> MilestoneAgeIndex:
+    rows = session.exec(
+        select(
+            Milestone.id,
+            Milestone.group_id,
+            Milestone.relevant_age_min,
+            Milestone.relevant_age_max,
+        )
+        .where(col(Milestone.group_id).is_not(None))
+        .order_by(col(Milestone.id))
+    ).all()
+    columns = np.array([tuple(row) for row in rows], dtype=np.int64).reshape(-1, 4).T
+    return MilestoneAgeIndex(
+        milestone_ids=columns[0],
+        milestone_group_ids=columns[1],
+        relevant_age_min=columns[2],
+        relevant_age_max=columns[3],
+    )
+
+
+_milestone_age_index_cache: VersionedCache[MilestoneAgeIndex] = VersionedCache()
+
+
+def get_milestone_age_index(session: SessionDep) -> MilestoneAgeIndex:
+    """
+    The relevant age ranges of the milestones, loaded once and then cached in this
+    process until an admin adds, changes or deletes a milestone (see
+    `milestone_catalogue_changed`).
+    """
+    return _milestone_age_index_cache.get(
+        get_milestone_catalogue_version(session),
+        lambda: load_milestone_age_index(session),
+    )
+
+
 def get_milestone_age_curve_params(session: SessionDep) -> MilestoneAgeCurveParams:
     return get_admin_settings(session).milestone_age_curve_params()
 
@@ -738,9 +1072,20 @@ def i18n_language_path(language_id: str) -> pathlib.Path:
 def get_milestonegroups_for_answersession(
     session: SessionDep, answersession: MilestoneAnswerSession
 ) -> dict[int, MilestoneGroup]:
+    return get_milestonegroups_for_answersessions(session, [answersession])
+
+
+def get_milestonegroups_for_answersessions(
+    session: SessionDep, answersessions: Iterable[MilestoneAnswerSession]
+) -> dict[int, MilestoneGroup]:
+    milestone_ids = {
+        milestone_id
+        for answersession in answersessions
+        for milestone_id in answersession.answers
+    }
     check_for_overlap = (
         select(Milestone.group_id)
-        .where(col(Milestone.id).in_(answersession.answers.keys()))
+        .where(col(Milestone.id).in_(milestone_ids))
         .distinct()
     )
     return {
@@ -811,6 +1156,11 @@ def delete_users_mondey_data(session: SessionDep, user_id: int) -> None:
             | (col(MilestoneAnswerSession.child_id).in_(child_ids))
         )
     )
+    session.execute(
+        delete(ChildAchievedMilestone).where(
+            col(ChildAchievedMilestone.child_id).in_(child_ids)
+        )
+    )
     session.execute(delete(ChildAnswer).where(col(ChildAnswer.child_id).in_(child_ids)))
     session.execute(delete(UserAnswer).where(col(UserAnswer.user_id) == user_id))
     session.execute(delete(Child).where(col(Child.user_id) == user_id))
@@ -27,6 +27,14 @@ class AppSettings(BaseSettings):
     LOG_LEVEL: str = "debug"
     COOKIE_SECURE: bool = False
     STATS_CRONTAB: str = "0 3 * * mon"
+    # number of worker processes used to fit the milestone age curves, 0 for one per core
+    STATS_CURVE_FIT_WORKERS: int = 0
+    # number of worker processes that the answer sessions are split between, by child, to
+    # count their answers and score them, 0 for one per core
+    STATS_SHARD_WORKERS: int = 0
+    # trace the peak memory of each phase of a statistics update with tracemalloc, which
+    # makes the update several times slower
+    STATS_TRACE_MEMORY: bool = False
     DEEPL_API_KEY: str = ""
     MONDEY_HOST: str = "mondey.de"
     E2E_TEST_USER_SQL_FILES: str = ""
@@ -1,13 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+import dataclasses
+import datetime
+import hashlib
+import multiprocessing
+import os
 import time
+import tracemalloc
 from collections import defaultdict
+from collections.abc import Callable
+from collections.abc import Iterable
 from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+from typing import Any
 
 import numpy as np
 import pandas as pd
+from sqlalchemy import Engine
+from sqlalchemy import event
+from sqlalchemy import insert
 from sqlalchemy import update
+from sqlmodel import Session
 from sqlmodel import col
+from sqlmodel import create_engine
+from sqlmodel import delete
 from sqlmodel import func
 from sqlmodel import select
 
@@ -23,9 +41,14 @@ from mondey_backend.models.milestones import MilestoneAnswer
 from mondey_backend.models.milestones import MilestoneAnswerAnalysis
 from mondey_backend.models.milestones import MilestoneAnswerSession
 from mondey_backend.models.milestones import MilestoneAnswerSessionAnalysis
+from mondey_backend.models.milestones import MilestoneAnswerSessionStatistics
+from mondey_backend.models.milestones import MilestoneExpectedAnswers
 from mondey_backend.models.milestones import MilestoneGroup
 from mondey_backend.models.milestones import MilestoneGroupAgeScore
 from mondey_backend.models.milestones import MilestoneGroupAgeScoreCollection
+from mondey_backend.models.milestones import MilestoneGroupAnswerSessionScore
+from mondey_backend.models.milestones import StatisticsState
+from mondey_backend.models.milestones import StatisticsUpdatePhaseResult
 from mondey_backend.models.milestones import StatisticsUpdateResult
 from mondey_backend.models.milestones import SuspiciousState
 from mondey_backend.models.questions import ChildAnswer
@@ -33,14 +56,22 @@ from mondey_backend.models.questions import ChildQuestion
 from mondey_backend.models.questions import UserAnswer
 from mondey_backend.models.questions import UserQuestion
 from mondey_backend.models.users import User
+from mondey_backend.routers.utils import MAX_IDS_PER_QUERY
 from mondey_backend.routers.utils import MilestoneAgeCurve
+from mondey_backend.routers.utils import VersionedCache
+from mondey_backend.routers.utils import answer_session_child_age_in_months
 from mondey_backend.routers.utils import fit_milestone_age_curve
 from mondey_backend.routers.utils import get_answer_session_child_ages_in_months
 from mondey_backend.routers.utils import get_child_age_in_months
+from mondey_backend.routers.utils import get_child_ages_in_months
 from mondey_backend.routers.utils import get_milestone_curves
+from mondey_backend.routers.utils import get_statistics_version
 from mondey_backend.routers.utils import (
     iter_sessions_with_previously_achieved_milestone_ids,
 )
+from mondey_backend.routers.utils import milestone_age_curve_fit_hash
+from mondey_backend.routers.utils import update_child_achieved_milestones
+from mondey_backend.routers.utils import upsert
 from mondey_backend.settings import app_settings
 
 
@@ -59,23 +90,22 @@ def analyse_answer_session(
     milestone_answer_session: MilestoneAnswerSession,
     include_child_answer_flags: bool = False,
     include_display_metadata: bool = False,
-    milestone_curves: dict[int, MilestoneAgeCurve | None] | None = None,
+    expected_answers: ExpectedMilestoneAnswers | None = None,
 ) -> MilestoneAnswerSessionAnalysis:
     """
-    Compare the answers in a session against the answers expected for the child's age.
+    Compare the answers in a session against the answers expected for the child's age
+    (see `expected_milestone_answers`).
 
-    The expected answer for a milestone is taken from its fitted age curve, which is
-    defined at every age. Where a milestone has no usable curve we fall back to the mean
-    answer observed at exactly this age, and if no child of this age has answered this
-    milestone there is no expectation to compare against, so it is left out: counting it
-    as an expected answer of 0 would make any child who has achieved the milestone look
-    suspicious purely because they are the first of their age to be asked about it.
+    If no child of this age has answered a milestone without a usable age curve there is
+    no expectation to compare against, so it is left out: counting it as an expected
+    answer of 0 would make any child who has achieved the milestone look suspicious
+    purely because they are the first of their age to be asked about it.
 
     :param session: the database session
     :param milestone_answer_session: the answer session to analyse
     :param include_child_answer_flags: whether to include the child answer flags
     :param include_display_metadata: whether to include the milestone display metadata
-    :param milestone_curves: the milestone age curves, loaded if not supplied
+    :param expected_answers: the expected answers, loaded if not supplied
     :return: the analysis, including the rms difference from the expected answers
     """
     analysis = MilestoneAnswerSessionAnalysis(
@@ -112,12 +142,13 @@ def analyse_answer_session(
             f"Child {child.id} has age {child_age} which is older than {app_settings.MAX_CHILD_AGE_MONTHS} months, skipping analysis"
         )
         return analysis
-    if milestone_curves is None:
-        milestone_curves = get_milestone_curves(session)
+    if expected_answers is None:
+        expected_answers = get_expected_milestone_answers(session)
     analysis.child_age = child_age
     logger.debug(
         f"  - checking answer session {milestone_answer_session.id}, child age {child_age}"
     )
+    statistics_version = get_statistics_version(session)
     diff = 0
     count = 0
     for milestone_id, answer in milestone_answer_session.answers.items():
@@ -126,20 +157,21 @@ def analyse_answer_session(
                 f"    - no answer available for milestone {milestone_id} - skipping"
             )
             continue
-        score = session.get(
-            MilestoneAgeScore, {"age": child_age, "milestone_id": milestone_id}
-        )
-        curve = milestone_curves.get(milestone_id)
-        if curve is not None:
-            expected_answer = float(curve.mean_answer(child_age))
-        elif score is not None and score.count > 0:
-            expected_answer = score.mean
-        else:
+        expected_answer = expected_answers.answer(milestone_id, child_age)
+        if np.isnan(expected_answer):
             logger.debug(
                 f"    - no expected answer available for milestone {milestone_id} - skipping"
             )
             continue
         if include_display_metadata:
+            score = session.get(
+                MilestoneAgeScore,
+                {
+                    "version": statistics_version,
+                    "age": child_age,
+                    "milestone_id": milestone_id,
+                },
+            )
             milestone = session.get(Milestone, milestone_id)
             if milestone is None:
                 logger.warning(
@@ -181,27 +213,264 @@ def analyse_answer_session(
     return analysis
 
 
-def flag_incomplete_answer_sessions(session: SessionDep):
+@dataclasses.dataclass
+class IdIndex:
     """
-    Check for any answer sessions that are marked `completed` but have `-1` as an answer for any milestone,
-    and set `complete` to `False` for those sessions.
+    The rows of a statistics array for a set of ids, e.g. of the milestones: the values
+    for `ids[row]` are in that row. The array then only has a row for each id that
+    exists, rather than one for every id up to the largest, which after years of deleted
+    milestones would mostly be empty.
     """
-    answer_session_ids = set(
-        session.exec(
-            select(MilestoneAnswer.answer_session_id).where(
-                col(MilestoneAnswer.answer) < 0
+
+    ids: np.ndarray
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> IdIndex:
+        return cls(ids=np.unique(np.fromiter(ids, dtype=np.int64)))
+
+    def __len__(self) -> int:
+        return self.ids.size
+
+    def rows(self, ids: np.ndarray | Sequence[int]) -> np.ndarray:
+        """The row of each of these ids, or -1 for an id that has none."""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        found = rows < self.ids.size
+        found[found] = self.ids[rows[found]] == ids[found]
+        return np.where(found, rows, -1)
+
+    def row(self, id: int) -> int:
+        """The row of this id, which must have one."""
+        return int(self.rows([id])[0])
+
+
+@dataclasses.dataclass
+class ExpectedMilestoneAnswers:
+    """
+    The expected answer for each milestone in `milestone_index` (row) and child age
+    (column), see `expected_milestone_answers`, so that looking one up is an array
+    lookup. It is NaN where there is none.
+    """
+
+    milestone_index: IdIndex
+    answers: np.ndarray
+    # whether each milestone has a usable age curve, i.e. is averaged in its milestone
+    # group's statistics
+    has_curve: np.ndarray
+
+    def lookup(
+        self,
+        milestone_ids: np.ndarray | Sequence[int],
+        ages: np.ndarray | Sequence[int],
+    ) -> np.ndarray:
+        """
+        The expected answer for each of these milestones at the corresponding age, or
+        NaN for a milestone that has none. A child born after the answer session is
+        expected to answer like the youngest children.
+        """
+        rows = self.milestone_index.rows(milestone_ids)
+        columns = np.clip(
+            np.asarray(ages, dtype=np.int64), 0, self.answers.shape[1] - 1
+        )
+        return np.where(rows >= 0, self.answers[rows, columns], np.nan)
+
+    def answer(self, milestone_id: int, age: int) -> float:
+        return float(self.lookup([milestone_id], [age])[0])
+
+
+def expected_milestone_answers(
+    milestone_index: IdIndex,
+    m_counts: np.ndarray,
+    milestone_curves: dict[int, MilestoneAgeCurve]
+    | dict[int, MilestoneAgeCurve | None],
+) -> ExpectedMilestoneAnswers:
+    """
+    The expected answer for each milestone in `milestone_index` and child age, given
+    the answer counts of the milestones for each age and their age curves.
+
+    This is the milestone's age curve where it has a usable one, which is defined at
+    every age. Otherwise it is the mean answer observed at exactly this age, and NaN if
+    no child of this age has answered the milestone.
+    """
+    counts = m_counts.astype(np.float64)
+    total = counts.sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        answers = (counts[:, :, 1] + 2 * counts[:, :, 2] + 3 * counts[:, :, 3]) / total
+    answers[total == 0] = np.nan
+    has_curve = np.zeros(len(milestone_index), dtype=bool)
+    ages = np.arange(m_counts.shape[1])
+    for milestone_id, curve in milestone_curves.items():
+        row = milestone_index.rows([milestone_id])[0]
+        if curve is not None and curve.fit_ok and row >= 0:
+            answers[row] = curve.mean_answer(ages)
+            has_curve[row] = True
+    return ExpectedMilestoneAnswers(
+        milestone_index=milestone_index, answers=answers, has_curve=has_curve
+    )
+
+
+def save_expected_milestone_answers(
+    session: SessionDep, version: int, expected_answers: ExpectedMilestoneAnswers
+) -> None:
+    session.add(
+        MilestoneExpectedAnswers(
+            version=version,
+            milestone_ids=expected_answers.milestone_index.ids.astype(
+                np.int64
+            ).tobytes(),
+            answers=expected_answers.answers.astype(np.float32).tobytes(),
+        )
+    )
+
+
+def load_expected_milestone_answers(
+    session: SessionDep, version: int
+) -> ExpectedMilestoneAnswers:
+    """
+    The expected answers stored with this statistics version, or for statistics stored
+    before these were, calculated from its stored answer counts and curves.
+    """
+    stored = session.get(MilestoneExpectedAnswers, version)
+    if stored is None:
+        milestone_index = IdIndex.from_ids(session.exec(select(Milestone.id)).all())  # type: ignore
+        m_counts = np.zeros(
+            (len(milestone_index), app_settings.MAX_CHILD_AGE_MONTHS + 1, 4),
+            dtype=np.uint32,
+        )
+        load_milestone_counts(session, m_counts, milestone_index, version)
+        return expected_milestone_answers(
+            milestone_index, m_counts, get_milestone_curves(session, version)
+        )
+    milestone_ids = np.frombuffer(stored.milestone_ids, dtype=np.int64)
+    curve_milestone_ids = [
+        milestone_id
+        for milestone_id, curve in get_milestone_curves(session, version).items()
+        if curve is not None and curve.fit_ok
+    ]
+    return ExpectedMilestoneAnswers(
+        milestone_index=IdIndex(ids=milestone_ids),
+        answers=np.frombuffer(stored.answers, dtype=np.float32).reshape(
+            milestone_ids.size, -1
+        ),
+        has_curve=np.isin(milestone_ids, np.array(curve_milestone_ids, dtype=np.int64)),
+    )
+
+
+# the expected answers of a statistics version never change once it has been written
+_expected_milestone_answers_cache: VersionedCache[ExpectedMilestoneAnswers] = (
+    VersionedCache()
+)
+
+
+def get_expected_milestone_answers(
+    session: SessionDep, version: int | None = None
+) -> ExpectedMilestoneAnswers:
+    """
+    The expected answers of this statistics version, by default the current one. Those
+    of the current version are loaded once and then cached in this process until a
+    statistics update switches to a new version.
+    """
+    current_version = get_statistics_version(session)
+    if version is None:
+        version = current_version
+    if version != current_version:
+        return load_expected_milestone_answers(session, version)
+    return _expected_milestone_answers_cache.get(
+        version, lambda: load_expected_milestone_answers(session, version)
+    )
+
+
+def analyse_answer_sessions(
+    session: SessionDep,
+    answer_session_ids: Sequence[int],
+    expected_answers: ExpectedMilestoneAnswers | None = None,
+) -> dict[int, float]:
+    """
+    The rms difference between the answers and the expected answers of each of these
+    answer sessions, as `analyse_answer_session` calculates it for a single one.
+
+    Instead of looking up the child and the expected answer of every milestone of each
+    answer session, the child ages and answers of all of them are loaded in bulk, and
+    compared in one pass against a table of the expected answer for every milestone
+    and age (`expected_milestone_answers`).
+    """
+    if expected_answers is None:
+        expected_answers = get_expected_milestone_answers(session)
+    answer_session_ids = sorted(answer_session_ids)
+    child_ages = get_child_ages_in_months(session, answer_session_ids)
+    rms = dict.fromkeys(answer_session_ids, 0.0)
+    for answer_session_id in answer_session_ids:
+        if answer_session_id not in child_ages:
+            logger.error(f"Answer session {answer_session_id} has no child")
+        elif child_ages[answer_session_id] > app_settings.MAX_CHILD_AGE_MONTHS:
+            logger.warning(
+                f"Answer session {answer_session_id} has child age {child_ages[answer_session_id]} which is older than {app_settings.MAX_CHILD_AGE_MONTHS} months, skipping analysis"
             )
-        ).all()
+    # a child born after the answer session is outside the expected answer table
+    for answer_session in get_answer_sessions(
+        session,
+        [
+            answer_session_id
+            for answer_session_id, child_age in child_ages.items()
+            if child_age < 0
+        ],
+    ):
+        rms[answer_session.id] = float(  # type: ignore
+            analyse_answer_session(
+                session, answer_session, expected_answers=expected_answers
+            ).rms
+        )
+    child_ages = {
+        answer_session_id: child_age
+        for answer_session_id, child_age in child_ages.items()
+        if 0 <= child_age <= app_settings.MAX_CHILD_AGE_MONTHS
+    }
+    if not child_ages:
+        return rms
+    answer_sessions, milestone_ids, answers = get_milestone_answer_arrays(
+        session, child_ages.keys()
     )
-    for milestone_answer_session in session.exec(
-        select(MilestoneAnswerSession)
+    ages = lookup_child_ages(child_ages, answer_sessions)
+    expected = expected_answers.lookup(milestone_ids, ages)
+    has_expected = ~np.isnan(expected)
+    ids, index = np.unique(answer_sessions[has_expected], return_inverse=True)
+    count = np.bincount(index, minlength=ids.size)
+    diff = np.bincount(
+        index,
+        weights=np.square(expected[has_expected] - answers[has_expected]),
+        minlength=ids.size,
+    )
+    rms.update(zip(ids.tolist(), np.sqrt(diff / count).tolist(), strict=True))
+    return rms
+
+
+def flag_incomplete_answer_sessions(session: SessionDep):
+    """
+    Check for any answer sessions that are marked `completed` but have `-1` as an answer for any milestone,
+    and set `complete` to `False` for those sessions, with a single UPDATE statement.
+    The milestones achieved by the children of these sessions are then recalculated without them.
+    """
+    child_ids = set()
+    for answer_session_id, child_id in session.exec(  # type: ignore
+        update(MilestoneAnswerSession)
         .where(col(MilestoneAnswerSession.completed))
-        .where(col(MilestoneAnswerSession.id).in_(answer_session_ids))
+        .where(
+            select(MilestoneAnswer)
+            .where(
+                col(MilestoneAnswer.answer_session_id) == col(MilestoneAnswerSession.id)
+            )
+            .where(col(MilestoneAnswer.answer) < 0)
+            .exists()
+        )
+        .values(completed=False)
+        .returning(col(MilestoneAnswerSession.id), col(MilestoneAnswerSession.child_id))
     ).all():
         logger.warning(
-            f"Answer session {milestone_answer_session.id} was marked completed but has missing answers, marking as incomplete"
+            f"Answer session {answer_session_id} was marked completed but has missing answers, marking as incomplete"
         )
-        milestone_answer_session.completed = False
+        child_ids.add(child_id)
+    if child_ids:
+        update_child_achieved_milestones(session, child_ids)
     session.commit()
 
 
@@ -215,11 +484,11 @@ def flag_suspicious_answer_sessions(
     Only updates sessions that with unknown SuspiciousState (i.e. that haven't been analysed or manually tagged by an admin).
     The answers are compared against the milestone age curves fitted by the previous
     statistics update, since which sessions are suspicious determines which of them the
-    curves in this update are fitted from.
+    curves in this update are fitted from. The new states are written with one UPDATE
+    statement per state.
     """
-    milestone_curves = get_milestone_curves(session)
-    milestone_answer_sessions = session.exec(
-        select(MilestoneAnswerSession)
+    answer_session_ids = session.exec(
+        select(col(MilestoneAnswerSession.id))
         .where(col(MilestoneAnswerSession.completed))
         .where(col(MilestoneAnswerSession.suspicious_state) == SuspiciousState.unknown)
         .where(
@@ -227,137 +496,1091 @@ def flag_suspicious_answer_sessions(
         )
     ).all()
     logger.debug(
-        f"  - found {len(milestone_answer_sessions)} answer sessions to check for suspiciousness"
+        f"  - found {len(answer_session_ids)} answer sessions to check for suspiciousness"
     )
-    for milestone_answer_session in milestone_answer_sessions:
-        try:
-            analysis = analyse_answer_session(
-                session, milestone_answer_session, milestone_curves=milestone_curves
+    states: dict[SuspiciousState, list[int]] = defaultdict(list)
+    for answer_session_id, rms in analyse_answer_sessions(
+        session,
+        answer_session_ids,  # type: ignore
+    ).items():
+        state = (
+            SuspiciousState.suspicious
+            if rms > threshold
+            else SuspiciousState.not_suspicious
+        )
+        logger.debug(
+            f"Marking answer session {answer_session_id} with rms difference {rms} as {'not' if state == SuspiciousState.not_suspicious else ''} suspicious"
+        )
+        states[state].append(answer_session_id)
+    for state, ids in states.items():
+        update_answer_sessions(session, ids, suspicious_state=state)
+
+
+def answer_sessions_for_statistics(test_account_user_ids_to_exclude: list[int]):
+    """
+    The filter selecting the answer sessions that the statistics are calculated from:
+    completed, not from a test account, and explicitly marked as not suspicious (either
+    by the system or by an admin).
+    """
+    return (
+        select(MilestoneAnswerSession)
+        .where(col(MilestoneAnswerSession.completed))
+        .where(
+            col(MilestoneAnswerSession.user_id).not_in(test_account_user_ids_to_exclude)
+        )
+        .where(
+            (
+                col(MilestoneAnswerSession.suspicious_state)
+                == SuspiciousState.not_suspicious
             )
-            state = (
-                SuspiciousState.suspicious
-                if analysis.rms > threshold
-                else SuspiciousState.not_suspicious
+            | (
+                col(MilestoneAnswerSession.suspicious_state)
+                == SuspiciousState.admin_not_suspicious
             )
-            logger.debug(
-                f"Marking answer session {milestone_answer_session.id} with rms difference {analysis.rms} as {'not' if state == SuspiciousState.not_suspicious else ''} suspicious"
+        )
+    )
+
+
+def milestone_group_statistics_hash(
+    milestones_in_group_statistics: Sequence[Milestone],
+) -> str:
+    """
+    A hash of which milestones are averaged in which milestone group. The milestone
+    group scores of answer sessions calculated with a different set of milestones are not
+    comparable, so if this changes they all have to be recalculated.
+    """
+    group_milestones = sorted(
+        (milestone.group_id or 0, milestone.id or 0)
+        for milestone in milestones_in_group_statistics
+    )
+    return hashlib.sha256(
+        f"{app_settings.MAX_CHILD_AGE_MONTHS}:{group_milestones}".encode()
+    ).hexdigest()
+
+
+def load_milestone_counts(
+    session: SessionDep,
+    m_counts: np.ndarray,
+    milestone_index: IdIndex,
+    version: int | None = None,
+) -> None:
+    """
+    Fill `m_counts` with the answer counts stored by the last statistics update, or
+    with those of this statistics version.
+    """
+    if version is None:
+        version = get_statistics_version(session)
+    stored_counts = np.array(
+        [
+            tuple(row)
+            for row in session.exec(
+                select(  # type: ignore
+                    col(MilestoneAgeScore.milestone_id),
+                    col(MilestoneAgeScore.age),
+                    col(MilestoneAgeScore.c0),
+                    col(MilestoneAgeScore.c1),
+                    col(MilestoneAgeScore.c2),
+                    col(MilestoneAgeScore.c3),
+                )
+                .join(
+                    Milestone, col(Milestone.id) == col(MilestoneAgeScore.milestone_id)
+                )
+                .where(col(MilestoneAgeScore.version) == version)
+                .where(col(MilestoneAgeScore.age) <= app_settings.MAX_CHILD_AGE_MONTHS)
+            )
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 6)
+    rows = milestone_index.rows(stored_counts[:, 0])
+    # a milestone created since the index was made has no row, and no counts yet
+    stored = rows >= 0
+    m_counts[rows[stored], stored_counts[stored, 1]] = stored_counts[stored, 2:]
+
+
+def load_milestone_group_statistics(
+    session: SessionDep,
+    mg_counts: np.ndarray,
+    mg_sum_scores: np.ndarray,
+    mg_sum_squaredscores: np.ndarray,
+    milestone_group_index: IdIndex,
+) -> None:
+    """Fill the milestone group arrays with the values stored by the last statistics update."""
+    for milestone_group_id, age, count, sum_score, sum_squaredscore in session.exec(
+        select(  # type: ignore
+            col(MilestoneGroupAgeScore.milestone_group_id),
+            col(MilestoneGroupAgeScore.age),
+            col(MilestoneGroupAgeScore.count),
+            col(MilestoneGroupAgeScore.sum_score),
+            col(MilestoneGroupAgeScore.sum_squaredscore),
+        )
+        .join(
+            MilestoneGroup,
+            col(MilestoneGroup.id) == col(MilestoneGroupAgeScore.milestone_group_id),
+        )
+        .where(col(MilestoneGroupAgeScore.version) == get_statistics_version(session))
+        .where(col(MilestoneGroupAgeScore.age) <= app_settings.MAX_CHILD_AGE_MONTHS)
+    ).all():
+        row = milestone_group_index.rows([milestone_group_id])[0]
+        if row < 0:
+            continue
+        mg_counts[row][age] = count
+        mg_sum_scores[row][age] = sum_score
+        mg_sum_squaredscores[row][age] = sum_squaredscore
+
+
+def get_milestone_answer_arrays(
+    session: SessionDep, answer_session_ids: Iterable[int]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The answer session ids, milestone ids and answers of all the answers that were given
+    in these answer sessions, as three integer arrays.
+
+    These are selected as plain columns rather than loading the answer sessions and their
+    answers, so this is a single query (per `MAX_IDS_PER_QUERY` answer sessions)
+    however many answer sessions there are.
+    """
+    answer_session_ids = sorted(answer_session_ids)
+    rows: list[tuple[int, int, int]] = []
+    for start in range(0, len(answer_session_ids), MAX_IDS_PER_QUERY):
+        rows.extend(
+            session.exec(  # type: ignore
+                select(
+                    col(MilestoneAnswer.answer_session_id),
+                    col(MilestoneAnswer.milestone_id),
+                    col(MilestoneAnswer.answer),
+                )
+                .where(
+                    col(MilestoneAnswer.answer_session_id).in_(
+                        answer_session_ids[start : start + MAX_IDS_PER_QUERY]
+                    )
+                )
+                .where(col(MilestoneAnswer.answer) >= 0)
+            ).all()
+        )
+    # numpy reads plain tuples much faster than the rows of a result
+    answers = np.array([tuple(row) for row in rows], dtype=np.int64).reshape(-1, 3)
+    return answers[:, 0], answers[:, 1], answers[:, 2]
+
+
+def lookup_child_ages(
+    child_ages: dict[int, int], answer_session_ids: np.ndarray
+) -> np.ndarray:
+    """The child age for each of these answer session ids, which must be in `child_ages`."""
+    ids = np.fromiter(child_ages.keys(), dtype=np.int64, count=len(child_ages))
+    ages = np.fromiter(child_ages.values(), dtype=np.int64, count=len(child_ages))
+    order = np.argsort(ids)
+    return ages[order][np.searchsorted(ids[order], answer_session_ids)]
+
+
+def count_milestone_answers(
+    session: SessionDep,
+    m_counts: np.ndarray,
+    milestone_index: IdIndex,
+    answer_session_ids: Iterable[int],
+    sign: int = 1,
+    stored_child_ages: bool = False,
+) -> None:
+    """
+    Add (or, with `sign=-1`, remove) the answers in these answer sessions to the answer
+    counts for each milestone and child age. Only answers that were actually given are
+    counted, so these counts are not affected by imputation.
+
+    The answers are counted in the database, with a GROUP BY that returns one row per
+    milestone, child age and answer rather than every answer. The child age is
+    calculated there from the child's birth month (`answer_session_child_age_in_months`),
+    or with `stored_child_ages` is the age at which each answer session was added to the
+    statistics, so that it is removed from the same ages it was added to. Answer sessions
+    with a child age outside `[0, MAX_CHILD_AGE_MONTHS]` are not counted.
+    """
+    if stored_child_ages:
+        child_age = col(MilestoneAnswerSessionStatistics.child_age)
+    else:
+        child_age = answer_session_child_age_in_months()
+    answer_session_ids = sorted(answer_session_ids)
+    rows: list[tuple[int, int, int, int]] = []
+    for start in range(0, len(answer_session_ids), MAX_IDS_PER_QUERY):
+        statement = select(
+            col(MilestoneAnswer.milestone_id),
+            child_age,
+            col(MilestoneAnswer.answer),
+            func.count(),
+        )
+        if stored_child_ages:
+            statement = statement.join(
+                MilestoneAnswerSessionStatistics,
+                col(MilestoneAnswerSessionStatistics.answer_session_id)
+                == col(MilestoneAnswer.answer_session_id),
+            )
+        else:
+            statement = statement.join(
+                MilestoneAnswerSession,
+                col(MilestoneAnswerSession.id)
+                == col(MilestoneAnswer.answer_session_id),
+            ).join(Child, col(Child.id) == col(MilestoneAnswerSession.child_id))
+        rows.extend(
+            session.exec(  # type: ignore
+                statement.where(
+                    col(MilestoneAnswer.answer_session_id).in_(
+                        answer_session_ids[start : start + MAX_IDS_PER_QUERY]
+                    )
+                )
+                .where(col(MilestoneAnswer.answer) >= 0)
+                .where(child_age >= 0)
+                .where(child_age <= app_settings.MAX_CHILD_AGE_MONTHS)
+                .group_by(
+                    col(MilestoneAnswer.milestone_id),
+                    child_age,
+                    col(MilestoneAnswer.answer),
+                )
+            ).all()
+        )
+    counts = np.array([tuple(row) for row in rows], dtype=np.int64).reshape(-1, 4)
+    milestone_rows = milestone_index.rows(counts[:, 0])
+    # answers to a milestone created since the counts were allocated are left out, just
+    # as they would be if it had been created after this update
+    counted = milestone_rows >= 0
+    # subtract rather than add negative counts, since the counts are unsigned
+    (np.add if sign > 0 else np.subtract).at(
+        m_counts,
+        (milestone_rows[counted], counts[counted, 1], counts[counted, 2]),
+        counts[counted, 3].astype(m_counts.dtype),
+    )
+
+
+@dataclasses.dataclass
+class MilestoneGroupScores:
+    """
+    The milestone group scores of a set of answer sessions: `scores[i, j]` is the score of
+    the answer session `answer_session_ids[i]`, with a child of age `child_ages[i]`, for
+    the milestone group `milestone_group_ids[j]`.
+    """
+
+    answer_session_ids: np.ndarray
+    child_ages: np.ndarray
+    milestone_group_ids: np.ndarray
+    scores: np.ndarray
+
+
+def calculate_milestone_group_scores(
+    session: SessionDep,
+    milestone_answer_sessions: Sequence[MilestoneAnswerSession],
+    child_ages: dict[int, int],
+    milestones_in_group_statistics: Sequence[Milestone],
+    expected_answers: ExpectedMilestoneAnswers,
+) -> MilestoneGroupScores:
+    """
+    Average over the milestones in each group to get a score per answer session,
+    inferring a value for any milestone without an answer.
+
+    This is done for all answer sessions at once, using a matrix of the answer of each
+    answer session (row) to each milestone (column): every entry starts as the expected
+    answer at the child's age, i.e. the mean answer from the milestone's age curve, which is overwritten by 3 for the
+    milestones the child achieved in an earlier answer session, and then by the answers
+    that were actually given. Multiplying by the milestone -> group indicator matrix then
+    sums the answers in each group.
+    """
+    milestone_ids = np.array(
+        [milestone.id for milestone in milestones_in_group_statistics], dtype=np.int64
+    )
+    milestone_group_ids, milestone_groups = np.unique(
+        np.array(
+            [milestone.group_id for milestone in milestones_in_group_statistics],
+            dtype=np.int64,
+        ),
+        return_inverse=True,
+    )
+    # a group with no milestone that has a usable age curve has no column here, so it
+    # gets no score: there is nothing to record and dividing by a zero count would be nan
+    group_indicator = np.zeros((milestone_ids.size, milestone_group_ids.size))
+    group_indicator[np.arange(milestone_ids.size), milestone_groups] = 1.0
+    group_indicator /= group_indicator.sum(axis=0)
+    # the column of each milestone id, or -1 for a milestone that is not averaged
+    milestone_columns = np.full(
+        int(milestone_ids.max(initial=0)) + 1, -1, dtype=np.int64
+    )
+    milestone_columns[milestone_ids] = np.arange(milestone_ids.size)
+    # the mean answer for each child age (row) and milestone (column)
+    imputed_answers = expected_answers.answers[
+        expected_answers.milestone_index.rows(milestone_ids)
+    ].T
+
+    answer_session_ids = np.zeros(len(milestone_answer_sessions), dtype=np.int64)
+    achieved_rows: list[int] = []
+    achieved_milestone_ids: list[int] = []
+    for row, (milestone_answer_session, previously_achieved_milestone_ids) in enumerate(
+        iter_sessions_with_previously_achieved_milestone_ids(
+            session, milestone_answer_sessions
+        )
+    ):
+        answer_session_ids[row] = milestone_answer_session.id  # type: ignore
+        achieved_rows.extend([row] * len(previously_achieved_milestone_ids))
+        achieved_milestone_ids.extend(previously_achieved_milestone_ids)
+    session_child_ages = lookup_child_ages(child_ages, answer_session_ids)
+    answer_matrix = imputed_answers[session_child_ages]
+
+    # the child achieved these milestones in an earlier session, which is why they are
+    # not in this one - we know the answer, so we do not impute it
+    achieved_row_array = np.array(achieved_rows, dtype=np.int64)
+    achieved_column_array = lookup_milestone_columns(
+        milestone_columns, np.array(achieved_milestone_ids, dtype=np.int64)
+    )
+    averaged = achieved_column_array >= 0
+    answer_matrix[achieved_row_array[averaged], achieved_column_array[averaged]] = 3.0
+
+    answered_session_ids, answered_milestone_ids, answers = get_milestone_answer_arrays(
+        session, answer_session_ids.tolist()
+    )
+    answered_columns = lookup_milestone_columns(
+        milestone_columns, answered_milestone_ids
+    )
+    averaged = answered_columns >= 0
+    order = np.argsort(answer_session_ids)
+    answered_rows = order[
+        np.searchsorted(answer_session_ids[order], answered_session_ids[averaged])
+    ]
+    answer_matrix[answered_rows, answered_columns[averaged]] = answers[averaged]
+
+    return MilestoneGroupScores(
+        answer_session_ids=answer_session_ids,
+        child_ages=session_child_ages,
+        milestone_group_ids=milestone_group_ids,
+        scores=answer_matrix @ group_indicator,
+    )
+
+
+def lookup_milestone_columns(
+    milestone_columns: np.ndarray, milestone_ids: np.ndarray
+) -> np.ndarray:
+    """The column of each of these milestone ids, or -1 if it has none."""
+    columns = np.full(milestone_ids.size, -1, dtype=np.int64)
+    in_range = milestone_ids < milestone_columns.size
+    columns[in_range] = milestone_columns[milestone_ids[in_range]]
+    return columns
+
+
+def add_milestone_group_scores(
+    mg_counts: np.ndarray,
+    mg_sum_scores: np.ndarray,
+    mg_sum_squaredscores: np.ndarray,
+    milestone_group_index: IdIndex,
+    milestone_group_ids: np.ndarray,
+    child_ages: np.ndarray,
+    scores: np.ndarray,
+    sign: int = 1,
+) -> None:
+    """
+    Add (or, with `sign=-1`, remove) these milestone group scores to the count, sum and
+    sum of squares of the scores for each milestone group and child age.
+    """
+    rows = milestone_group_index.rows(milestone_group_ids)
+    # a milestone group deleted since these scores were stored has no row
+    stored = rows >= 0
+    index = (rows[stored], child_ages[stored])
+    scores = scores[stored]
+    # subtract rather than add negative counts, since the counts are unsigned
+    (np.add if sign > 0 else np.subtract).at(mg_counts, index, 1)
+    np.add.at(mg_sum_scores, index, sign * scores)
+    np.add.at(mg_sum_squaredscores, index, sign * np.square(scores))
+
+
+def update_answer_sessions(
+    session: SessionDep, answer_session_ids: Iterable[int], **values
+) -> None:
+    """
+    Set these column values on the answer sessions with these ids, with one UPDATE
+    statement per `MAX_IDS_PER_QUERY` answer sessions rather than one per answer session.
+
+    Answer sessions already loaded into the session are expired rather than updated
+    for each statement, which would mean checking every loaded object every time.
+    """
+    answer_session_ids = sorted(answer_session_ids)
+    for start in range(0, len(answer_session_ids), MAX_IDS_PER_QUERY):
+        session.execute(
+            update(MilestoneAnswerSession)
+            .where(
+                col(MilestoneAnswerSession.id).in_(
+                    answer_session_ids[start : start + MAX_IDS_PER_QUERY]
+                )
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+    updated_ids = set(answer_session_ids)
+    # the identity key holds the primary key, which reading `id` from an expired object
+    # would load again
+    for identity_key in list(session.identity_map.keys()):
+        model, (answer_session_id, *_) = identity_key[:2]
+        if model is MilestoneAnswerSession and answer_session_id in updated_ids:
+            session.expire(session.identity_map[identity_key], values.keys())
+
+
+def get_answer_sessions(
+    session: SessionDep, answer_session_ids: Iterable[int]
+) -> Sequence[MilestoneAnswerSession]:
+    """The answer sessions with these ids, with one query per `MAX_IDS_PER_QUERY` ids."""
+    answer_session_ids = sorted(answer_session_ids)
+    answer_sessions: list[MilestoneAnswerSession] = []
+    for start in range(0, len(answer_session_ids), MAX_IDS_PER_QUERY):
+        answer_sessions.extend(
+            session.exec(
+                select(MilestoneAnswerSession).where(
+                    col(MilestoneAnswerSession.id).in_(
+                        answer_session_ids[start : start + MAX_IDS_PER_QUERY]
+                    )
+                )
+            ).all()
+        )
+    return answer_sessions
+
+
+# Counting and scoring the answer sessions of a shard in a worker process is only worth
+# starting the process for at least this many answer sessions per worker
+MIN_ANSWER_SESSIONS_PER_SHARD = 2000
+
+# the database engine of a statistics shard worker process
+_shard_engine: Engine | None = None
+
+# the profiler of the statistics update running in this context, which the statements
+# executed by its shard worker processes are added to
+_statistics_update_profiler: ContextVar[StatisticsUpdateProfiler | None] = ContextVar(
+    "statistics_update_profiler", default=None
+)
+
+
+def statistics_shards(
+    session: SessionDep, answer_sessions: Sequence[MilestoneAnswerSession]
+) -> list[list[int]]:
+    """
+    Split the ids of these answer sessions into shards, one per worker process, by child:
+    all the answer sessions of a child are in the same shard, so that the milestones
+    they achieved in earlier answer sessions are found within it.
+
+    There is only one shard if there are too few answer sessions to be worth splitting,
+    or if the database is in memory, where a worker process cannot open it.
+    """
+    url = session.get_bind().url  # type: ignore
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        workers = 1
+    else:
+        workers = app_settings.STATS_SHARD_WORKERS or os.cpu_count() or 1
+    n_shards = max(
+        1, min(workers, len(answer_sessions) // MIN_ANSWER_SESSIONS_PER_SHARD)
+    )
+    shards: list[list[int]] = [[] for _ in range(n_shards)]
+    for answer_session in answer_sessions:
+        shards[answer_session.child_id % n_shards].append(answer_session.id)  # type: ignore
+    return [shard for shard in shards if shard]
+
+
+def _init_statistics_shard_worker(
+    db_url: str, milestone_min_answers_for_curve_fit: int, max_child_age_months: int
+) -> None:
+    global _shard_engine
+    _init_curve_fit_worker(milestone_min_answers_for_curve_fit, max_child_age_months)
+    _shard_engine = create_engine(db_url)
+
+
+async def run_in_statistics_shard_workers(
+    session: SessionDep, function: Callable, shard_args: list[tuple]
+) -> list:
+    """
+    Call `function` with each of `shard_args` in a pool of worker processes, each of
+    which opens its own connection to the database of `session`.
+    """
+    logger.info(f"    - using {len(shard_args)} worker processes")
+    loop = asyncio.get_running_loop()
+    # forkserver rather than fork, since this process has other threads running
+    with ProcessPoolExecutor(
+        max_workers=len(shard_args),
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_init_statistics_shard_worker,  # type: ignore
+        initargs=(  # type: ignore
+            session.get_bind().url.render_as_string(hide_password=False),  # type: ignore
+            app_settings.MILESTONE_MIN_ANSWERS_FOR_CURVE_FIT,
+            app_settings.MAX_CHILD_AGE_MONTHS,
+        ),
+    ) as executor:
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor, _run_in_statistics_shard_worker, function, *args
+                )
+                for args in shard_args
+            )
+        )
+    profiler = _statistics_update_profiler.get()
+    if profiler is not None:
+        for _, statements in results:
+            profiler.add_statements(statements)
+    return [result for result, _ in results]
+
+
+def _run_in_statistics_shard_worker(
+    function: Callable, *args
+) -> tuple[Any, StatisticsUpdatePhaseResult]:
+    # the statements executed in this process, which the profiler of the process that
+    # started it cannot see, are counted here and returned along with the result
+    statements = StatisticsUpdatePhaseResult(phase="")
+
+    def _count_statement(conn, cursor, statement, parameters, context, executemany):
+        count_statement(statements, cursor, context)
+
+    event.listen(_shard_engine, "after_cursor_execute", _count_statement)
+    try:
+        return function(*args), statements
+    finally:
+        event.remove(_shard_engine, "after_cursor_execute", _count_statement)
+
+
+def _count_milestone_answers_shard(
+    answer_session_ids: list[int],
+    shape: tuple[int, ...],
+    dtype: np.dtype,
+    milestone_index: IdIndex,
+) -> np.ndarray:
+    m_counts = np.zeros(shape, dtype=dtype)
+    with Session(_shard_engine) as session:
+        count_milestone_answers(session, m_counts, milestone_index, answer_session_ids)
+    return m_counts
+
+
+async def count_milestone_answers_in_shards(
+    session: SessionDep,
+    m_counts: np.ndarray,
+    milestone_index: IdIndex,
+    answer_sessions: Sequence[MilestoneAnswerSession],
+) -> None:
+    """
+    Add the answers in these answer sessions to the answer counts, like
+    `count_milestone_answers`, with each shard (`statistics_shards`) of the answer
+    sessions counted by its own worker process, and the partial counts summed.
+    """
+    shards = statistics_shards(session, answer_sessions)
+    if len(shards) <= 1:
+        count_milestone_answers(
+            session,
+            m_counts,
+            milestone_index,
+            [answer_session.id for answer_session in answer_sessions],  # type: ignore
+        )
+        return
+    for partial_counts in await run_in_statistics_shard_workers(
+        session,
+        _count_milestone_answers_shard,
+        [(shard, m_counts.shape, m_counts.dtype, milestone_index) for shard in shards],
+    ):
+        m_counts += partial_counts
+
+
+def _calculate_milestone_group_scores_shard(
+    answer_session_ids: list[int],
+    child_ages: dict[int, int],
+    milestone_ids: list[int],
+    expected_answers: ExpectedMilestoneAnswers,
+) -> MilestoneGroupScores:
+    with Session(_shard_engine) as session:
+        milestones = {
+            milestone.id: milestone
+            for milestone in session.exec(
+                select(Milestone).where(col(Milestone.id).in_(milestone_ids))
+            ).all()
+        }
+        return calculate_milestone_group_scores(
+            session,
+            get_answer_sessions(session, answer_session_ids),
+            child_ages,
+            [milestones[milestone_id] for milestone_id in milestone_ids],
+            expected_answers,
+        )
+
+
+async def calculate_milestone_group_scores_in_shards(
+    session: SessionDep,
+    milestone_answer_sessions: Sequence[MilestoneAnswerSession],
+    child_ages: dict[int, int],
+    milestones_in_group_statistics: Sequence[Milestone],
+    expected_answers: ExpectedMilestoneAnswers,
+) -> MilestoneGroupScores:
+    """
+    The milestone group scores of these answer sessions, like
+    `calculate_milestone_group_scores`, with each shard (`statistics_shards`) of the
+    answer sessions scored by its own worker process, and the scores concatenated.
+    """
+    shards = statistics_shards(session, milestone_answer_sessions)
+    if len(shards) <= 1:
+        return calculate_milestone_group_scores(
+            session,
+            milestone_answer_sessions,
+            child_ages,
+            milestones_in_group_statistics,
+            expected_answers,
+        )
+    milestone_ids: list[int] = [
+        milestone.id  # type: ignore
+        for milestone in milestones_in_group_statistics
+    ]
+    partial_scores: list[MilestoneGroupScores] = await run_in_statistics_shard_workers(
+        session,
+        _calculate_milestone_group_scores_shard,
+        [
+            (
+                shard,
+                {
+                    answer_session_id: child_ages[answer_session_id]
+                    for answer_session_id in shard
+                },
+                milestone_ids,
+                expected_answers,
+            )
+            for shard in shards
+        ],
+    )
+    return MilestoneGroupScores(
+        answer_session_ids=np.concatenate(
+            [scores.answer_session_ids for scores in partial_scores]
+        ),
+        child_ages=np.concatenate([scores.child_ages for scores in partial_scores]),
+        milestone_group_ids=partial_scores[0].milestone_group_ids,
+        scores=np.concatenate([scores.scores for scores in partial_scores]),
+    )
+
+
+# Fitting one age curve only takes a few milliseconds, so starting a worker process is
+# only worth it for at least this many milestones per worker
+MIN_MILESTONES_PER_CURVE_FIT_WORKER = 25
+
+
+def curve_fit_workers(n_milestones: int) -> int:
+    """The number of worker processes to fit this many milestone age curves with."""
+    workers = app_settings.STATS_CURVE_FIT_WORKERS or os.cpu_count() or 1
+    return max(1, min(workers, n_milestones // MIN_MILESTONES_PER_CURVE_FIT_WORKER))
+
+
+def _init_curve_fit_worker(
+    milestone_min_answers_for_curve_fit: int, max_child_age_months: int
+) -> None:
+    # a worker process reads its settings from the environment again, so use the
+    # settings of the process that started it to get the same fits
+    app_settings.MILESTONE_MIN_ANSWERS_FOR_CURVE_FIT = (
+        milestone_min_answers_for_curve_fit
+    )
+    app_settings.MAX_CHILD_AGE_MONTHS = max_child_age_months
+
+
+async def fit_milestone_age_curves(
+    m_counts: np.ndarray,
+    milestone_index: IdIndex,
+    milestone_ids: Sequence[int],
+    workers: int | None = None,
+    initial_guesses: dict[int, tuple[float, float]] | None = None,
+) -> dict[int, MilestoneAgeCurve]:
+    """
+    Fit an age curve to the answer counts of each of these milestones.
+
+    The fits are independent, so with more than one worker they are spread over a pool of
+    worker processes. Each fit is deterministic, so the curves are the same however many
+    workers are used.
+
+    Args:
+        m_counts (np.ndarray): answer counts for each milestone, child age and answer
+        milestone_index (IdIndex): the row of `m_counts` of each milestone
+        milestone_ids (Sequence[int]): the milestones to fit
+        workers (int | None): number of worker processes, by default `curve_fit_workers`
+        initial_guesses (dict[int, tuple[float, float]] | None): (midpoint, steepness)
+            to start the fit of a milestone from
+    """
+    if workers is None:
+        workers = curve_fit_workers(len(milestone_ids))
+    if initial_guesses is None:
+        initial_guesses = {}
+    if workers <= 1:
+        return {
+            milestone_id: fit_milestone_age_curve(
+                m_counts[milestone_index.row(milestone_id)],
+                initial_guesses.get(milestone_id),
             )
-            milestone_answer_session.suspicious_state = state
-        except AttributeError as e:
-            logger.exception(e)
+            for milestone_id in milestone_ids
+        }
+    logger.info(f"    - using {workers} worker processes")
+    loop = asyncio.get_running_loop()
+    # forkserver rather than fork, since this process has other threads running
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_init_curve_fit_worker,
+        initargs=(
+            app_settings.MILESTONE_MIN_ANSWERS_FOR_CURVE_FIT,
+            app_settings.MAX_CHILD_AGE_MONTHS,
+        ),
+    ) as executor:
+        curves = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor,
+                    fit_milestone_age_curve,
+                    m_counts[milestone_index.row(milestone_id)],
+                    initial_guesses.get(milestone_id),
+                )
+                for milestone_id in milestone_ids
+            )
+        )
+    return dict(zip(milestone_ids, curves, strict=True))
+
+
+async def update_milestone_age_curves(
+    session: SessionDep,
+    m_counts: np.ndarray,
+    milestone_index: IdIndex,
+    milestone_ids: Sequence[int],
+    curve_fit_hashes: dict[int, str],
+) -> dict[int, MilestoneAgeCurve]:
+    """
+    The age curve of each of these milestones, only refitting those whose answer counts
+    (or the fit settings) have changed since their stored curve was fitted.
+
+    A refit starts from the stored curve if there is a usable one: the answer counts of a
+    milestone change little from one update to the next, so neither does its curve.
+    """
+    previous_fits = {
+        collection.milestone_id: collection
+        for collection in session.exec(
+            select(MilestoneAgeScoreCollection).where(
+                col(MilestoneAgeScoreCollection.version)
+                == get_statistics_version(session)
+            )
+        ).all()
+    }
+    milestone_curves: dict[int, MilestoneAgeCurve] = {}
+    initial_guesses: dict[int, tuple[float, float]] = {}
+    for milestone_id in milestone_ids:
+        previous_fit = previous_fits.get(milestone_id)
+        if previous_fit is None:
+            continue
+        if previous_fit.curve_fit_hash == curve_fit_hashes[milestone_id]:
+            milestone_curves[milestone_id] = MilestoneAgeCurve(
+                midpoint=previous_fit.curve_midpoint,
+                steepness=previous_fit.curve_steepness,
+                n_answers=previous_fit.curve_n_answers,
+                fit_ok=previous_fit.curve_fit_ok,
+            )
+        elif previous_fit.curve_fit_ok:
+            initial_guesses[milestone_id] = (
+                previous_fit.curve_midpoint,
+                previous_fit.curve_steepness,
+            )
+    logger.info(f"    - reusing {len(milestone_curves)} unchanged milestone age curves")
+    milestone_curves.update(
+        await fit_milestone_age_curves(
+            m_counts,
+            milestone_index,
+            [
+                milestone_id
+                for milestone_id in milestone_ids
+                if milestone_id not in milestone_curves
+            ],
+            initial_guesses=initial_guesses,
+        )
+    )
+    return milestone_curves
+
+
+# The phases of a statistics update in the order they run, as passed to its `progress`
+STATISTICS_UPDATE_PHASES = (
+    "flagging answer sessions",
+    "collecting answer sessions",
+    "collecting milestone answers",
+    "fitting milestone age curves",
+    "calculating milestone group statistics",
+    "saving statistics",
+)
+
+
+class StatisticsUpdateProfiler:
+    """
+    Measures each phase of a statistics update: its wall time, the number of SQL
+    statements it executes and of rows they change, including those of its shard worker
+    processes, and if `trace_memory` the peak memory traced by tracemalloc in this
+    process while it runs. A phase lasts until the next one starts.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        progress: Callable[[str], None] | None = None,
+        trace_memory: bool = False,
+    ) -> None:
+        self.engine = engine
+        self.progress = progress
+        self.trace_memory = trace_memory
+        self.phases: list[StatisticsUpdatePhaseResult] = []
+        self._phase_start_time = 0.0
+        self._started_tracemalloc = False
+
+    def __enter__(self) -> StatisticsUpdateProfiler:
+        event.listen(self.engine, "after_cursor_execute", self._count_statement)
+        self._context_token = _statistics_update_profiler.set(self)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._finish_phase()
+        _statistics_update_profiler.reset(self._context_token)
+        event.remove(self.engine, "after_cursor_execute", self._count_statement)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def start_phase(self, phase: str) -> None:
+        self._finish_phase()
+        logger.info(f"  - {phase}")
+        if self.progress is not None:
+            self.progress(phase)
+        self.phases.append(StatisticsUpdatePhaseResult(phase=phase))
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self._phase_start_time = time.monotonic()
+
+    def _finish_phase(self) -> None:
+        if not self.phases:
+            return
+        phase = self.phases[-1]
+        phase.runtime_seconds = time.monotonic() - self._phase_start_time
+        if self.trace_memory:
+            phase.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+
+    def add_statements(self, statements: StatisticsUpdatePhaseResult) -> None:
+        """Add the statements counted in a worker process to the current phase."""
+        if not self.phases:
+            return
+        self.phases[-1].queries += statements.queries
+        self.phases[-1].rows += statements.rows
+
+    def _count_statement(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        if self.phases:
+            count_statement(self.phases[-1], cursor, context)
+
+
+def count_statement(phase: StatisticsUpdatePhaseResult, cursor, context) -> None:
+    """Count an executed SQL statement, and the rows it changed, in this phase."""
+    phase.queries += 1
+    if context is not None and (
+        context.isinsert or context.isupdate or context.isdelete
+    ):
+        phase.rows += max(cursor.rowcount, 0)
 
 
 async def async_update_stats(
     session: SessionDep,
     user_session: UserAsyncSessionDep,
+    full_rebuild: bool = False,
+    progress: Callable[[str], None] | None = None,
 ) -> StatisticsUpdateResult:
     """Update the recorded statistics of the milestonegroups and milestones.
     It only uses completed milestoneanswersesssions, excluding those from test users or those that are marked as suspicious.
+
+    By default the update is incremental: the answer counts and milestone group scores
+    stored by the last update are kept, and only the answer sessions that have been
+    completed, excluded or re-flagged since then are added to or removed from them, so
+    the runtime scales with the number of changed answer sessions rather than with the
+    size of the whole history. Only the milestone age curves of milestones whose answer
+    counts have changed are refitted.
+
+    An incremental update keeps the milestone group score that each answer session was
+    given when it was added, even though the age curves used to impute its missing answers
+    have since been refitted. The milestone group statistics are only rebuilt from every
+    answer session if a milestone joins or leaves them, or if a milestone is moved to a
+    different group, since scores averaged over a different set of milestones are not
+    comparable. A full rebuild of everything is done with `full_rebuild`, or if there are
+    no stored statistics to build on.
+
     Args:
         session (SessionDep): database session
         user_session (UserAsyncSessionDep): user session
+        full_rebuild (bool): rebuild the statistics from every answer session
+        progress (Callable[[str], None] | None): called with each of the
+            `STATISTICS_UPDATE_PHASES` as it starts
 
     Returns:
-        StatisticsUpdateResult: number of answer sessions and answers used, and the runtime in seconds.
+        StatisticsUpdateResult: number of answer sessions and answers used, and the runtime in seconds,
+            in total and for each phase.
     """
+    with StatisticsUpdateProfiler(
+        session.get_bind(),  # type: ignore
+        progress,
+        trace_memory=app_settings.STATS_TRACE_MEMORY,
+    ) as profiler:
+        result = await _async_update_stats(
+            session, user_session, full_rebuild, profiler.start_phase
+        )
+    result.phases = profiler.phases
+    for phase in result.phases:
+        logger.info(
+            f"  - {phase.phase}: {phase.runtime_seconds:.2f}s, {phase.queries} queries, "
+            f"{phase.rows} rows, {phase.peak_memory_bytes / 2**20:.1f} MiB peak memory"
+        )
+    return result
+
+
+async def _async_update_stats(
+    session: SessionDep,
+    user_session: UserAsyncSessionDep,
+    full_rebuild: bool,
+    start_phase: Callable[[str], None],
+) -> StatisticsUpdateResult:
     start_time = time.monotonic()
     logger.info("Starting statistics update")
 
-    logger.info("  - flagging incomplete answer sessions")
+    start_phase("flagging answer sessions")
+    logger.info("    - flagging incomplete answer sessions")
     flag_incomplete_answer_sessions(session)
 
     # We gather these first then exclude later so that we don't do a FK join on the user_id<->email for stale+filtering
     test_account_user_ids_to_exclude = await get_test_account_user_ids(user_session)
 
-    logger.info("  - flagging suspicious answer sessions")
+    logger.info("    - flagging suspicious answer sessions")
     flag_suspicious_answer_sessions(session, test_account_user_ids_to_exclude)
 
-    for answer_session in session.exec(select(MilestoneAnswerSession)).all():
-        answer_session.included_in_statistics = False
-
-    logger.info("  - collecting answer sessions")
-    # get MilestoneAnswerSessions to be used for calculating statistics
-    # filter to keep only those that are not test accounts and are explicitly marked as not suspicious (either by system or admin)
-    answer_session_filter = (
-        select(MilestoneAnswerSession)
-        .where(col(MilestoneAnswerSession.completed))
-        .where(
-            col(MilestoneAnswerSession.user_id).not_in(test_account_user_ids_to_exclude)
-        )
-        .where(
-            (
-                col(MilestoneAnswerSession.suspicious_state)
-                == SuspiciousState.not_suspicious
-            )
-            | (
-                col(MilestoneAnswerSession.suspicious_state)
-                == SuspiciousState.admin_not_suspicious
-            )
-        )
-    )
-
-    milestone_answer_sessions = session.exec(answer_session_filter).all()
-
-    child_ages = get_answer_session_child_ages_in_months(
-        session, milestone_answer_sessions
-    )
-    logger.info(
-        f"  - calculating statistics using {len(milestone_answer_sessions)} answer sessions"
-    )
-    # array of values to store answer counts for each milestone and child age:
-    max_milestone_id = session.exec(select(func.max(col(Milestone.id)))).one_or_none()
-    if max_milestone_id is None:
+    # array of values to store answer counts for each milestone and child age, with a
+    # row for each milestone that exists:
+    milestones = session.exec(select(Milestone)).all()
+    milestone_index = IdIndex.from_ids(milestone.id for milestone in milestones)  # type: ignore
+    if len(milestone_index) == 0:
         logger.info("No milestones found, skipping statistics update")
         return StatisticsUpdateResult(
             answer_sessions=0,
             answers=0,
             runtime_seconds=time.monotonic() - start_time,
+            full_rebuild=full_rebuild,
         )
+    # 32 bits are plenty for the number of answers to a milestone at one age, and halve
+    # the memory of the counts
     m_counts = np.zeros(
-        (max_milestone_id + 1, app_settings.MAX_CHILD_AGE_MONTHS + 1, 4),
-        dtype=np.uint64,
+        (len(milestone_index), app_settings.MAX_CHILD_AGE_MONTHS + 1, 4),
+        dtype=np.uint32,
     )
     # arrays of values to store counts, sum of scores and sum of scores squared for each milestone group & age:
-    max_milestone_group_id = session.exec(
-        select(func.max(col(MilestoneGroup.id)))
-    ).one_or_none()
-    if max_milestone_group_id is None:
+    milestone_group_index = IdIndex.from_ids(
+        session.exec(select(col(MilestoneGroup.id))).all()  # type: ignore
+    )
+    if len(milestone_group_index) == 0:
         logger.info("No milestone groups found, skipping statistics update")
         return StatisticsUpdateResult(
             answer_sessions=0,
             answers=0,
             runtime_seconds=time.monotonic() - start_time,
+            full_rebuild=full_rebuild,
         )
-    mg_shape = (max_milestone_group_id + 1, app_settings.MAX_CHILD_AGE_MONTHS + 1)
-    mg_counts = np.zeros(mg_shape, dtype=np.uint64)
+    mg_shape = (len(milestone_group_index), app_settings.MAX_CHILD_AGE_MONTHS + 1)
+    mg_counts = np.zeros(mg_shape, dtype=np.uint32)
     mg_sum_scores = np.zeros(mg_shape, dtype=np.float64)
     mg_sum_squaredscores = np.zeros(mg_shape, dtype=np.float64)
 
-    milestones = session.exec(select(Milestone)).all()
-    milestone_group_ids = session.exec(select(MilestoneGroup.id)).all()
+    statistics_state = session.get(StatisticsState, 1)
+    if not full_rebuild and statistics_state is None:
+        logger.info("  - no stored statistics to update, rebuilding them")
+        full_rebuild = True
+
+    start_phase("collecting answer sessions")
+    answer_session_ids = set(
+        session.exec(
+            answer_sessions_for_statistics(
+                test_account_user_ids_to_exclude
+            ).with_only_columns(col(MilestoneAnswerSession.id))
+        ).all()
+    )
+    # the child age at which each answer session is currently included in the statistics
+    included_child_ages: dict[int, int] = {}
+    if not full_rebuild and statistics_state is not None:
+        included_child_ages = {
+            answer_session_id: child_age
+            for answer_session_id, child_age in session.exec(
+                select(
+                    col(MilestoneAnswerSessionStatistics.answer_session_id),
+                    col(MilestoneAnswerSessionStatistics.child_age),
+                ).join(
+                    MilestoneAnswerSession,
+                    col(MilestoneAnswerSession.id)
+                    == col(MilestoneAnswerSessionStatistics.answer_session_id),
+                )
+            ).all()
+        }
+        # an included answer session that has since been deleted, e.g. along with a
+        # user account, took its answers with it without them being taken out of the
+        # statistics, and the only way to correct for that is to rebuild them
+        if len(included_child_ages) != statistics_state.answer_sessions:
+            logger.info(
+                f"  - stored statistics include {statistics_state.answer_sessions} answer sessions, "
+                f"but only {len(included_child_ages)} of them still exist, rebuilding them"
+            )
+            full_rebuild = True
+            included_child_ages = {}
+    if full_rebuild:
+        session.execute(delete(MilestoneGroupAnswerSessionScore))
+        session.execute(delete(MilestoneAnswerSessionStatistics))
+        session.execute(
+            update(MilestoneAnswerSession)
+            .where(col(MilestoneAnswerSession.included_in_statistics))
+            .values(included_in_statistics=False)
+        )
+    else:
+        load_milestone_counts(session, m_counts, milestone_index)
 
-    num_answer_sessions = 0
-    num_answers = 0
+    removed_answer_sessions = get_answer_sessions(
+        session, included_child_ages.keys() - answer_session_ids
+    )
+    added_answer_sessions = get_answer_sessions(
+        session, answer_session_ids - included_child_ages.keys()
+    )
+    added_child_ages = {
+        answer_session_id: child_age
+        for answer_session_id, child_age in get_answer_session_child_ages_in_months(
+            session, added_answer_sessions
+        ).items()
+        if 0 <= child_age <= app_settings.MAX_CHILD_AGE_MONTHS
+    }
+    added_answer_sessions = [
+        answer_session
+        for answer_session in added_answer_sessions
+        if answer_session.id in added_child_ages
+    ]
+    logger.info(
+        f"  - adding {len(added_answer_sessions)} and removing {len(removed_answer_sessions)} answer sessions"
+    )
 
-    # First pass: count the answers for each milestone and child age. Only answers that
-    # were actually given are counted, so these counts are not affected by imputation.
-    logger.info("  - collecting milestone answers")
-    for milestone_answer_session in milestone_answer_sessions:
-        child_age = child_ages[milestone_answer_session.id]  # type: ignore
-        if 0 <= child_age <= app_settings.MAX_CHILD_AGE_MONTHS:
-            for milestone in milestones:
-                answer = milestone_answer_session.answers.get(milestone.id)  # type: ignore
-                if answer is not None:
-                    m_counts[milestone.id][child_age][answer.answer] += 1
+    # First pass: count the answers for each milestone and child age.
+    start_phase("collecting milestone answers")
+    await count_milestone_answers_in_shards(
+        session, m_counts, milestone_index, added_answer_sessions
+    )
+    count_milestone_answers(
+        session,
+        m_counts,
+        milestone_index,
+        [answer_session.id for answer_session in removed_answer_sessions],  # type: ignore
+        sign=-1,
+        stored_child_ages=True,
+    )
 
     # Fit an age curve to each milestone from those counts. The curve gives the mean
     # answer as a function of child age, which is what we impute below for a milestone
     # that an answer session does not contain.
-    logger.info("  - fitting milestone age curves")
-    milestone_curves = {
-        milestone.id: fit_milestone_age_curve(m_counts[milestone.id])  # type: ignore
+    start_phase("fitting milestone age curves")
+    curve_fit_hashes = {
+        milestone.id: milestone_age_curve_fit_hash(
+            m_counts[milestone_index.row(milestone.id)]  # type: ignore
+        )
         for milestone in milestones
     }
+    milestone_curves = await update_milestone_age_curves(
+        session,
+        m_counts,
+        milestone_index,
+        [milestone.id for milestone in milestones],  # type: ignore
+        curve_fit_hashes,  # type: ignore
+    )
     # A milestone whose curve could not be fitted (typically one that is too new to have
     # many answers) is left out of its group's average entirely, for every answer session,
     # rather than having a value imputed for it. Imputing from a curve fitted to a handful
@@ -376,237 +1599,351 @@ async def async_update_stats(
                 f"({milestone_curves[milestone.id].n_answers} answers), "  # type: ignore
                 f"excluding it from milestone group statistics"
             )
+    milestone_groups_hash = milestone_group_statistics_hash(
+        milestones_in_group_statistics
+    )
+    expected_answers = expected_milestone_answers(
+        milestone_index,
+        m_counts,
+        milestone_curves,  # type: ignore
+    )
 
-    # Second pass: average over the milestones in each group to get a score per answer
-    # session, inferring a value for any milestone without an answer.
-    logger.info("  - calculating milestone group statistics")
-    for (
-        milestone_answer_session,
-        achieved_milestone_ids,
-    ) in iter_sessions_with_previously_achieved_milestone_ids(
-        session, milestone_answer_sessions
+    # Second pass: the milestone group score of each answer session.
+    start_phase("calculating milestone group statistics")
+    removed_answer_session_ids = [
+        answer_session.id for answer_session in removed_answer_sessions
+    ]
+    if (
+        full_rebuild
+        or statistics_state is None
+        or statistics_state.milestone_groups_hash != milestone_groups_hash
     ):
-        child_age = child_ages[milestone_answer_session.id]  # type: ignore
-        if 0 <= child_age <= app_settings.MAX_CHILD_AGE_MONTHS:
-            logger.debug(
-                f"    - answer session={milestone_answer_session.id} child_age={child_age}"
-            )
-            mg_local_count = np.zeros(max_milestone_group_id + 1)
-            mg_local_sum = np.zeros(max_milestone_group_id + 1)
-            for milestone in milestones_in_group_statistics:
-                answer = milestone_answer_session.answers.get(milestone.id)  # type: ignore
-                if answer is not None:
-                    answer_value = float(answer.answer)
-                elif milestone.id in achieved_milestone_ids:
-                    # the child achieved this milestone in an earlier session, which is why
-                    # it is not in this one - we know the answer, so we do not impute it
-                    answer_value = 3.0
-                else:
-                    # the child was not asked about this milestone, because they are too
-                    # young for it or it did not exist yet, so a missing answer is
-                    # informative: the fitted curve gives the mean answer of children of
-                    # this age for this milestone.
-                    answer_value = float(
-                        milestone_curves[milestone.id].mean_answer(child_age)  # type: ignore
-                    )
-                    logger.debug(
-                        f"    - milestone_group_id={milestone.group_id} milestone_id={milestone.id} imputed_answer={answer_value}"
+        logger.info("    - recalculating the scores of every answer session")
+        session.execute(delete(MilestoneGroupAnswerSessionScore))
+        scored_answer_sessions = [
+            *get_answer_sessions(
+                session, included_child_ages.keys() & answer_session_ids
+            ),
+            *added_answer_sessions,
+        ]
+    else:
+        load_milestone_group_statistics(
+            session,
+            mg_counts,
+            mg_sum_scores,
+            mg_sum_squaredscores,
+            milestone_group_index,
+        )
+        removed_score_rows: list[tuple[float, ...]] = []
+        for start in range(0, len(removed_answer_session_ids), MAX_IDS_PER_QUERY):
+            chunk = removed_answer_session_ids[start : start + MAX_IDS_PER_QUERY]
+            removed_score_rows.extend(
+                tuple(row)
+                for row in session.exec(
+                    select(
+                        col(MilestoneGroupAnswerSessionScore.milestone_group_id),
+                        col(MilestoneGroupAnswerSessionScore.age),
+                        col(MilestoneGroupAnswerSessionScore.score),
+                    ).where(
+                        col(MilestoneGroupAnswerSessionScore.answer_session_id).in_(
+                            chunk
+                        )
                     )
-                mg_local_count[milestone.group_id] += 1
-                mg_local_sum[milestone.group_id] += answer_value
-            for milestone_group_id in milestone_group_ids:
-                # skip groups with no milestone that has a usable age curve: there is no
-                # score to record and dividing by a zero count would produce nan
-                if mg_local_count[milestone_group_id] == 0:
-                    continue
-                mg_avg_score = (
-                    mg_local_sum[milestone_group_id]
-                    / mg_local_count[milestone_group_id]
-                )
-                logger.debug(
-                    f"    - milestone group {milestone_group_id}: avg score {mg_avg_score}"
                 )
-                mg_counts[milestone_group_id][child_age] += 1
-                mg_sum_scores[milestone_group_id][child_age] += mg_avg_score
-                mg_sum_squaredscores[milestone_group_id][child_age] += np.pow(
-                    mg_avg_score, 2
+            )
+            session.execute(
+                delete(MilestoneGroupAnswerSessionScore).where(
+                    col(MilestoneGroupAnswerSessionScore.answer_session_id).in_(chunk)
                 )
-            milestone_answer_session.included_in_statistics = True
-            num_answer_sessions += 1
-            num_answers += len(milestone_answer_session.answers)
+            )
+        removed_scores = np.array(removed_score_rows, dtype=np.float64).reshape(-1, 3)
+        add_milestone_group_scores(
+            mg_counts,
+            mg_sum_scores,
+            mg_sum_squaredscores,
+            milestone_group_index,
+            removed_scores[:, 0].astype(np.int64),
+            removed_scores[:, 1].astype(np.int64),
+            removed_scores[:, 2],
+            sign=-1,
+        )
+        scored_answer_sessions = added_answer_sessions
+    milestone_group_scores = await calculate_milestone_group_scores_in_shards(
+        session,
+        scored_answer_sessions,
+        {**included_child_ages, **added_child_ages},
+        milestones_in_group_statistics,
+        expected_answers,
+    )
+    n_groups = milestone_group_scores.milestone_group_ids.size
+    add_milestone_group_scores(
+        mg_counts,
+        mg_sum_scores,
+        mg_sum_squaredscores,
+        milestone_group_index,
+        np.tile(
+            milestone_group_scores.milestone_group_ids, len(scored_answer_sessions)
+        ),
+        np.repeat(milestone_group_scores.child_ages, n_groups),
+        milestone_group_scores.scores.ravel(),
+    )
+    # inserted as plain rows rather than ORM objects, of which a full rebuild would
+    # create one for every answer session and milestone group
+    milestone_group_score_rows = [
+        {
+            "answer_session_id": answer_session_id,
+            "milestone_group_id": milestone_group_id,
+            "age": child_age,
+            "score": score,
+        }
+        for answer_session_id, child_age, session_scores in zip(
+            milestone_group_scores.answer_session_ids.tolist(),
+            milestone_group_scores.child_ages.tolist(),
+            milestone_group_scores.scores.tolist(),
+            strict=True,
+        )
+        for milestone_group_id, score in zip(
+            milestone_group_scores.milestone_group_ids.tolist(),
+            session_scores,
+            strict=True,
+        )
+    ]
+    if milestone_group_score_rows:
+        session.execute(
+            insert(MilestoneGroupAnswerSessionScore), milestone_group_score_rows
+        )
 
-    # save statistics
-    logger.info("  - saving milestone statistics")
-    for milestone in milestones:
-        save_milestone_statistics(
-            session,
-            milestone.id,  # type: ignore
-            m_counts[milestone.id],  # type: ignore
-            milestone_curves[milestone.id],  # type: ignore
+    # record which answer sessions the statistics now include
+    update_answer_sessions(
+        session,
+        removed_answer_session_ids,  # type: ignore
+        included_in_statistics=False,
+    )
+    for start in range(0, len(removed_answer_session_ids), MAX_IDS_PER_QUERY):
+        session.execute(
+            delete(MilestoneAnswerSessionStatistics).where(
+                col(MilestoneAnswerSessionStatistics.answer_session_id).in_(
+                    removed_answer_session_ids[start : start + MAX_IDS_PER_QUERY]
+                )
+            )
         )
-    logger.info("  - saving milestone group statistics")
-    for milestone_group_id in session.exec(select(MilestoneGroup.id)).all():
-        save_milestone_group_statistics(
-            session,
-            milestone_group_id,  # type: ignore
-            mg_counts[milestone_group_id],
-            mg_sum_scores[milestone_group_id],
-            mg_sum_squaredscores[milestone_group_id],
+    update_answer_sessions(
+        session,
+        [answer_session.id for answer_session in added_answer_sessions],  # type: ignore
+        included_in_statistics=True,
+    )
+    if added_answer_sessions:
+        session.execute(
+            insert(MilestoneAnswerSessionStatistics),
+            [
+                {
+                    "answer_session_id": answer_session.id,
+                    "child_age": added_child_ages[answer_session.id],  # type: ignore
+                }
+                for answer_session in added_answer_sessions
+            ],
         )
+    if statistics_state is None:
+        statistics_state = StatisticsState(id=1)
+    statistics_state.milestone_groups_hash = milestone_groups_hash
+    statistics_state.answer_sessions = len(
+        included_child_ages.keys() & answer_session_ids
+    ) + len(added_answer_sessions)
+    statistics_state.updated_at = datetime.datetime.now()
+    session.add(statistics_state)
+
+    # save the statistics as a new version, which readers switch to when this commits:
+    # until then they keep reading the previous version, which is left in place for
+    # those that are still reading it afterwards
+    start_phase("saving statistics")
+    previous_version = get_statistics_version(session)
+    version = new_statistics_version(session, previous_version)
+    logger.info(f"    - saving milestone statistics version {version}")
+    save_milestone_statistics(
+        session,
+        version,
+        milestone_index,
+        m_counts,
+        milestone_curves,  # type: ignore
+        curve_fit_hashes,  # type: ignore
+    )
+    logger.info("    - saving milestone group statistics")
+    save_milestone_group_statistics(
+        session,
+        version,
+        milestone_group_index,
+        mg_counts,
+        mg_sum_scores,
+        mg_sum_squaredscores,
+    )
+    save_expected_milestone_answers(session, version, expected_answers)
+    statistics_state.version = version
+    delete_statistics_versions(session, keep=(previous_version, version))
 
     session.commit()
     logger.info("  - done")
     return StatisticsUpdateResult(
-        answer_sessions=num_answer_sessions,
-        answers=num_answers,
+        answer_sessions=statistics_state.answer_sessions,
+        answers=int(m_counts.sum()),
         runtime_seconds=time.monotonic() - start_time,
+        full_rebuild=full_rebuild,
     )
 
 
+def new_statistics_version(session: SessionDep, current_version: int) -> int:
+    """A statistics version after the current one, that has no statistics stored yet."""
+    stored_versions = [
+        session.exec(select(func.max(col(model.version)))).one()  # type: ignore
+        for model in (MilestoneAgeScoreCollection, MilestoneGroupAgeScoreCollection)
+    ]
+    return max([current_version, *(v for v in stored_versions if v is not None)]) + 1
+
+
+def delete_statistics_versions(session: SessionDep, keep: Iterable[int]) -> None:
+    """Delete the stored statistics of every version except these."""
+    keep = list(keep)
+    for model in (
+        MilestoneAgeScore,
+        MilestoneAgeScoreCollection,
+        MilestoneGroupAgeScore,
+        MilestoneGroupAgeScoreCollection,
+        MilestoneExpectedAnswers,
+    ):
+        session.execute(delete(model).where(col(model.version).not_in(keep)))  # type: ignore
+
+
 def save_milestone_statistics(
     session: SessionDep,
-    milestone_id: int,
-    counts: np.ndarray,
-    curve: MilestoneAgeCurve,
+    version: int,
+    milestone_index: IdIndex,
+    m_counts: np.ndarray,
+    milestone_curves: dict[int, MilestoneAgeCurve],
+    curve_fit_hashes: dict[int, str],
 ) -> None:
     """
-    Construct a MilestoneAgeScoreCollection of MilestoneAgeScores for a milestone using the supplied statistics.
+    Store a MilestoneAgeScoreCollection with a MilestoneAgeScore for each child age for
+    each of these milestones, using the supplied statistics. The collections and the
+    scores are each written with a single upsert, however many milestones there are.
 
     Parameters
     ----------
     session: SessionDep
         the database session
-    milestone_id : int
-        id of the milestone to calculate the statistics for
-    counts: np.ndarray
-        the counts of each answer per age in months, where the index corresponds to the age in months, then the answer
-    curve: MilestoneAgeCurve
-        the age curve fitted to `counts` for this milestone
-    """
-    collection = session.get(MilestoneAgeScoreCollection, milestone_id)
-    if collection is None:
-        collection = MilestoneAgeScoreCollection(milestone_id=milestone_id)
-        session.add(collection)
-
+    version: int
+        the statistics version to store them as
+    milestone_index : IdIndex
+        the milestones to store the statistics of, with their row of `m_counts`
+    m_counts: np.ndarray
+        the counts of each answer per milestone, then age in months, then answer
+    milestone_curves: dict[int, MilestoneAgeCurve]
+        the age curve fitted to the counts of each milestone
+    curve_fit_hashes: dict[int, str]
+        the `milestone_age_curve_fit_hash` of the counts of each milestone
+    """
     # only the fit is stored: the expected age and the relevant age range are derived
     # from it whenever they are asked for, see milestone_age_score_collection_public
-    collection.curve_midpoint = curve.midpoint if curve.fit_ok else 0.0
-    collection.curve_steepness = curve.steepness if curve.fit_ok else 0.0
-    collection.curve_fit_ok = curve.fit_ok
-    collection.curve_n_answers = curve.n_answers
-
-    # ensure that we have a MilestoneAgeScore for this milestone for each child age up to the maximum child age
-    if (
-        session.get(
-            MilestoneAgeScore,
-            ({"milestone_id": milestone_id, "age": app_settings.MAX_CHILD_AGE_MONTHS}),
-        )
-        is None
-    ):
-        for age in range(0, app_settings.MAX_CHILD_AGE_MONTHS + 1):
-            score = session.get(
-                MilestoneAgeScore, ({"milestone_id": milestone_id, "age": age})
-            )
-            if score is None:
-                score = MilestoneAgeScore(
-                    age=age,
-                    milestone_id=milestone_id,
-                    c0=0,
-                    c1=0,
-                    c2=0,
-                    c3=0,
-                )
-                session.add(score)
-    # do a bulk update of the MilestoneAgeScores for this milestone
-    session.execute(
-        update(MilestoneAgeScore),
+    upsert(
+        session,
+        MilestoneAgeScoreCollection,
         [
             {
-                "age": age,
+                "version": version,
                 "milestone_id": milestone_id,
-                "c0": int(counts[age][0]),
-                "c1": int(counts[age][1]),
-                "c2": int(counts[age][2]),
-                "c3": int(counts[age][3]),
+                "curve_midpoint": curve.midpoint if curve.fit_ok else 0.0,
+                "curve_steepness": curve.steepness if curve.fit_ok else 0.0,
+                "curve_fit_ok": curve.fit_ok,
+                "curve_n_answers": curve.n_answers,
+                "curve_fit_hash": curve_fit_hashes[milestone_id],
             }
-            for age in range(0, app_settings.MAX_CHILD_AGE_MONTHS + 1)
+            for milestone_id in milestone_index.ids.tolist()
+            for curve in [milestone_curves[milestone_id]]
         ],
+        ["version", "milestone_id"],
+    )
+    upsert(
+        session,
+        MilestoneAgeScore,
+        [
+            {
+                "version": version,
+                "milestone_id": milestone_id,
+                "age": age,
+                "c0": c0,
+                "c1": c1,
+                "c2": c2,
+                "c3": c3,
+            }
+            for milestone_id, counts in zip(
+                milestone_index.ids.tolist(), m_counts.tolist(), strict=True
+            )
+            for age, (c0, c1, c2, c3) in enumerate(counts)
+        ],
+        ["version", "milestone_id", "age"],
     )
 
 
 def save_milestone_group_statistics(
     session: SessionDep,
-    milestone_group_id: int,
-    count: np.ndarray,
-    sum_scores: np.ndarray,
-    sum_squaredscores: np.ndarray,
+    version: int,
+    milestone_group_index: IdIndex,
+    mg_counts: np.ndarray,
+    mg_sum_scores: np.ndarray,
+    mg_sum_squaredscores: np.ndarray,
 ) -> None:
     """
-    Construct a MilestoneGroupAgeScoreCollection of MilestoneGroupAgeScores for a milestone using the supplied statistics.
+    Store a MilestoneGroupAgeScoreCollection with a MilestoneGroupAgeScore for each child
+    age for each of these milestone groups, using the supplied statistics. The
+    collections and the scores are each written with a single upsert, however many
+    milestone groups there are.
 
     Parameters
     ----------
     session: SessionDep
         the database session
-    milestone_group_id : int
-        id of the milestone group to calculate the statistics for
-    count: np.ndarray
-        the count of answers per age in months, where the index corresponds to the age in months
-    sum_scores: np.ndarray
-        the sum of scores per age in months, where the index corresponds to the age in months
-    sum_squaredscores: np.ndarray
-        the sum of scores squared per age in months, where the index corresponds to the age in months
+    version: int
+        the statistics version to store them as
+    milestone_group_index : IdIndex
+        the milestone groups to store the statistics of, with their row of the arrays
+    mg_counts: np.ndarray
+        the count of answers per milestone group, then age in months
+    mg_sum_scores: np.ndarray
+        the sum of scores per milestone group, then age in months
+    mg_sum_squaredscores: np.ndarray
+        the sum of scores squared per milestone group, then age in months
     """
-
-    collection = session.get(MilestoneGroupAgeScoreCollection, milestone_group_id)
-
-    if collection is None:
-        collection = MilestoneGroupAgeScoreCollection(
-            milestone_group_id=milestone_group_id
-        )
-        session.add(collection)
-
-    # ensure that we have a MilestoneGroupAgeScore for this milestone for each child age up to the maximum child age
-    if (
-        session.get(
-            MilestoneGroupAgeScore,
-            (
-                {
-                    "milestone_group_id": milestone_group_id,
-                    "age": app_settings.MAX_CHILD_AGE_MONTHS,
-                }
-            ),
-        )
-        is None
-    ):
-        for age in range(0, app_settings.MAX_CHILD_AGE_MONTHS + 1):
-            score = session.get(
-                MilestoneGroupAgeScore,
-                ({"milestone_group_id": milestone_group_id, "age": age}),
-            )
-            if score is None:
-                score = MilestoneGroupAgeScore(
-                    age=age,
-                    milestone_group_id=milestone_group_id,
-                    count=0,
-                    sum_score=0.0,
-                    sum_squaredscore=0.0,
-                )
-                session.add(score)
-
-    # do a bulk update of the MilestoneGroupAgeScores for this milestone group
-    session.execute(
-        update(MilestoneGroupAgeScore),
+    upsert(
+        session,
+        MilestoneGroupAgeScoreCollection,
+        [
+            {"version": version, "milestone_group_id": milestone_group_id}
+            for milestone_group_id in milestone_group_index.ids.tolist()
+        ],
+        ["version", "milestone_group_id"],
+    )
+    upsert(
+        session,
+        MilestoneGroupAgeScore,
         [
             {
-                "age": age,
+                "version": version,
                 "milestone_group_id": milestone_group_id,
-                "count": int(count[age]),
-                "sum_score": sum_scores[age],
-                "sum_squaredscore": sum_squaredscores[age],
+                "age": age,
+                "count": count,
+                "sum_score": sum_score,
+                "sum_squaredscore": sum_squaredscore,
             }
-            for age in range(0, app_settings.MAX_CHILD_AGE_MONTHS + 1)
+            for milestone_group_id, counts, sum_scores, sum_squaredscores in zip(
+                milestone_group_index.ids.tolist(),
+                mg_counts.tolist(),
+                mg_sum_scores.tolist(),
+                mg_sum_squaredscores.tolist(),
+                strict=True,
+            )
+            for age, (count, sum_score, sum_squaredscore) in enumerate(
+                zip(counts, sum_scores, sum_squaredscores, strict=True)
+            )
         ],
+        ["version", "milestone_group_id", "age"],
     )
 
 
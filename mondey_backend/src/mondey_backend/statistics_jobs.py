@@ -0,0 +1,409 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import datetime
+import logging
+import multiprocessing
+import queue
+import threading
+from collections.abc import Callable
+from collections.abc import Iterator
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+
+from sqlalchemy import Engine
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session
+from sqlmodel import col
+from sqlmodel import create_engine
+from sqlmodel import func
+from sqlmodel import select
+
+from .databases.mondey import engine as mondey_engine
+from .databases.users import engine as users_engine
+from .dependencies import SessionDep
+from .dependencies import UserAsyncSessionDep
+from .logging import logger
+from .models.milestones import StatisticsUpdateJob
+from .models.milestones import StatisticsUpdateJobPhase
+from .models.milestones import StatisticsUpdateJobPublic
+from .models.milestones import StatisticsUpdateJobStatus
+from .models.milestones import StatisticsUpdatePhaseResult
+from .models.milestones import StatisticsUpdateResult
+from .routers.utils import get
+from .settings import app_settings
+from .statistics import STATISTICS_UPDATE_PHASES
+from .statistics import async_update_stats
+
+ACTIVE_STATISTICS_UPDATE_JOB_STATUSES = (
+    StatisticsUpdateJobStatus.queued,
+    StatisticsUpdateJobStatus.running,
+)
+
+# the key of the PostgreSQL advisory lock held while checking for an active statistics
+# update job and starting one, see `statistics_update_lock`
+STATISTICS_UPDATE_LOCK_KEY = 0x4D4F4E44  # "MOND"
+_statistics_update_lock = threading.Lock()
+
+# how often a worker process records on its job that it is still running it, and how
+# long after the last time a queued or running job is taken to have been interrupted
+STATISTICS_UPDATE_HEARTBEAT_SECONDS = 10.0
+STATISTICS_UPDATE_HEARTBEAT_TIMEOUT = datetime.timedelta(minutes=2)
+
+# the worker processes started by this server process, with the queue on which each
+# reports the phases of its statistics update, and the last phase reported by each
+_worker_processes: dict[int, tuple[BaseProcess, Queue]] = {}
+_worker_phases: dict[int, str] = {}
+
+
+def active_statistics_update_jobs():
+    return select(StatisticsUpdateJob).where(
+        col(StatisticsUpdateJob.status).in_(ACTIVE_STATISTICS_UPDATE_JOB_STATUSES)
+    )
+
+
+@contextlib.contextmanager
+def statistics_update_lock(session: SessionDep) -> Iterator[None]:
+    """
+    Hold a lock that only one caller at a time can, for checking whether a statistics
+    update job is active and starting one if not. Without it, the scheduled update and
+    admins asking for one at the same time could each find no active job and start
+    their own update.
+
+    On PostgreSQL this is an advisory lock, which also excludes the other server
+    processes, and which is released when the session's transaction ends. A SQLite
+    database is only used by a single server process, so a lock in this process will do.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        with _statistics_update_lock:
+            yield
+        return
+    session.exec(select(func.pg_advisory_xact_lock(STATISTICS_UPDATE_LOCK_KEY)))
+    try:
+        yield
+    except Exception:
+        session.rollback()
+        raise
+    session.commit()
+
+
+def statistics_update_job_is_interrupted(job: StatisticsUpdateJob) -> bool:
+    """
+    Whether this queued or running job has stopped without recording a result. Its
+    worker process may have been started by another server process, so this goes by
+    the heartbeat that the worker records on the job rather than by the process itself.
+    """
+    last_seen = job.heartbeat_at or job.started_at or job.created_at
+    return datetime.datetime.now() - last_seen > STATISTICS_UPDATE_HEARTBEAT_TIMEOUT
+
+
+def mark_statistics_update_job_failed(job: StatisticsUpdateJob, error: str) -> None:
+    """Mark this job as failed, leaving it to the caller to commit."""
+    logger.warning(f"Statistics update job {job.id} failed: {error}")
+    job.status = StatisticsUpdateJobStatus.failed
+    job.error = error
+    job.finished_at = datetime.datetime.now()
+
+
+def fail_statistics_update_job(
+    session: SessionDep, job: StatisticsUpdateJob, error: str
+) -> None:
+    mark_statistics_update_job_failed(job, error)
+    session.commit()
+
+
+def start_statistics_update_job(
+    session: SessionDep, full_rebuild: bool = False
+) -> StatisticsUpdateJob:
+    """
+    Start a statistics update in a worker process, and return its job without waiting
+    for it to finish: the update does all of its database and numpy work synchronously,
+    so running it in the server process would block every other request meanwhile.
+
+    Only one statistics update runs at a time, so if there is already one queued or
+    running, its job is returned instead of starting another: the caller then follows
+    the progress and the result of that one. A job that has been interrupted is failed
+    instead, so that it does not hold up every later statistics update. It is only
+    committed along with the job that replaces it, since committing releases the lock.
+    """
+    with statistics_update_lock(session):
+        job = session.exec(active_statistics_update_jobs()).first()
+        if job is not None and statistics_update_job_is_interrupted(job):
+            mark_statistics_update_job_failed(
+                job, "The worker process stopped responding"
+            )
+        elif job is not None:
+            logger.info(f"Statistics update job {job.id} is already {job.status}")
+            return job
+        job = StatisticsUpdateJob(
+            full_rebuild=full_rebuild, created_at=datetime.datetime.now()
+        )
+        session.add(job)
+        session.commit()
+    session.refresh(job)
+    logger.info(f"Starting statistics update job {job.id}")
+    start_statistics_update_process(job.id, full_rebuild)  # type: ignore
+    return job
+
+
+def start_statistics_update_process(job_id: int, full_rebuild: bool) -> None:
+    _clean_up_finished_worker_processes()
+    # spawn rather than fork, since this process has other threads running
+    context = multiprocessing.get_context("spawn")
+    progress_queue = context.Queue()
+    process = context.Process(
+        target=run_statistics_update_job,
+        args=(
+            job_id,
+            full_rebuild,
+            mondey_engine.url.render_as_string(hide_password=False),
+            users_engine.url.render_as_string(hide_password=False),
+            progress_queue,
+        ),
+        name=f"statistics-update-{job_id}",
+    )
+    process.start()
+    _worker_processes[job_id] = (process, progress_queue)
+
+
+def run_statistics_update_job(
+    job_id: int,
+    full_rebuild: bool,
+    mondey_db_url: str,
+    users_db_url: str,
+    progress_queue: Queue,
+) -> None:
+    """
+    The entry point of a statistics update worker process. It connects to the databases
+    itself, since a temporary SQLite database is only found again from its url.
+    """
+    logging.basicConfig(
+        level=app_settings.LOG_LEVEL.upper(),
+        format="%(asctime)s.%(msecs)03d :: %(levelname)s :: %(name)s :: %(funcName)s :: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    engine = create_engine(mondey_db_url)
+    user_engine = create_async_engine(users_db_url)
+
+    async def run() -> None:
+        async with AsyncSession(user_engine) as user_session:
+            with Session(engine) as session:
+                await async_run_statistics_update_job(
+                    session,
+                    user_session,
+                    job_id,
+                    full_rebuild,
+                    progress=progress_queue.put,
+                )
+        await user_engine.dispose()
+
+    with statistics_update_heartbeat(engine, job_id):
+        asyncio.run(run())
+    engine.dispose()
+
+
+@contextlib.contextmanager
+def statistics_update_heartbeat(engine: Engine, job_id: int) -> Iterator[None]:
+    """
+    Record on the job every few seconds, until the statistics update is done, that its
+    worker process is still running it, see `statistics_update_job_is_interrupted`.
+    This is done in a thread with its own session, since the update itself does not
+    return to the event loop for the whole of a phase.
+    """
+    stop = threading.Event()
+
+    def beat() -> None:
+        while True:
+            try:
+                with Session(engine) as session:
+                    session.execute(
+                        update(StatisticsUpdateJob)
+                        .where(col(StatisticsUpdateJob.id) == job_id)
+                        .values(heartbeat_at=datetime.datetime.now())
+                    )
+                    session.commit()
+            except Exception:
+                logger.warning(
+                    f"Could not record the heartbeat of statistics update job {job_id}",
+                    exc_info=True,
+                )
+            if stop.wait(STATISTICS_UPDATE_HEARTBEAT_SECONDS):
+                return
+
+    thread = threading.Thread(
+        target=beat, name=f"statistics-update-heartbeat-{job_id}", daemon=True
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+async def async_run_statistics_update_job(
+    session: SessionDep,
+    user_session: UserAsyncSessionDep,
+    job_id: int,
+    full_rebuild: bool,
+    progress: Callable[[str], None] | None = None,
+) -> None:
+    """Run the statistics update of this job, recording its status and result."""
+    job = get(session, StatisticsUpdateJob, job_id)
+    job.status = StatisticsUpdateJobStatus.running
+    job.started_at = datetime.datetime.now()
+    session.commit()
+    try:
+        result = await async_update_stats(
+            session, user_session, full_rebuild, progress=progress
+        )
+    except Exception as e:
+        logger.exception(f"Statistics update job {job_id} failed")
+        session.rollback()
+        job = get(session, StatisticsUpdateJob, job_id)
+        job.status = StatisticsUpdateJobStatus.failed
+        job.error = str(e) or type(e).__name__
+    else:
+        job = get(session, StatisticsUpdateJob, job_id)
+        job.status = StatisticsUpdateJobStatus.succeeded
+        job.full_rebuild = result.full_rebuild
+        job.answer_sessions = result.answer_sessions
+        job.answers = result.answers
+        job.runtime_seconds = result.runtime_seconds
+        job.phases = [
+            StatisticsUpdateJobPhase(order=order, **phase.model_dump())
+            for order, phase in enumerate(result.phases)
+        ]
+    job.finished_at = datetime.datetime.now()
+    session.commit()
+
+
+def _update_worker_process(session: SessionDep, job: StatisticsUpdateJob) -> None:
+    """
+    Collect the phases reported by the worker process of this job, and clean it up once
+    it has finished, marking the job as failed if it exited without recording a result.
+    The worker of a job started by another server process is not known here, so that
+    job is only failed once it has been interrupted.
+    """
+    worker = _worker_processes.get(job.id)  # type: ignore
+    if worker is None:
+        if job.status in ACTIVE_STATISTICS_UPDATE_JOB_STATUSES and (
+            statistics_update_job_is_interrupted(job)
+        ):
+            fail_statistics_update_job(
+                session, job, "The worker process stopped responding"
+            )
+        return
+    process, progress_queue = worker
+    with contextlib.suppress(queue.Empty):
+        while True:
+            _worker_phases[job.id] = progress_queue.get_nowait()  # type: ignore
+    if job.status in ACTIVE_STATISTICS_UPDATE_JOB_STATUSES:
+        if process.exitcode is None:
+            return
+        # the job may have been finished since it was last read
+        session.refresh(job)
+        if job.status in ACTIVE_STATISTICS_UPDATE_JOB_STATUSES:
+            fail_statistics_update_job(
+                session,
+                job,
+                f"The worker process exited with code {process.exitcode}",
+            )
+    # the job has finished, so its worker process has exited or is about to
+    process.join(timeout=10)
+    if process.exitcode is None:
+        return
+    _clean_up_worker_process(job.id)  # type: ignore
+
+
+def _clean_up_worker_process(job_id: int) -> None:
+    process, progress_queue = _worker_processes.pop(job_id)
+    process.join()
+    progress_queue.close()
+    _worker_phases.pop(job_id, None)
+
+
+def _clean_up_finished_worker_processes() -> None:
+    """
+    Clean up the worker processes that have exited, including those of jobs whose status
+    is never asked for, e.g. the scheduled statistics updates, which would otherwise be
+    kept for as long as this server process runs.
+    """
+    for job_id, (process, _) in list(_worker_processes.items()):
+        if process.exitcode is not None:
+            _clean_up_worker_process(job_id)
+
+
+def statistics_update_job_public(job: StatisticsUpdateJob) -> StatisticsUpdateJobPublic:
+    phase = ""
+    progress = 0.0
+    if job.status == StatisticsUpdateJobStatus.succeeded:
+        progress = 1.0
+    elif job.status == StatisticsUpdateJobStatus.running:
+        phase = _worker_phases.get(job.id, "")  # type: ignore
+        if phase in STATISTICS_UPDATE_PHASES:
+            progress = STATISTICS_UPDATE_PHASES.index(phase) / len(
+                STATISTICS_UPDATE_PHASES
+            )
+    result = None
+    if job.status == StatisticsUpdateJobStatus.succeeded:
+        result = StatisticsUpdateResult(
+            answer_sessions=job.answer_sessions,
+            answers=job.answers,
+            runtime_seconds=job.runtime_seconds,
+            full_rebuild=job.full_rebuild,
+            phases=[
+                StatisticsUpdatePhaseResult.model_validate(phase)
+                for phase in job.phases
+            ],
+        )
+    return StatisticsUpdateJobPublic(
+        id=job.id,  # type: ignore
+        status=job.status,  # type: ignore
+        full_rebuild=job.full_rebuild,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        phase=phase,
+        progress=progress,
+        result=result,
+        error=job.error,
+    )
+
+
+def get_statistics_update_job(
+    session: SessionDep, job_id: int
+) -> StatisticsUpdateJobPublic:
+    job = get(session, StatisticsUpdateJob, job_id)
+    session.refresh(job)
+    _update_worker_process(session, job)
+    return statistics_update_job_public(job)
+
+
+def get_statistics_update_jobs(
+    session: SessionDep, limit: int
+) -> list[StatisticsUpdateJobPublic]:
+    """The most recent statistics update jobs, newest first."""
+    return [
+        get_statistics_update_job(session, job.id)  # type: ignore
+        for job in session.exec(
+            select(StatisticsUpdateJob)
+            .order_by(col(StatisticsUpdateJob.id).desc())
+            .limit(limit)
+        ).all()
+    ]
+
+
+def fail_interrupted_statistics_update_jobs(session: SessionDep) -> None:
+    """
+    Mark the statistics update jobs that were interrupted while queued or running, e.g.
+    when the server stopped, as failed. A job with a recent heartbeat is left alone:
+    another server process, e.g. another worker or the one being replaced during
+    a rolling restart, may still be running it.
+    """
+    for job in session.exec(active_statistics_update_jobs()).all():
+        if statistics_update_job_is_interrupted(job):
+            fail_statistics_update_job(session, job, "Interrupted by a server restart")
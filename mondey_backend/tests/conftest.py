@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import datetime
 import pathlib
 
@@ -49,6 +50,9 @@ from mondey_backend.models.research import ResearchGroup
 from mondey_backend.models.users import Base
 from mondey_backend.models.users import User
 from mondey_backend.models.users import UserRead
+from mondey_backend.routers.utils import clear_caches as clear_process_caches
+from mondey_backend.routers.utils import update_child_achieved_milestones
+from mondey_backend.statistics_jobs import async_run_statistics_update_job
 
 
 @pytest.fixture()
@@ -159,6 +163,14 @@ async def user_session(
         yield session
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # each test has a new database, which can have the same versions as the last one
+    clear_process_caches()
+    yield
+    clear_process_caches()
+
+
 @pytest.fixture
 def session(children: list[dict], monkeypatch: pytest.MonkeyPatch):
     # use a new in-memory SQLite database for each test
@@ -717,6 +729,8 @@ def session(children: list[dict], monkeypatch: pytest.MonkeyPatch):
             )
         )
         session.commit()
+        update_child_achieved_milestones(session)
+        session.commit()
         yield session
 
 
@@ -1120,6 +1134,7 @@ def app(
     private_dir: pathlib.Path,
     session: Session,
     user_session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
 ):
     settings.app_settings.STATIC_FILES_PATH = str(static_dir)
     settings.app_settings.PRIVATE_FILES_PATH = str(private_dir)
@@ -1129,6 +1144,18 @@ def app(
     app = create_app()
     app.dependency_overrides[get_session] = lambda: session
     app.dependency_overrides[get_async_session] = lambda: user_session
+
+    # a worker process cannot connect to the in-memory test databases, so statistics
+    # update jobs are run to completion in this process instead
+    def start_statistics_update_process(job_id: int, full_rebuild: bool) -> None:
+        asyncio.run(
+            async_run_statistics_update_job(session, user_session, job_id, full_rebuild)
+        )
+
+    monkeypatch.setattr(
+        "mondey_backend.statistics_jobs.start_statistics_update_process",
+        start_statistics_update_process,
+    )
     yield app
 
 
@@ -13,10 +13,13 @@ from mondey_backend.models.milestones import Milestone
 from mondey_backend.models.milestones import MilestoneAgeScoreCollection
 from mondey_backend.models.milestones import MilestoneAnswer
 from mondey_backend.models.milestones import MilestoneAnswerSession
+from mondey_backend.models.milestones import MilestoneAnswerSessionFeedback
 from mondey_backend.models.milestones import SuspiciousState
 from mondey_backend.models.questions import ChildAnswer
 from mondey_backend.routers.utils import MilestoneAgeCurve
 from mondey_backend.routers.utils import count_milestone_answers_for_milestone
+from mondey_backend.routers.utils import get_milestone_catalogue_version
+from mondey_backend.statistics import STATISTICS_UPDATE_PHASES
 
 
 def test_get_milestone_groups(
@@ -210,6 +213,9 @@ def test_put_milestone_change_group(
     ).all()
     assert len(existing_answers) > 0
     assert all(answer.milestone_group_id == 1 for answer in existing_answers)
+    assert admin_client.get("/users/feedback/answersession=1/detailed").json() == {
+        "1": {"1": 0, "2": 1}
+    }
 
     # move milestone 1 to group 2
     milestone["group_id"] = 2
@@ -231,6 +237,12 @@ def test_put_milestone_change_group(
     assert len(moved_answers) == len(existing_answers)
     assert all(answer.milestone_group_id == 2 for answer in moved_answers)
 
+    # the stored feedback is computed again for the new group
+    assert admin_client.get("/users/feedback/answersession=1/detailed").json() == {
+        "1": {"2": 1},
+        "2": {"1": 0},
+    }
+
     # answers for other milestones are untouched
     other_answers = session.exec(
         select(MilestoneAnswer).where(col(MilestoneAnswer.milestone_id) == 2)
@@ -238,6 +250,31 @@ def test_put_milestone_change_group(
     assert all(answer.milestone_group_id == 1 for answer in other_answers)
 
 
+def test_put_milestone_keeps_stored_feedback_unless_it_changes(
+    admin_client: TestClient, session, milestone_group_admin1: dict
+):
+    milestone = next(m for m in milestone_group_admin1["milestones"] if m["id"] == 1)
+    admin_client.get("/users/feedback/answersession=1/detailed")
+    assert session.get(MilestoneAnswerSessionFeedback, 1) is not None
+    version = get_milestone_catalogue_version(session)
+
+    # the feedback does not depend on the text of a milestone
+    milestone["text"]["en"]["title"] = "a new title"
+    response = admin_client.put("/admin/milestones", json=milestone)
+    assert response.status_code == 200
+    session.expire_all()
+    assert get_milestone_catalogue_version(session) == version + 1
+    assert session.get(MilestoneAnswerSessionFeedback, 1) is not None
+
+    # but it does on its expected age
+    milestone["expected_age_months"] += 1
+    response = admin_client.put("/admin/milestones", json=milestone)
+    assert response.status_code == 200
+    session.expire_all()
+    assert get_milestone_catalogue_version(session) == version + 2
+    assert session.get(MilestoneAnswerSessionFeedback, 1) is None
+
+
 def test_delete_milestone(admin_client: TestClient):
     assert admin_client.get("/milestones/2").status_code == 200
     response = admin_client.delete("/admin/milestones/2?dry_run=false")
@@ -446,6 +483,55 @@ def test_delete_milestone_groups_real(admin_client, session):
     assert response.status_code == 404  # gone for good, because was real, not dry_run.
 
 
+def test_update_stats_returns_job(admin_client: TestClient):
+    response = admin_client.post("/admin/update-stats/")
+    assert response.status_code == 200
+    job = response.json()
+    # in the tests the job runs to completion before the response is returned
+    assert job["status"] == "succeeded"
+    assert job["progress"] == 1.0
+    assert job["result"]["answer_sessions"] == 4
+    assert job["error"] == ""
+
+    response = admin_client.get(f"/admin/update-stats/{job['id']}")
+    assert response.status_code == 200
+    assert response.json() == job
+
+    assert admin_client.get("/admin/update-stats/99").status_code == 404
+
+
+def test_update_stats_job_failed(admin_client: TestClient, mocker):
+    update_stats = mocker.patch(
+        "mondey_backend.statistics_jobs.async_update_stats",
+        side_effect=RuntimeError("out of memory"),
+    )
+    job = admin_client.post("/admin/update-stats/").json()
+    assert job["status"] == "failed"
+    assert job["result"] is None
+    assert job["error"] == "out of memory"
+    # a failed job does not block the next one
+    mocker.stop(update_stats)
+    next_job = admin_client.post("/admin/update-stats/").json()
+    assert next_job["id"] != job["id"]
+    assert next_job["status"] == "succeeded"
+
+
+def test_get_update_stats_jobs(admin_client: TestClient):
+    assert admin_client.get("/admin/update-stats/").json() == []
+    first_job = admin_client.post("/admin/update-stats/").json()
+    second_job = admin_client.post("/admin/update-stats/?full_rebuild=true").json()
+
+    response = admin_client.get("/admin/update-stats/")
+    assert response.status_code == 200
+    assert response.json() == [second_job, first_job]
+    phases = second_job["result"]["phases"]
+    assert [phase["phase"] for phase in phases] == list(STATISTICS_UPDATE_PHASES)
+    assert all(phase["queries"] > 0 for phase in phases)
+
+    response = admin_client.get("/admin/update-stats/?limit=1")
+    assert response.json() == [second_job]
+
+
 def test_get_milestone_answer_sessions(admin_client: TestClient, session):
     # update the stats
     assert admin_client.post("/admin/update-stats/").status_code == 200
@@ -639,7 +725,9 @@ def test_get_milestone_answer_session_analysis_no_answer_session(
 
 def test_recalculate_milestone_age_scores(admin_client: TestClient, session: Session):
     # milestone 1 has a fitted age curve, milestone 2 does not
-    collection = session.get(MilestoneAgeScoreCollection, 1)
+    collection = session.get(
+        MilestoneAgeScoreCollection, {"version": 0, "milestone_id": 1}
+    )
     assert collection is not None
     curve = MilestoneAgeCurve(midpoint=20.0, steepness=0.3, n_answers=500, fit_ok=True)
     collection.curve_midpoint = curve.midpoint
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import datetime
+
 import httpx
 import pytest
 from fastapi import FastAPI
@@ -11,6 +13,7 @@ from sqlmodel import col
 from sqlmodel import select
 
 from mondey_backend.models.children import Child
+from mondey_backend.models.milestones import ChildAchievedMilestone
 from mondey_backend.models.milestones import MilestoneAnswer
 from mondey_backend.models.milestones import MilestoneAnswerSession
 from mondey_backend.models.questions import ChildAnswer
@@ -65,6 +68,16 @@ def _users_mondey_data(session: Session, user_id: int) -> dict[str, int]:
     }
 
 
+def _achieved_milestones(session: Session, child_ids) -> int:
+    return len(
+        session.exec(
+            select(ChildAchievedMilestone).where(
+                col(ChildAchievedMilestone.child_id).in_(child_ids)
+            )
+        ).all()
+    )
+
+
 @pytest.mark.asyncio
 async def test_delete_account_dry_run_deletes_nothing(
     app: FastAPI, user_session: AsyncSession, session: Session
@@ -132,6 +145,15 @@ async def test_delete_account_deletes_user_and_all_their_data(
     child_ids = session.exec(
         select(Child.id).where(col(Child.user_id) == USER_ID)
     ).all()
+    session.add(
+        ChildAchievedMilestone(
+            child_id=child_ids[0],
+            milestone_id=1,
+            achieved_at=datetime.datetime(2024, 1, 1),
+        )
+    )
+    session.commit()
+    assert _achieved_milestones(session, child_ids) > 0
     for child_id in child_ids:
         child_image_path(child_id).parent.mkdir(parents=True, exist_ok=True)
         child_image_path(child_id).write_bytes(b"not really an image")
@@ -160,6 +182,8 @@ async def test_delete_account_deletes_user_and_all_their_data(
         "child_answers": 0,
         "user_answers": 0,
     }
+    # not left for a new child that is given the id of a deleted one
+    assert _achieved_milestones(session, child_ids) == 0
     for child_id in child_ids:
         assert not child_image_path(child_id).is_file()
 
@@ -2,6 +2,8 @@ import pathlib
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session
 
 
 @pytest.mark.parametrize(
@@ -111,3 +113,28 @@ def test_submit_milestone_image_endpoint_removed(
             files={"file": ("img.jpg", f, "image/jpeg")},
         )
     assert response.status_code == 404
+
+
+def test_get_milestone_groups_loads_milestones_with_one_query_each(
+    user_client: TestClient, session: Session
+):
+    # the first request creates the child's current answer session
+    assert user_client.get("/milestone-groups/2").status_code == 200
+    statements = []
+
+    def record_statement(_conn, _cursor, statement, _parameters, _context, _many):
+        statements.append(statement.lower())
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        response = user_client.get("/milestone-groups/2")
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+    assert response.status_code == 200
+    # child 2 is asked about milestones in both milestone groups
+    assert all(milestone_group["milestones"] for milestone_group in response.json())
+    for table in ["milestone", "milestonetext", "milestoneimage", "milestonegrouptext"]:
+        assert [f"from {table} " in statement for statement in statements].count(
+            True
+        ) == 1
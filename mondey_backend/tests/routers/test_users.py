@@ -7,9 +7,13 @@ from sqlalchemy import select
 from sqlmodel import Session
 from sqlmodel import col
 
+from mondey_backend.models.milestones import AdminSettings
+from mondey_backend.models.milestones import ChildAchievedMilestone
 from mondey_backend.models.milestones import Milestone
 from mondey_backend.models.milestones import MilestoneAnswer
 from mondey_backend.models.milestones import MilestoneAnswerSession
+from mondey_backend.models.milestones import MilestoneAnswerSessionFeedback
+from mondey_backend.models.milestones import StatisticsState
 from mondey_backend.models.milestones import SuspiciousState
 from mondey_backend.models.questions import ChildAnswer
 
@@ -446,6 +450,13 @@ def test_update_milestone_answer_no_current_answer_session(
     assert response.status_code == 200
     assert response.json()["answer"] == new_answer_3
     assert response.json()["session_completed"] is True
+    # milestone 5 is recorded as achieved when the answer session is completed
+    achieved = session.get(ChildAchievedMilestone, (2, 5))
+    completed_answer_session = session.get(MilestoneAnswerSession, 100)
+    assert achieved is not None
+    assert completed_answer_session is not None
+    assert achieved.achieved_at == completed_answer_session.created_at
+    assert session.get(ChildAchievedMilestone, (2, 4)) is None
     # modify milestone 3 relevant ages so that it is no longer relevant for a 20 month old child
     milestone3 = session.get(Milestone, 3)
     assert milestone3 is not None
@@ -673,11 +684,142 @@ def test_get_detailed_feedback_for_session(user_client: TestClient):
     assert response.json() == {"1": {"1": 0, "2": 1}}
 
 
+def test_feedback_is_stored_until_the_statistics_change(
+    user_client: TestClient, session: Session
+):
+    summary = user_client.get("/users/feedback/answersession=1/summary").json()
+    detailed = user_client.get("/users/feedback/answersession=1/detailed").json()
+    stored = session.get(MilestoneAnswerSessionFeedback, 1)
+    assert stored is not None
+    assert stored.statistics_version == 0
+    assert stored.summary == summary
+    assert stored.detailed == detailed
+
+    # repeat requests read the stored feedback
+    stored.summary = {"1": 1}
+    stored.detailed = {"1": {"1": -1, "2": 1}}
+    session.add(stored)
+    session.commit()
+    assert user_client.get("/users/feedback/answersession=1/summary").json() == {"1": 1}
+    assert user_client.get("/users/feedback/answersession=1/detailed").json() == {
+        "1": {"1": -1, "2": 1}
+    }
+
+    # once the statistics have been updated it is computed again
+    session.add(StatisticsState(version=1))
+    session.commit()
+    assert user_client.get("/users/feedback/answersession=1/summary").json() == summary
+    assert (
+        user_client.get("/users/feedback/answersession=1/detailed").json() == detailed
+    )
+    session.expire_all()
+    stored = session.get(MilestoneAnswerSessionFeedback, 1)
+    assert stored is not None
+    assert stored.statistics_version == 1
+
+
+def test_feedback_is_not_stored_for_current_answer_session(
+    admin_client: TestClient, session: Session
+):
+    # answer session 6 has not expired, so its answers can still change
+    response = admin_client.get("/users/feedback/answersession=6/detailed")
+    assert response.status_code == 200
+    assert session.get(MilestoneAnswerSessionFeedback, 6) is None
+
+
+def test_feedback_hidden_by_admin_settings(admin_client: TestClient, session: Session):
+    path = "/users/feedback/answersession=1/detailed"
+    assert admin_client.get(path).json() == {"1": {"1": 0, "2": 1}}
+
+    response = admin_client.put("/admin/settings/", json={"hide_all_feedback": True})
+    assert response.status_code == 200
+    assert admin_client.get(path).json() == {}
+    assert admin_client.get("/users/feedback/answersession=1/summary").json() == {}
+
+    # the settings are cached until their version changes, which is how another
+    # process changing them is noticed
+    settings = session.get(AdminSettings, 1)
+    assert settings is not None
+    settings.hide_all_feedback = False
+    session.add(settings)
+    session.commit()
+    assert admin_client.get(path).json() == {}
+    settings.version += 1
+    session.add(settings)
+    session.commit()
+    assert admin_client.get(path).json() == {"1": {"1": 0, "2": 1}}
+
+
 def test_get_detailed_feedback_for_session_invalid(user_client: TestClient):
     response = user_client.get("/users/feedback/answersession=12/detailed")
     assert response.status_code == 404
 
 
+def test_get_feedback_for_child(user_client: TestClient, session: Session):
+    response = user_client.get("/users/feedback/child=1")
+    assert response.status_code == 200
+    feedback = response.json()
+    assert list(feedback["milestone_groups"]) == ["1"]
+    answer_sessions = feedback["answer_sessions"]
+    # the completed answer sessions of child 1, oldest first
+    assert [a["answer_session_id"] for a in answer_sessions] == [1, 2, 4]
+    # the same feedback as for each answer session on its own
+    for answer_session in answer_sessions:
+        answer_session_id = answer_session["answer_session_id"]
+        path = f"/users/feedback/answersession={answer_session_id}"
+        assert answer_session["summary"] == user_client.get(f"{path}/summary").json()
+        assert answer_session["detailed"] == user_client.get(f"{path}/detailed").json()
+        stored = session.get(MilestoneAnswerSessionFeedback, answer_session_id)
+        assert stored is not None
+        assert stored.summary == answer_session["summary"]
+        assert stored.detailed == answer_session["detailed"]
+
+
+def test_get_feedback_for_child_hidden_by_admin_settings(admin_client: TestClient):
+    answer_sessions = admin_client.get("/users/feedback/child=1").json()[
+        "answer_sessions"
+    ]
+    assert answer_sessions[0]["summary"] == {"1": -2}
+    response = admin_client.put(
+        "/admin/settings/", json={"hide_milestone_group_feedback": True}
+    )
+    assert response.status_code == 200
+    answer_sessions = admin_client.get("/users/feedback/child=1").json()[
+        "answer_sessions"
+    ]
+    assert answer_sessions[0]["summary"] == {}
+    assert answer_sessions[0]["detailed"] == {"1": {"1": 0, "2": 1}}
+
+
+def test_hidden_feedback_for_child_is_not_computed(
+    admin_client: TestClient, session: Session
+):
+    session.add(AdminSettings(id=1, hide_all_feedback=True))
+    session.commit()
+    answer_sessions = admin_client.get("/users/feedback/child=1").json()[
+        "answer_sessions"
+    ]
+    assert [a["answer_session_id"] for a in answer_sessions] == [1, 2, 4]
+    assert all(a["summary"] == {} and a["detailed"] == {} for a in answer_sessions)
+    assert session.exec(select(MilestoneAnswerSessionFeedback)).all() == []
+
+    response = admin_client.put(
+        "/admin/settings/",
+        json={"hide_all_feedback": False, "hide_milestone_group_feedback": True},
+    )
+    assert response.status_code == 200
+    admin_client.get("/users/feedback/child=1")
+    stored = session.get(MilestoneAnswerSessionFeedback, 1)
+    assert stored is not None
+    assert stored.summary is None
+    assert stored.detailed == {"1": {"1": 0, "2": 1}}
+
+
+def test_get_feedback_for_child_rejects_non_owner(user_client2: TestClient):
+    response = user_client2.get("/users/feedback/child=1")
+    assert response.status_code == 404
+
+
 def test_get_milestone_answer_sessions_for_statistics(user_client: TestClient):
     response = user_client.get("/users/milestone-answers-sessions/2")
     assert response.status_code == 200
@@ -1,7 +1,9 @@
 import datetime
 
 from sqlalchemy import event
+from sqlmodel import select
 
+from mondey_backend.models.milestones import ChildAchievedMilestone
 from mondey_backend.models.milestones import MilestoneAnswer
 from mondey_backend.models.milestones import MilestoneAnswerSession
 from mondey_backend.models.milestones import SuspiciousState
@@ -9,6 +11,7 @@ from mondey_backend.routers.utils import get_previously_achieved_milestone_ids
 from mondey_backend.routers.utils import (
     iter_sessions_with_previously_achieved_milestone_ids,
 )
+from mondey_backend.routers.utils import update_child_achieved_milestones
 
 
 def make_session(
@@ -43,6 +46,8 @@ def make_session(
             )
         )
     session.commit()
+    update_child_achieved_milestones(session, [child_id])
+    session.commit()
 
 
 def prior_achievements_by_session(session, *session_ids: int) -> dict[int, set[int]]:
@@ -212,3 +217,30 @@ def test_iter_sessions_reads_achievement_history_with_one_query(session):
 
     assert snapshots == [{1}, {1, 2}, {1, 2, 3}, {1, 2, 3, 4}]
     assert len(select_statements) == 1
+
+
+def test_update_child_achieved_milestones_records_first_achievement(session):
+    make_session(session, 241, 24, day=5, answers={1: 3, 2: 3})
+    make_session(session, 242, 24, day=2, answers={1: 3, 2: 1, 3: 0})
+    # an answer session that was not completed does not count
+    make_session(session, 243, 24, day=1, answers={2: 3}, completed=False)
+    achieved = {
+        row.milestone_id: row.achieved_at
+        for row in session.exec(
+            select(ChildAchievedMilestone).where(ChildAchievedMilestone.child_id == 24)
+        ).all()
+    }
+    assert achieved == {
+        1: datetime.datetime(2025, 1, 2),
+        2: datetime.datetime(2025, 1, 5),
+    }
+
+    # recalculating all children gives the same result
+    update_child_achieved_milestones(session)
+    session.commit()
+    assert get_previously_achieved_milestone_ids(
+        session, 24, datetime.datetime(2025, 1, 5)
+    ) == {1}
+    assert get_previously_achieved_milestone_ids(
+        session, 24, datetime.datetime(2025, 1, 6)
+    ) == {1, 2}
@@ -0,0 +1,32 @@
+from mondey_backend.benchmark import BENCHMARKS
+from mondey_backend.benchmark import BenchmarkResult
+from mondey_backend.benchmark import compare_to_baseline
+from mondey_backend.benchmark import measure
+from mondey_backend.benchmark import prepare_dataset
+
+
+def test_compare_to_baseline():
+    results = [
+        BenchmarkResult("a", 10, seconds=1.4, peak_memory_bytes=100, repeats=3),
+        BenchmarkResult("a", 100, seconds=1.6, peak_memory_bytes=130, repeats=3),
+        BenchmarkResult("b", 10, seconds=9.0, peak_memory_bytes=900, repeats=3),
+    ]
+    baseline = {
+        "a[10]": {"seconds": 1.0, "peak_memory_bytes": 100},
+        "a[100]": {"seconds": 1.0, "peak_memory_bytes": 100},
+    }
+    regressions = compare_to_baseline(results, baseline, 0.5, 0.2)
+    assert len(regressions) == 2
+    assert all(regression.startswith("a[100]") for regression in regressions)
+    assert compare_to_baseline(results, baseline, 1.0, 0.5) == []
+
+
+def test_benchmarks_run_on_a_small_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr("mondey_backend.benchmark.REQUESTS_PER_REPEAT", 5)
+    dataset = prepare_dataset(tmp_path, 30, seed=0)
+    for name in BENCHMARKS:
+        result = measure(name, dataset, repeats=1, seed=0)
+        assert result.key == f"{name}[30]"
+        assert len(result.times) == 1
+        assert result.seconds > 0
+        assert result.peak_memory_bytes > 0
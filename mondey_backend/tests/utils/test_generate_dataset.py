@@ -0,0 +1,74 @@
+import datetime
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session
+from sqlmodel import SQLModel
+from sqlmodel import create_engine
+from sqlmodel import select
+
+from mondey_backend.generate_dataset import generate_dataset
+from mondey_backend.models.children import Child
+from mondey_backend.models.milestones import Language
+from mondey_backend.models.milestones import MilestoneAnswer
+from mondey_backend.models.milestones import MilestoneAnswerSession
+from mondey_backend.models.questions import ChildAnswer
+from mondey_backend.models.questions import UserAnswer
+from mondey_backend.routers.utils import get_child_age_in_months
+from mondey_backend.routers.utils import get_milestone_curves
+from mondey_backend.settings import app_settings
+from mondey_backend.statistics import async_update_stats
+
+
+def generated_dataset(seed: int) -> Session:
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    session = Session(engine)
+    session.add_all([Language(id="de"), Language(id="en")])
+    session.commit()
+    generate_dataset(session, 400, seed=seed, milestone_groups=2)
+    return session
+
+
+def milestone_answers(session: Session) -> list[tuple[int | None, int | None, int]]:
+    return [
+        (answer.answer_session_id, answer.milestone_id, answer.answer)
+        for answer in session.exec(select(MilestoneAnswer)).all()
+    ]
+
+
+def test_generate_dataset_is_reproducible():
+    with generated_dataset(1) as session, generated_dataset(1) as same_session:
+        assert milestone_answers(session) == milestone_answers(same_session)
+    with generated_dataset(1) as session, generated_dataset(2) as other_session:
+        assert milestone_answers(session) != milestone_answers(other_session)
+
+
+def test_generate_dataset_children_and_answer_sessions():
+    with generated_dataset(0) as session:
+        children = session.exec(select(Child)).all()
+        assert len(children) == 400
+        assert len(session.exec(select(ChildAnswer)).all()) == 400 * 3
+        parent_ids = {child.user_id for child in children}
+        assert len(session.exec(select(UserAnswer)).all()) == len(parent_ids) * 2
+        answer_sessions = session.exec(select(MilestoneAnswerSession)).all()
+        assert len(answer_sessions) >= 400
+        for answer_session in answer_sessions:
+            child = session.get(Child, answer_session.child_id)
+            child_age = get_child_age_in_months(child, answer_session.created_at)
+            assert 0 <= child_age <= app_settings.MAX_CHILD_AGE_MONTHS
+            assert answer_session.answers
+            assert answer_session.created_at < datetime.datetime(2026, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_generated_dataset_fits_milestone_age_curves(user_session):
+    with generated_dataset(0) as session:
+        result = await async_update_stats(session, user_session)
+        assert result.answer_sessions > 400
+        curves = get_milestone_curves(session)
+        assert sum(curve is not None for curve in curves.values()) > len(curves) / 2
@@ -7,7 +7,11 @@ from mondey_backend.routers.utils import MEAN_ANSWER_MIDPOINT
 from mondey_backend.routers.utils import MilestoneAgeCurve
 from mondey_backend.routers.utils import fit_milestone_age_curve
 from mondey_backend.routers.utils import get_milestone_ages_from_curve
+from mondey_backend.routers.utils import milestone_age_curve_fit_hash
 from mondey_backend.settings import app_settings
+from mondey_backend.statistics import IdIndex
+from mondey_backend.statistics import curve_fit_workers
+from mondey_backend.statistics import fit_milestone_age_curves
 
 DEFAULT_PARAMS = MilestoneAgeCurveParams()
 
@@ -274,3 +278,67 @@ def test_fit_is_robust_to_a_noisy_sparse_age():
     noisy = fit_milestone_age_curve(counts)
     assert noisy.fit_ok
     assert noisy.midpoint == pytest.approx(clean.midpoint, abs=1.0)
+
+
+@pytest.mark.asyncio
+async def test_fit_milestone_age_curves_in_worker_processes_matches_in_process():
+    m_counts = np.stack(
+        [
+            counts_from_curve(midpoint, 0.3)
+            for midpoint in np.linspace(5.0, 60.0, num=20)
+        ]
+        + [make_counts({10: [3, 0, 0, 0]})]
+    )
+    milestone_ids = list(range(m_counts.shape[0]))
+
+    milestone_index = IdIndex.from_ids(milestone_ids)
+    in_process = await fit_milestone_age_curves(
+        m_counts, milestone_index, milestone_ids, workers=1
+    )
+    in_workers = await fit_milestone_age_curves(
+        m_counts, milestone_index, milestone_ids, workers=2
+    )
+
+    assert in_workers == in_process
+    assert not in_process[milestone_ids[-1]].fit_ok
+
+
+@pytest.mark.asyncio
+async def test_fit_milestone_age_curves_workers_use_current_settings(monkeypatch):
+    monkeypatch.setattr(app_settings, "MILESTONE_MIN_ANSWERS_FOR_CURVE_FIT", 10**6)
+    m_counts = np.stack([counts_from_curve(24.0, 0.3), counts_from_curve(36.0, 0.3)])
+
+    curves = await fit_milestone_age_curves(
+        m_counts, IdIndex.from_ids([0, 1]), [0, 1], workers=2
+    )
+
+    assert not any(curve.fit_ok for curve in curves.values())
+
+
+def test_curve_fit_workers(monkeypatch):
+    monkeypatch.setattr(app_settings, "STATS_CURVE_FIT_WORKERS", 4)
+    assert curve_fit_workers(10) == 1
+    assert curve_fit_workers(60) == 2
+    assert curve_fit_workers(1000) == 4
+
+
+def test_milestone_age_curve_fit_hash(monkeypatch):
+    counts = counts_from_curve(30.0, 0.3)
+    curve_fit_hash = milestone_age_curve_fit_hash(counts)
+    assert milestone_age_curve_fit_hash(counts.copy()) == curve_fit_hash
+
+    changed_counts = counts.copy()
+    changed_counts[10][0] += 1
+    assert milestone_age_curve_fit_hash(changed_counts) != curve_fit_hash
+
+    monkeypatch.setattr(app_settings, "MILESTONE_MIN_ANSWERS_FOR_CURVE_FIT", 1)
+    assert milestone_age_curve_fit_hash(counts) != curve_fit_hash
+
+
+def test_fit_from_initial_guess_matches_fit_from_counts():
+    counts = counts_from_curve(30.0, 0.3)
+    curve = fit_milestone_age_curve(counts)
+    warm_started = fit_milestone_age_curve(counts, initial_guess=(28.0, 0.25))
+    assert warm_started.fit_ok
+    assert warm_started.midpoint == pytest.approx(curve.midpoint, abs=1e-3)
+    assert warm_started.steepness == pytest.approx(curve.steepness, abs=1e-3)
@@ -1,14 +1,24 @@
 import numpy as np
 import pytest
+from fastapi import BackgroundTasks
+from sqlalchemy import event
+from sqlmodel import select
 
+from mondey_backend.models.children import Child
+from mondey_backend.models.milestones import Milestone
 from mondey_backend.models.milestones import MilestoneAnswerSession
+from mondey_backend.models.milestones import MilestoneAnswerSessionFeedback
 from mondey_backend.models.milestones import MilestoneGroupAgeScore
 from mondey_backend.models.milestones import MilestoneGroupAgeScoreCollection
 from mondey_backend.routers.scores import TrafficLight
 from mondey_backend.routers.scores import compute_feedback_milestone_group
 from mondey_backend.routers.scores import compute_milestonegroup_feedback_detailed
 from mondey_backend.routers.scores import compute_milestonegroup_feedback_summary
+from mondey_backend.routers.scores import get_child_feedback
+from mondey_backend.routers.scores import get_milestone_catalogue
 from mondey_backend.routers.utils import get_milestonegroups_for_answersession
+from mondey_backend.routers.utils import get_statistics_version
+from mondey_backend.routers.utils import milestone_catalogue_changed
 from mondey_backend.statistics import async_update_stats
 
 
@@ -101,7 +111,10 @@ async def test_compute_summary_milestonegroup_feedback_for_answersession_with_re
 ):
     child_age = 8
     existing_age_8_milestone_group1_scores = [np.mean([1, 0, 0])]  # existing statistics
-    statistics = session.get(MilestoneGroupAgeScoreCollection, 1)
+    statistics = session.get(
+        MilestoneGroupAgeScoreCollection,
+        {"version": get_statistics_version(session), "milestone_group_id": 1},
+    )
     assert statistics.scores[child_age].mean == pytest.approx(
         np.mean(existing_age_8_milestone_group1_scores)
     )
@@ -126,7 +139,10 @@ async def test_compute_summary_milestonegroup_feedback_for_answersession_with_re
     # age, so no milestone age curve can be fitted and the milestone group statistics
     # are left empty (see test_calculate_milestonegroup_statistics).
     await async_update_stats(session, user_session)
-    statistics = session.get(MilestoneGroupAgeScoreCollection, 1)
+    statistics = session.get(
+        MilestoneGroupAgeScoreCollection,
+        {"version": get_statistics_version(session), "milestone_group_id": 1},
+    )
     assert statistics.scores[child_age].count == 0
     assert statistics.scores[child_age].mean == 0
     assert statistics.scores[child_age].stddev == 0
@@ -168,3 +184,85 @@ async def test_compute_detailed_milestonegroup_feedback_for_answersession(
     assert feedback[1][1] == TrafficLight.yellow.value
     # milestone 2 expected age 12, child age 8 -> green
     assert feedback[1][2] == TrafficLight.green.value
+
+
+def test_feedback_uses_milestone_catalogue_until_it_changes(session):
+    answersession = session.get(MilestoneAnswerSession, 1)
+    feedback = compute_milestonegroup_feedback_detailed(session, answersession)
+    assert feedback[1][1] == TrafficLight.yellow.value
+    # milestone 1 changed without marking the milestones as changed: the cached
+    # catalogue is still used
+    milestone = session.get(Milestone, 1)
+    milestone.expected_age_months = 10
+    session.add(milestone)
+    session.commit()
+    assert get_milestone_catalogue(session) is get_milestone_catalogue(session)
+    feedback = compute_milestonegroup_feedback_detailed(session, answersession)
+    assert feedback[1][1] == TrafficLight.yellow.value
+    milestone_catalogue_changed(session)
+    session.commit()
+    feedback = compute_milestonegroup_feedback_detailed(session, answersession)
+    # milestone 1 expected age 10, child age 8 -> green
+    assert feedback[1][1] == TrafficLight.green.value
+
+
+def test_feedback_does_not_query_milestones(session):
+    answersession = session.get(MilestoneAnswerSession, 1)
+    compute_milestonegroup_feedback_summary(session, answersession)
+    session.expire_all()
+    statements = []
+
+    def record_statement(_conn, _cursor, statement, _parameters, _context, _many):
+        statements.append(statement.lower())
+
+    answersession = session.get(MilestoneAnswerSession, 1)
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        summary = compute_milestonegroup_feedback_summary(session, answersession)
+        detailed = compute_milestonegroup_feedback_detailed(session, answersession)
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+
+    assert summary == {1: TrafficLight.invalid.value}
+    assert detailed == {1: {1: TrafficLight.yellow.value, 2: TrafficLight.green.value}}
+    assert not any("from milestone " in statement for statement in statements)
+    # the statistics of all milestone groups are read with a single query
+    assert [
+        "from milestonegroupagescore " in statement for statement in statements
+    ].count(True) == 1
+
+
+def test_child_feedback_is_stored_by_a_background_task(session):
+    child = session.get(Child, 1)
+    answersessions = session.exec(
+        select(MilestoneAnswerSession)
+        .where(MilestoneAnswerSession.child_id == 1)
+        .where(MilestoneAnswerSession.completed)
+    ).all()
+    background_tasks = BackgroundTasks()
+    statements = []
+
+    def record_statement(_conn, _cursor, statement, _parameters, _context, _many):
+        statements.append(statement.lower())
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        feedback = get_child_feedback(session, child, answersessions, background_tasks)
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+    assert all(statement.startswith("select") for statement in statements)
+    assert session.exec(select(MilestoneAnswerSessionFeedback)).all() == []
+
+    # the feedback is stored once the response has been sent
+    assert len(background_tasks.tasks) == 1
+    task = background_tasks.tasks[0]
+    task.func(*task.args, **task.kwargs)
+    session.expire_all()
+    for answersession, summary, detailed in feedback:
+        stored = session.get(MilestoneAnswerSessionFeedback, answersession.id)
+        assert stored.summary == {str(k): v for k, v in summary.items()}
+        assert stored.detailed == {
+            str(k): {str(m): f for m, f in v.items()} for k, v in detailed.items()
+        }
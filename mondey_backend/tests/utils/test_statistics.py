@@ -1,22 +1,138 @@
 import datetime
+import tracemalloc
 
 import numpy as np
 import pandas as pd
 import pytest
 from dateutil.relativedelta import relativedelta
 from sqlalchemy import event
+from sqlmodel import Session
+from sqlmodel import SQLModel
+from sqlmodel import create_engine
+from sqlmodel import select
 
+from mondey_backend import statistics
 from mondey_backend.models.children import Child
+from mondey_backend.models.milestones import ChildAchievedMilestone
+from mondey_backend.models.milestones import Milestone
 from mondey_backend.models.milestones import MilestoneAgeScore
 from mondey_backend.models.milestones import MilestoneAgeScoreCollection
 from mondey_backend.models.milestones import MilestoneAnswer
 from mondey_backend.models.milestones import MilestoneAnswerSession
+from mondey_backend.models.milestones import MilestoneAnswerSessionStatistics
+from mondey_backend.models.milestones import MilestoneExpectedAnswers
 from mondey_backend.models.milestones import MilestoneGroup
+from mondey_backend.models.milestones import MilestoneGroupAgeScore
 from mondey_backend.models.milestones import MilestoneGroupAgeScoreCollection
+from mondey_backend.models.milestones import MilestoneGroupAnswerSessionScore
+from mondey_backend.models.milestones import StatisticsState
 from mondey_backend.models.milestones import SuspiciousState
+from mondey_backend.routers.scores import compute_milestonegroup_scores
+from mondey_backend.routers.utils import MilestoneAgeCurve
+from mondey_backend.routers.utils import get_milestone_curves
+from mondey_backend.routers.utils import get_statistics_version
+from mondey_backend.routers.utils import (
+    iter_sessions_with_previously_achieved_milestone_ids,
+)
+from mondey_backend.routers.utils import update_child_achieved_milestones
+from mondey_backend.settings import app_settings
+from mondey_backend.statistics import STATISTICS_UPDATE_PHASES
+from mondey_backend.statistics import IdIndex
+from mondey_backend.statistics import StatisticsUpdateProfiler
 from mondey_backend.statistics import analyse_answer_session
+from mondey_backend.statistics import analyse_answer_sessions
 from mondey_backend.statistics import async_update_stats
+from mondey_backend.statistics import calculate_milestone_group_scores
+from mondey_backend.statistics import calculate_milestone_group_scores_in_shards
+from mondey_backend.statistics import count_milestone_answers
+from mondey_backend.statistics import count_milestone_answers_in_shards
+from mondey_backend.statistics import expected_milestone_answers
+from mondey_backend.statistics import flag_incomplete_answer_sessions
+from mondey_backend.statistics import flag_suspicious_answer_sessions
+from mondey_backend.statistics import get_expected_milestone_answers
+from mondey_backend.statistics import load_milestone_counts
 from mondey_backend.statistics import make_datatable
+from mondey_backend.statistics import save_milestone_group_statistics
+from mondey_backend.statistics import save_milestone_statistics
+
+
+def add_answer_sessions_with_age_curves(session, child_ids) -> None:
+    """
+    Add a completed answer session for each child, spread over all child ages, whose
+    answers to milestones 1 to 5 follow logistic age curves with midpoints 6, 12, 18, 24
+    and 30 months, so that an age curve can be fitted to every milestone.
+    """
+    created_at = datetime.datetime(2025, 1, 15)
+    for child_id in child_ids:
+        child_age = child_id % 73
+        birth = created_at - relativedelta(months=child_age)
+        session.add(
+            Child(
+                id=child_id,
+                user_id=3,
+                name=f"child{child_id}",
+                birth_year=birth.year,
+                birth_month=birth.month,
+                has_image=False,
+            )
+        )
+        session.add(
+            MilestoneAnswerSession(
+                id=child_id,
+                child_id=child_id,
+                user_id=3,
+                created_at=created_at,
+                expired=True,
+                completed=True,
+                included_in_statistics=False,
+                suspicious_state=SuspiciousState.not_suspicious,
+            )
+        )
+        for milestone_id in range(1, 6):
+            mean_answer = 3.0 / (1.0 + np.exp(-0.5 * (child_age - 6 * milestone_id)))
+            session.add(
+                MilestoneAnswer(
+                    answer_session_id=child_id,
+                    milestone_id=milestone_id,
+                    milestone_group_id=1 if milestone_id <= 3 else 2,
+                    answer=round(mean_answer),
+                )
+            )
+    session.commit()
+
+
+def current_version(session, **ident) -> dict[str, int]:
+    """The primary key of the statistics row with this `ident` in the current version."""
+    return {"version": get_statistics_version(session), **ident}
+
+
+def milestone_counts(session) -> dict[tuple[int, int], tuple[int, int, int, int]]:
+    return {
+        (score.milestone_id, score.age): (score.c0, score.c1, score.c2, score.c3)
+        for score in session.exec(
+            select(MilestoneAgeScore).where(
+                MilestoneAgeScore.version == get_statistics_version(session)
+            )
+        ).all()
+    }
+
+
+def milestone_group_counts(session) -> dict[tuple[int, int], int]:
+    return {
+        (score.milestone_group_id, score.age): score.count
+        for score in session.exec(
+            select(MilestoneGroupAgeScore).where(
+                MilestoneGroupAgeScore.version == get_statistics_version(session)
+            )
+        ).all()
+    }
+
+
+def milestone_group_answer_session_scores(session) -> dict[tuple[int, int], float]:
+    return {
+        (score.answer_session_id, score.milestone_group_id): score.score
+        for score in session.exec(select(MilestoneGroupAnswerSessionScore)).all()
+    }
 
 
 def test_rms_analysis_does_not_load_display_metadata(session):
@@ -74,8 +190,12 @@ def test_milestone_age_score_one_sample():
 
 @pytest.mark.asyncio
 async def test_calculate_milestone_statistics_by_age(session, user_session):
-    m1 = session.get(MilestoneAgeScoreCollection, 1)
-    m2 = session.get(MilestoneAgeScoreCollection, 2)
+    m1 = session.get(
+        MilestoneAgeScoreCollection, current_version(session, milestone_id=1)
+    )
+    m2 = session.get(
+        MilestoneAgeScoreCollection, current_version(session, milestone_id=2)
+    )
 
     # existing stats (only answer session 1)
     assert m1.milestone_id == 1
@@ -90,8 +210,12 @@ async def test_calculate_milestone_statistics_by_age(session, user_session):
 
     # updated stats (answer sessions 1, 2, 4)
     await async_update_stats(session, user_session)
-    m1 = session.get(MilestoneAgeScoreCollection, 1)
-    m2 = session.get(MilestoneAgeScoreCollection, 2)
+    m1 = session.get(
+        MilestoneAgeScoreCollection, current_version(session, milestone_id=1)
+    )
+    m2 = session.get(
+        MilestoneAgeScoreCollection, current_version(session, milestone_id=2)
+    )
 
     assert m1.milestone_id == 1
     # not enough answers to fit an age curve, so there is no automatic age estimate and
@@ -112,7 +236,9 @@ async def test_calculate_milestone_statistics_by_age(session, user_session):
 
 @pytest.mark.asyncio
 async def test_calculate_milestonegroup_statistics(session, user_session):
-    mg = session.get(MilestoneGroupAgeScoreCollection, 1)
+    mg = session.get(
+        MilestoneGroupAgeScoreCollection, current_version(session, milestone_group_id=1)
+    )
 
     # existing stats (only answer session 1)
     answers = [np.mean([1, 0, 0])]
@@ -127,7 +253,9 @@ async def test_calculate_milestonegroup_statistics(session, user_session):
     # impute for a milestone that an answer session does not contain, so no milestone
     # contributes to the milestone group statistics and they are left empty.
     await async_update_stats(session, user_session)
-    mg = session.get(MilestoneGroupAgeScoreCollection, 1)
+    mg = session.get(
+        MilestoneGroupAgeScoreCollection, current_version(session, milestone_group_id=1)
+    )
 
     assert mg.milestone_group_id == 1
     assert mg.scores[8].count == 0
@@ -173,6 +301,48 @@ def test_analyse_answer_session_ignores_ages_with_no_answers(session):
     assert analysis.rms == 0.0
 
 
+@pytest.mark.asyncio
+async def test_analyse_answer_sessions_matches_per_session_analysis(
+    session, user_session
+):
+    add_answer_sessions_with_age_curves(session, range(100, 246))
+    await async_update_stats(session, user_session)
+    add_answer_sessions_with_age_curves(session, range(300, 400))
+    rng = np.random.default_rng(42)
+    for answer in session.exec(
+        select(MilestoneAnswer).where(MilestoneAnswer.answer_session_id >= 300)
+    ).all():
+        answer.answer = int(rng.integers(-1, 4))
+    # children born after their answer session, or too old to analyse
+    session.get(Child, 300).birth_year = 2026
+    session.get(Child, 301).birth_year = 2010
+    session.commit()
+    milestone_curves = dict(get_milestone_curves(session))
+    # milestone 5 falls back to the stored mean answer at each age
+    milestone_curves.pop(5)
+    milestone_index = IdIndex.from_ids(range(1, 6))
+    m_counts = np.zeros(
+        (len(milestone_index), app_settings.MAX_CHILD_AGE_MONTHS + 1, 4),
+        dtype=np.uint32,
+    )
+    load_milestone_counts(session, m_counts, milestone_index)
+    expected_answers = expected_milestone_answers(
+        milestone_index, m_counts, milestone_curves
+    )
+    answer_session_ids = [*range(1, 7), *range(300, 400)]
+
+    rms = analyse_answer_sessions(session, answer_session_ids, expected_answers)
+
+    assert rms.keys() == set(answer_session_ids)
+    for answer_session_id in answer_session_ids:
+        analysis = analyse_answer_session(
+            session,
+            session.get(MilestoneAnswerSession, answer_session_id),
+            expected_answers=expected_answers,
+        )
+        assert rms[answer_session_id] == pytest.approx(analysis.rms, rel=1e-12)
+
+
 @pytest.mark.asyncio
 async def test_calculate_statistics_with_empty_milestone_group(session, user_session):
     # a milestone group with no milestones must not break the statistics update:
@@ -184,7 +354,10 @@ async def test_calculate_statistics_with_empty_milestone_group(session, user_ses
     result = await async_update_stats(session, user_session)
     assert result.answer_sessions > 0
 
-    mg = session.get(MilestoneGroupAgeScoreCollection, 99)
+    mg = session.get(
+        MilestoneGroupAgeScoreCollection,
+        current_version(session, milestone_group_id=99),
+    )
     assert mg is not None
     for score in mg.scores:
         assert score.count == 0
@@ -194,6 +367,640 @@ async def test_calculate_statistics_with_empty_milestone_group(session, user_ses
         assert score.sum_squaredscore == 0.0
 
 
+@pytest.mark.asyncio
+async def test_incremental_update_only_adds_new_answer_sessions(session, user_session):
+    add_answer_sessions_with_age_curves(session, range(100, 246))
+    result = await async_update_stats(session, user_session)
+    # there are no stored statistics to build on yet
+    assert result.full_rebuild
+    scores_before = milestone_group_answer_session_scores(session)
+    assert {answer_session_id for answer_session_id, _ in scores_before} == set(
+        range(100, 246)
+    ) | {1, 2, 3, 4}
+
+    add_answer_sessions_with_age_curves(session, range(246, 250))
+    result = await async_update_stats(session, user_session)
+    assert not result.full_rebuild
+    assert result.answer_sessions == 150 + 4
+    # the answer sessions that were already included keep their scores, and the new
+    # ones are added to them
+    scores_after = milestone_group_answer_session_scores(session)
+    assert scores_after.items() >= scores_before.items()
+    assert scores_after.keys() - scores_before.keys() == {
+        (answer_session_id, milestone_group_id)
+        for answer_session_id in range(246, 250)
+        for milestone_group_id in (1, 2)
+    }
+    for answer_session_id in range(246, 250):
+        assert session.get(
+            MilestoneAnswerSession, answer_session_id
+        ).included_in_statistics
+
+    # the counts are exactly those of a full rebuild
+    incremental_milestone_counts = milestone_counts(session)
+    incremental_milestone_group_counts = milestone_group_counts(session)
+    result = await async_update_stats(session, user_session, full_rebuild=True)
+    assert result.full_rebuild
+    assert result.answer_sessions == 150 + 4
+    assert milestone_counts(session) == incremental_milestone_counts
+    assert milestone_group_counts(session) == incremental_milestone_group_counts
+
+
+@pytest.mark.asyncio
+async def test_update_queries_answer_sessions_in_chunks(
+    session, user_session, monkeypatch
+):
+    monkeypatch.setattr(statistics, "MAX_IDS_PER_QUERY", 7)
+    add_answer_sessions_with_age_curves(session, range(100, 160))
+    await async_update_stats(session, user_session)
+    for answer_session_id in range(100, 120):
+        session.get(
+            MilestoneAnswerSession, answer_session_id
+        ).suspicious_state = SuspiciousState.admin_suspicious
+    session.commit()
+    result = await async_update_stats(session, user_session)
+    assert not result.full_rebuild
+    assert result.answer_sessions == 40 + 4
+    scores = milestone_group_answer_session_scores(session)
+    counts = milestone_counts(session)
+    group_counts = milestone_group_counts(session)
+
+    monkeypatch.undo()
+    result = await async_update_stats(session, user_session, full_rebuild=True)
+    assert result.answer_sessions == 40 + 4
+    assert milestone_group_answer_session_scores(session).keys() == scores.keys()
+    assert milestone_counts(session) == counts
+    assert milestone_group_counts(session) == group_counts
+
+
+@pytest.mark.asyncio
+async def test_update_stores_expected_milestone_answers(session, user_session):
+    # before the first update they are calculated from the stored statistics
+    expected_answers = get_expected_milestone_answers(session)
+    assert expected_answers.milestone_index.ids.tolist() == [1, 2, 3, 4, 5]
+    assert session.exec(select(MilestoneExpectedAnswers)).all() == []
+
+    add_answer_sessions_with_age_curves(session, range(100, 246))
+    await async_update_stats(session, user_session)
+    version = session.get(StatisticsState, 1).version
+    assert [
+        stored.version for stored in session.exec(select(MilestoneExpectedAnswers))
+    ] == [version]
+    expected_answers = get_expected_milestone_answers(session)
+    assert get_expected_milestone_answers(session) is expected_answers
+    ages = np.arange(app_settings.MAX_CHILD_AGE_MONTHS + 1)
+    curves = get_milestone_curves(session)
+    for milestone_id in range(1, 6):
+        expected = expected_answers.lookup([milestone_id] * ages.size, ages)
+        if curves[milestone_id] is not None:
+            np.testing.assert_allclose(
+                expected, curves[milestone_id].mean_answer(ages), rtol=1e-6
+            )
+        else:
+            # the mean answer at each age where there is one
+            for age in ages:
+                score = session.get(
+                    MilestoneAgeScore,
+                    {"version": version, "milestone_id": milestone_id, "age": age},
+                )
+                if score is None or score.count == 0:
+                    assert np.isnan(expected[age])
+                else:
+                    assert expected[age] == pytest.approx(score.mean, rel=1e-6)
+    assert np.isnan(expected_answers.answer(99, 10))
+
+    await async_update_stats(session, user_session)
+    await async_update_stats(session, user_session)
+    # the expected answers of older versions are deleted along with their statistics
+    assert len(session.exec(select(MilestoneExpectedAnswers)).all()) == 2
+
+
+@pytest.mark.asyncio
+async def test_feedback_scores_match_statistics(session, user_session):
+    add_answer_sessions_with_age_curves(session, range(100, 246))
+    await async_update_stats(session, user_session)
+    stored_scores = session.exec(select(MilestoneGroupAnswerSessionScore)).all()
+    assert len(stored_scores) > 0
+    for stored_score in stored_scores:
+        answer_session = session.get(
+            MilestoneAnswerSession, stored_score.answer_session_id
+        )
+        # the feedback compares a score calculated the same way as the statistics
+        scores = compute_milestonegroup_scores(
+            session, answer_session, stored_score.age
+        )
+        assert scores[stored_score.milestone_group_id] == pytest.approx(
+            stored_score.score, rel=1e-6
+        )
+
+
+@pytest.mark.asyncio
+async def test_update_only_refits_milestone_age_curves_with_changed_counts(
+    session, user_session, mocker
+):
+    add_answer_sessions_with_age_curves(session, range(100, 246))
+    await async_update_stats(session, user_session)
+    curves = get_milestone_curves(session)
+    assert curves[5].fit_ok
+
+    fit = mocker.spy(statistics, "fit_milestone_age_curve")
+    await async_update_stats(session, user_session)
+    assert fit.call_count == 0
+    assert get_milestone_curves(session) == curves
+
+    # answer session 3 only answered milestone 5
+    session.get(
+        MilestoneAnswerSession, 3
+    ).suspicious_state = SuspiciousState.admin_suspicious
+    session.commit()
+    await async_update_stats(session, user_session)
+    assert fit.call_count == 1
+    # the refit starts from the previous curve
+    _, initial_guess = fit.call_args.args
+    assert initial_guess == (curves[5].midpoint, curves[5].steepness)
+    assert get_milestone_curves(session)[5].midpoint == pytest.approx(
+        curves[5].midpoint, abs=1.0
+    )
+
+
+@pytest.mark.asyncio
+async def test_incremental_update_removes_answer_sessions_flagged_by_admin(
+    session, user_session
+):
+    await async_update_stats(session, user_session)
+    assert (
+        session.get(
+            MilestoneAgeScore, current_version(session, milestone_id=1, age=8)
+        ).count
+        == 3
+    )
+
+    answer_session = session.get(MilestoneAnswerSession, 1)
+    assert answer_session.included_in_statistics
+    answer_session.suspicious_state = SuspiciousState.admin_suspicious
+    session.commit()
+
+    result = await async_update_stats(session, user_session)
+    assert not result.full_rebuild
+    assert result.answer_sessions == 3
+    assert (
+        session.get(
+            MilestoneAgeScore, current_version(session, milestone_id=1, age=8)
+        ).count
+        == 2
+    )
+    assert not session.get(MilestoneAnswerSession, 1).included_in_statistics
+
+
+@pytest.mark.asyncio
+async def test_incremental_update_rebuilds_after_answer_session_deleted(
+    session, user_session
+):
+    await async_update_stats(session, user_session)
+    assert (
+        session.get(
+            MilestoneAgeScore, current_version(session, milestone_id=1, age=8)
+        ).count
+        == 3
+    )
+
+    # the answers of a deleted answer session can no longer be taken out of the
+    # statistics, so they have to be rebuilt
+    session.delete(session.get(MilestoneAnswerSession, 2))
+    session.commit()
+
+    result = await async_update_stats(session, user_session)
+    assert result.full_rebuild
+    assert result.answer_sessions == 3
+    assert (
+        session.get(
+            MilestoneAgeScore, current_version(session, milestone_id=1, age=8)
+        ).count
+        == 2
+    )
+
+
+@pytest.mark.asyncio
+async def test_incremental_update_does_not_scan_stored_answers(session, user_session):
+    await async_update_stats(session, user_session)
+    statements: list[str] = []
+
+    def record_statement(_conn, _cursor, statement, _parameters, _context, _many):
+        statements.append(" ".join(statement.lower().split()))
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        result = await async_update_stats(session, user_session)
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+    assert not result.full_rebuild
+    # whether the stored statistics still match the answer sessions is checked with
+    # the statistics state rather than by counting every stored answer and score
+    for table in ["milestoneanswer", "milestonegroupanswersessionscore"]:
+        assert not any(
+            statement.startswith("select") and f"from {table} " in statement
+            for statement in statements
+        )
+
+
+@pytest.mark.asyncio
+async def test_update_writes_statistics_as_a_new_version(session, user_session):
+    def stored_versions(model) -> set[int]:
+        return set(session.exec(select(model.version)).all())
+
+    # the statistics of the test data are stored as version 0
+    assert get_statistics_version(session) == 0
+    counts = milestone_counts(session)
+
+    versions_while_saving = []
+
+    def save_milestone_group_statistics_spy(*args, **kwargs):
+        versions_while_saving.append(get_statistics_version(session))
+        return save_milestone_group_statistics(*args, **kwargs)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(
+            statistics,
+            "save_milestone_group_statistics",
+            save_milestone_group_statistics_spy,
+        )
+        await async_update_stats(session, user_session)
+    # the new version is only switched to once it has been written
+    assert versions_while_saving == [0]
+    assert get_statistics_version(session) == 1
+    assert milestone_counts(session) != counts
+    # the previous version is kept for readers that are still using it
+    for model in (MilestoneAgeScoreCollection, MilestoneGroupAgeScore):
+        assert stored_versions(model) == {0, 1}
+
+    await async_update_stats(session, user_session)
+    assert get_statistics_version(session) == 2
+    for model in (
+        MilestoneAgeScore,
+        MilestoneAgeScoreCollection,
+        MilestoneGroupAgeScore,
+        MilestoneGroupAgeScoreCollection,
+    ):
+        assert stored_versions(model) == {1, 2}
+
+
+def test_count_milestone_answers_in_a_single_query(session):
+    add_answer_sessions_with_age_curves(session, range(100, 246))
+    child_ages = {
+        answer_session_id: answer_session_id % 73
+        for answer_session_id in range(100, 246)
+    }
+    child_ages[1] = 8
+    expected = np.zeros((6, app_settings.MAX_CHILD_AGE_MONTHS + 1, 4), dtype=np.int64)
+    for answer_session_id, child_age in child_ages.items():
+        for milestone_id, answer in session.get(
+            MilestoneAnswerSession, answer_session_id
+        ).answers.items():
+            expected[milestone_id][child_age][answer.answer] += 1
+    session.expire_all()
+    statements: list[str] = []
+
+    def record_statement(_conn, _cursor, statement, _parameters, _context, _many):
+        statements.append(statement)
+
+    m_counts = np.zeros_like(expected)
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        count_milestone_answers(
+            session, m_counts, IdIndex.from_ids(range(6)), child_ages.keys()
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+
+    # the answers are counted in the database, with the child ages calculated there
+    assert len(statements) == 1
+    assert "GROUP BY" in statements[0]
+    np.testing.assert_array_equal(m_counts, expected)
+
+    # and removing them again leaves no counts behind
+    count_milestone_answers(
+        session, m_counts, IdIndex.from_ids(range(6)), child_ages.keys(), sign=-1
+    )
+    assert not m_counts.any()
+
+
+def test_count_milestone_answers_at_stored_child_ages(session):
+    add_answer_sessions_with_age_curves(session, range(100, 120, 2))
+    # the ages these answer sessions were added to the statistics at, before their
+    # child's birth month was corrected
+    session.add_all(
+        MilestoneAnswerSessionStatistics(
+            answer_session_id=answer_session_id, child_age=answer_session_id % 73 + 1
+        )
+        for answer_session_id in range(100, 120, 2)
+    )
+    session.commit()
+    m_counts = np.zeros((6, app_settings.MAX_CHILD_AGE_MONTHS + 1, 4), dtype=np.int64)
+    milestone_index = IdIndex.from_ids(range(6))
+    count_milestone_answers(session, m_counts, milestone_index, range(100, 120, 2))
+    count_milestone_answers(
+        session,
+        m_counts,
+        milestone_index,
+        range(100, 120, 2),
+        sign=-1,
+        stored_child_ages=True,
+    )
+
+    assert m_counts.sum() == 0
+    for answer_session_id in range(100, 120, 2):
+        assert m_counts[:, answer_session_id % 73].sum() == 5
+        assert m_counts[:, answer_session_id % 73 + 1].sum() == -5
+
+
+@pytest.mark.asyncio
+async def test_statistics_shards_match_a_single_process(tmp_path, monkeypatch):
+    # a worker process can only open a database in a file
+    engine = create_engine(f"sqlite:///{tmp_path / 'mondey.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(statistics, "MIN_ANSWER_SESSIONS_PER_SHARD", 50)
+    monkeypatch.setattr(app_settings, "STATS_SHARD_WORKERS", 3)
+    with Session(engine) as session:
+        session.add_all(MilestoneGroup(id=group_id, order=0) for group_id in (1, 2))
+        session.add_all(
+            Milestone(id=milestone_id, group_id=1 if milestone_id <= 3 else 2, order=0)
+            for milestone_id in range(1, 6)
+        )
+        add_answer_sessions_with_age_curves(session, range(100, 400))
+        answer_sessions = session.exec(select(MilestoneAnswerSession)).all()
+        assert len(statistics.statistics_shards(session, answer_sessions)) == 3
+        child_ages = {
+            answer_session.id: answer_session.id % 73
+            for answer_session in answer_sessions
+        }
+        milestones = session.exec(select(Milestone)).all()
+        milestone_curves = {
+            milestone_id: MilestoneAgeCurve(
+                midpoint=6.0 * milestone_id, steepness=0.5, n_answers=300, fit_ok=True
+            )
+            for milestone_id in range(1, 6)
+        }
+
+        milestone_index = IdIndex.from_ids(range(1, 6))
+        m_counts = np.zeros(
+            (len(milestone_index), app_settings.MAX_CHILD_AGE_MONTHS + 1, 4),
+            dtype=np.uint32,
+        )
+        with StatisticsUpdateProfiler(engine) as profiler:
+            profiler.start_phase("collecting milestone answers")
+            await count_milestone_answers_in_shards(
+                session, m_counts, milestone_index, answer_sessions
+            )
+        # the queries of the worker processes are counted too, one for each shard
+        assert profiler.phases[0].queries == 3
+        expected_counts = np.zeros_like(m_counts)
+        count_milestone_answers(
+            session, expected_counts, milestone_index, child_ages.keys()
+        )
+        np.testing.assert_array_equal(m_counts, expected_counts)
+
+        expected_answers = expected_milestone_answers(
+            milestone_index, m_counts, milestone_curves
+        )
+        scores = await calculate_milestone_group_scores_in_shards(
+            session, answer_sessions, child_ages, milestones, expected_answers
+        )
+        expected_scores = calculate_milestone_group_scores(
+            session, answer_sessions, child_ages, milestones, expected_answers
+        )
+        order = np.argsort(scores.answer_session_ids)
+        expected_order = np.argsort(expected_scores.answer_session_ids)
+        np.testing.assert_array_equal(
+            scores.answer_session_ids[order],
+            expected_scores.answer_session_ids[expected_order],
+        )
+        np.testing.assert_array_equal(
+            scores.child_ages[order], expected_scores.child_ages[expected_order]
+        )
+        np.testing.assert_array_equal(
+            scores.milestone_group_ids, expected_scores.milestone_group_ids
+        )
+        np.testing.assert_allclose(
+            scores.scores[order], expected_scores.scores[expected_order]
+        )
+    engine.dispose()
+
+
+def test_flag_answer_sessions_with_bulk_updates(session):
+    session.get(MilestoneAnswerSession, 6).completed = True
+    add_answer_sessions_with_age_curves(session, range(100, 140))
+    answer_sessions = [
+        session.get(MilestoneAnswerSession, answer_session_id)
+        for answer_session_id in range(100, 140)
+    ]
+    for answer_session in answer_sessions:
+        answer_session.suspicious_state = SuspiciousState.unknown
+    session.commit()
+    statements: list[str] = []
+
+    def record_statement(_conn, _cursor, statement, _parameters, _context, _many):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        flag_incomplete_answer_sessions(session)
+        # answer sessions that are already loaded see the new states
+        for answer_session in answer_sessions:
+            session.refresh(answer_session)
+        flag_suspicious_answer_sessions(session, [])
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+
+    # one statement for the incomplete answer sessions, and one per suspicious state
+    updates = [statement for statement in statements if statement.startswith("UPDATE")]
+    assert len(updates) <= 3
+    assert not session.get(MilestoneAnswerSession, 6).completed
+    assert all(
+        answer_session.suspicious_state != SuspiciousState.unknown
+        for answer_session in answer_sessions
+    )
+
+
+def test_flag_incomplete_answer_sessions_updates_achieved_milestones(session):
+    answer_session = session.get(MilestoneAnswerSession, 6)
+    answer_session.completed = True
+    session.add(
+        MilestoneAnswer(
+            answer_session_id=6, milestone_id=4, milestone_group_id=2, answer=3
+        )
+    )
+    update_child_achieved_milestones(session, [answer_session.child_id])
+    session.commit()
+    assert session.get(ChildAchievedMilestone, (3, 4)) is not None
+
+    flag_incomplete_answer_sessions(session)
+
+    assert session.get(ChildAchievedMilestone, (3, 4)) is None
+
+
+def test_calculate_milestone_group_scores_matches_per_session_average(session):
+    # sessions with an unanswered (-1) milestone are flagged incomplete, so never scored
+    answer_sessions = [
+        answer_session
+        for answer_session in session.exec(
+            select(MilestoneAnswerSession).where(MilestoneAnswerSession.completed)
+        ).all()
+        if all(answer.answer >= 0 for answer in answer_session.answers.values())
+    ]
+    child_ages = {answer_session.id: 8 for answer_session in answer_sessions}
+    milestones = session.exec(select(Milestone)).all()
+    milestone_curves = {
+        milestone.id: MilestoneAgeCurve(
+            midpoint=4.0 * milestone.id, steepness=0.5, n_answers=100, fit_ok=True
+        )
+        for milestone in milestones
+    }
+
+    milestone_index = IdIndex.from_ids(milestone_curves)
+    expected_answers = expected_milestone_answers(
+        milestone_index,
+        np.zeros(
+            (len(milestone_index), app_settings.MAX_CHILD_AGE_MONTHS + 1, 4),
+            dtype=np.uint32,
+        ),
+        milestone_curves,
+    )
+
+    milestone_group_scores = calculate_milestone_group_scores(
+        session, answer_sessions, child_ages, milestones, expected_answers
+    )
+
+    for (
+        answer_session,
+        achieved_milestone_ids,
+    ) in iter_sessions_with_previously_achieved_milestone_ids(session, answer_sessions):
+        row = list(milestone_group_scores.answer_session_ids).index(answer_session.id)
+        assert milestone_group_scores.child_ages[row] == 8
+        for column, milestone_group_id in enumerate(
+            milestone_group_scores.milestone_group_ids
+        ):
+            expected_answers = []
+            for milestone in milestones:
+                if milestone.group_id != milestone_group_id:
+                    continue
+                if milestone.id in answer_session.answers:
+                    expected_answers.append(answer_session.answers[milestone.id].answer)
+                elif milestone.id in achieved_milestone_ids:
+                    expected_answers.append(3.0)
+                else:
+                    expected_answers.append(
+                        milestone_curves[milestone.id].mean_answer(8)
+                    )
+            assert milestone_group_scores.scores[row, column] == pytest.approx(
+                np.mean(expected_answers)
+            )
+
+
+@pytest.mark.asyncio
+async def test_update_stats_measures_each_phase(session, user_session, monkeypatch):
+    monkeypatch.setattr(app_settings, "STATS_TRACE_MEMORY", True)
+    result = await async_update_stats(session, user_session)
+    assert [phase.phase for phase in result.phases] == list(STATISTICS_UPDATE_PHASES)
+    for phase in result.phases:
+        assert phase.runtime_seconds >= 0
+        assert phase.queries > 0
+        assert phase.peak_memory_bytes > 0
+    assert sum(phase.runtime_seconds for phase in result.phases) <= (
+        result.runtime_seconds + 0.1
+    )
+    saving = result.phases[-1]
+    # at least one row for each milestone and child age
+    assert saving.rows >= 5 * (app_settings.MAX_CHILD_AGE_MONTHS + 1)
+    # memory is only traced while the statistics are updated
+    assert not tracemalloc.is_tracing()
+
+
+def test_save_statistics_with_an_upsert_per_table(session):
+    milestone_ids = list(session.exec(select(Milestone.id)).all())
+    milestone_group_ids = list(session.exec(select(MilestoneGroup.id)).all())
+    milestone_index = IdIndex.from_ids(milestone_ids)
+    milestone_group_index = IdIndex.from_ids(milestone_group_ids)
+    n_ages = app_settings.MAX_CHILD_AGE_MONTHS + 1
+    rng = np.random.default_rng(1)
+    statements: list[str] = []
+
+    def record_statement(_conn, _cursor, statement, _parameters, _context, _many):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    # the first save inserts rows for the milestones without statistics, the second
+    # one updates every row
+    for _ in range(2):
+        m_counts = rng.integers(0, 10, (len(milestone_index), n_ages, 4))
+        mg_shape = (len(milestone_group_index), n_ages)
+        mg_counts = rng.integers(0, 10, mg_shape)
+        mg_sum_scores = rng.random(mg_shape)
+        mg_sum_squaredscores = rng.random(mg_shape)
+        statements.clear()
+        event.listen(engine, "before_cursor_execute", record_statement)
+        try:
+            save_milestone_statistics(
+                session,
+                1,
+                milestone_index,
+                m_counts,
+                {
+                    milestone_id: MilestoneAgeCurve(
+                        midpoint=12.0, steepness=0.5, n_answers=100, fit_ok=True
+                    )
+                    for milestone_id in milestone_ids
+                },
+                dict.fromkeys(milestone_ids, "hash"),
+            )
+            save_milestone_group_statistics(
+                session,
+                1,
+                milestone_group_index,
+                mg_counts,
+                mg_sum_scores,
+                mg_sum_squaredscores,
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", record_statement)
+        session.commit()
+
+        assert len(statements) == 4
+        for milestone_id in milestone_ids:
+            collection = session.get(
+                MilestoneAgeScoreCollection,
+                {"version": 1, "milestone_id": milestone_id},
+            )
+            assert collection.curve_fit_hash == "hash"
+            assert len(collection.scores) == n_ages
+            for score in collection.scores:
+                assert [score.c0, score.c1, score.c2, score.c3] == m_counts[
+                    milestone_index.row(milestone_id), score.age
+                ].tolist()
+        for milestone_group_id in milestone_group_ids:
+            for age in range(n_ages):
+                score = session.get(
+                    MilestoneGroupAgeScore,
+                    {
+                        "version": 1,
+                        "milestone_group_id": milestone_group_id,
+                        "age": age,
+                    },
+                )
+                row = milestone_group_index.row(milestone_group_id)
+                assert score.count == mg_counts[row, age]
+                assert score.sum_score == mg_sum_scores[row, age]
+
+
+def test_id_index_rows():
+    index = IdIndex.from_ids([7, 3, 12, 3])
+    assert len(index) == 3
+    np.testing.assert_array_equal(index.rows([12, 3, 5, 7, 20]), [2, 0, -1, 1, -1])
+    assert index.row(7) == 1
+
+
 def test_make_datatable_no_data():
     df = make_datatable(
         [], pd.DataFrame([]), pd.DataFrame([]), pd.DataFrame([]), {}, {}
@@ -0,0 +1,239 @@
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session
+from sqlmodel import SQLModel
+from sqlmodel import create_engine
+from sqlmodel import select
+
+from mondey_backend import statistics_jobs
+from mondey_backend.models.milestones import Milestone
+from mondey_backend.models.milestones import MilestoneGroup
+from mondey_backend.models.milestones import StatisticsUpdateJob
+from mondey_backend.models.milestones import StatisticsUpdateJobStatus
+from mondey_backend.models.users import Base
+from mondey_backend.statistics import STATISTICS_UPDATE_PHASES
+from mondey_backend.statistics import async_update_stats
+from mondey_backend.statistics_jobs import fail_interrupted_statistics_update_jobs
+from mondey_backend.statistics_jobs import get_statistics_update_job
+from mondey_backend.statistics_jobs import start_statistics_update_job
+
+
+@pytest.fixture
+def file_databases(tmp_path, monkeypatch):
+    """Databases in files, which unlike the in-memory test databases a worker process can open."""
+    mondey_engine = create_engine(f"sqlite:///{tmp_path / 'mondey.db'}")
+    SQLModel.metadata.create_all(mondey_engine)
+    users_engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    Base.metadata.create_all(users_engine)
+    monkeypatch.setattr(statistics_jobs, "mondey_engine", mondey_engine)
+    monkeypatch.setattr(
+        statistics_jobs,
+        "users_engine",
+        create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}"),
+    )
+    with Session(mondey_engine) as session:
+        session.add(MilestoneGroup(id=1, order=1))
+        session.add(Milestone(id=1, group_id=1, order=1))
+        session.commit()
+    return mondey_engine
+
+
+def test_statistics_update_job_runs_in_worker_process(file_databases):
+    with Session(file_databases) as session:
+        job = start_statistics_update_job(session)
+        # only one statistics update runs at a time
+        assert start_statistics_update_job(session).id == job.id
+
+        deadline = time.monotonic() + 120
+        public_job = get_statistics_update_job(session, job.id)
+        while public_job.status in (
+            StatisticsUpdateJobStatus.queued,
+            StatisticsUpdateJobStatus.running,
+        ):
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+            public_job = get_statistics_update_job(session, job.id)
+
+        assert public_job.status == StatisticsUpdateJobStatus.succeeded
+        assert public_job.error == ""
+        assert public_job.progress == 1.0
+        assert public_job.result is not None
+        assert public_job.result.answer_sessions == 0
+        assert public_job.result.full_rebuild
+        assert public_job.finished_at >= public_job.started_at
+        assert job.id not in statistics_jobs._worker_processes
+
+
+def test_finished_worker_processes_are_cleaned_up(file_databases):
+    with Session(file_databases) as session:
+        # as for a scheduled statistics update, nobody asks for the status of this job
+        first_job = start_statistics_update_job(session)
+        process, _ = statistics_jobs._worker_processes[first_job.id]
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+        job = start_statistics_update_job(session)
+
+        assert job.id != first_job.id
+        assert first_job.id not in statistics_jobs._worker_processes
+        process, _ = statistics_jobs._worker_processes[job.id]
+        process.join(timeout=120)
+        get_statistics_update_job(session, job.id)
+        assert statistics_jobs._worker_processes == {}
+
+
+def test_concurrent_statistics_update_requests_share_one_job(
+    file_databases, monkeypatch
+):
+    started_job_ids = []
+    monkeypatch.setattr(
+        statistics_jobs,
+        "start_statistics_update_process",
+        lambda job_id, full_rebuild: started_job_ids.append(job_id),
+    )
+    n_requests = 8
+    barrier = threading.Barrier(n_requests)
+
+    def request_statistics_update(_) -> int:
+        with Session(file_databases) as session:
+            barrier.wait()
+            job_id = start_statistics_update_job(session).id
+            assert job_id is not None
+            return job_id
+
+    with ThreadPoolExecutor(n_requests) as executor:
+        job_ids = set(executor.map(request_statistics_update, range(n_requests)))
+
+    assert job_ids == set(started_job_ids)
+    assert len(started_job_ids) == 1
+    with Session(file_databases) as session:
+        assert len(session.exec(select(StatisticsUpdateJob)).all()) == 1
+
+
+def test_fail_interrupted_statistics_update_jobs(session):
+    now = datetime.datetime.now()
+    long_ago = now - datetime.timedelta(hours=1)
+    session.add(
+        StatisticsUpdateJob(
+            id=1,
+            status=StatisticsUpdateJobStatus.running,
+            created_at=long_ago,
+            heartbeat_at=long_ago,
+        )
+    )
+    session.add(
+        StatisticsUpdateJob(
+            id=2, status=StatisticsUpdateJobStatus.succeeded, created_at=long_ago
+        )
+    )
+    # still being run by another server process
+    session.add(
+        StatisticsUpdateJob(
+            id=3,
+            status=StatisticsUpdateJobStatus.running,
+            created_at=long_ago,
+            heartbeat_at=now,
+        )
+    )
+    # just started by another server process
+    session.add(
+        StatisticsUpdateJob(
+            id=4, status=StatisticsUpdateJobStatus.queued, created_at=now
+        )
+    )
+    session.add(
+        StatisticsUpdateJob(
+            id=5, status=StatisticsUpdateJobStatus.queued, created_at=long_ago
+        )
+    )
+    session.commit()
+
+    fail_interrupted_statistics_update_jobs(session)
+
+    statuses = {
+        job.id: job.status for job in session.exec(select(StatisticsUpdateJob)).all()
+    }
+    assert statuses == {
+        1: StatisticsUpdateJobStatus.failed,
+        2: StatisticsUpdateJobStatus.succeeded,
+        3: StatisticsUpdateJobStatus.running,
+        4: StatisticsUpdateJobStatus.queued,
+        5: StatisticsUpdateJobStatus.failed,
+    }
+    assert session.get(StatisticsUpdateJob, 1).error != ""
+
+
+def test_interrupted_statistics_update_job_of_another_process_is_replaced(
+    file_databases, monkeypatch
+):
+    started_job_ids = []
+    monkeypatch.setattr(
+        statistics_jobs,
+        "start_statistics_update_process",
+        lambda job_id, full_rebuild: started_job_ids.append(job_id),
+    )
+    long_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+    with Session(file_databases) as session:
+        session.add(
+            StatisticsUpdateJob(
+                id=1,
+                status=StatisticsUpdateJobStatus.running,
+                created_at=long_ago,
+                heartbeat_at=long_ago,
+            )
+        )
+        session.commit()
+
+        assert (
+            get_statistics_update_job(session, 1).status
+            == StatisticsUpdateJobStatus.failed
+        )
+        session.get(StatisticsUpdateJob, 1).status = StatisticsUpdateJobStatus.running
+        session.commit()
+
+        commits = []
+
+        def record_commit(session):
+            commits.append(session)
+
+        event.listen(session, "after_commit", record_commit)
+        job = start_statistics_update_job(session)
+        event.remove(session, "after_commit", record_commit)
+
+        # failed in the same transaction as its replacement is added, so that the
+        # statistics update lock is held until both are done
+        assert len(commits) == 1
+        assert job.id != 1
+        assert started_job_ids == [job.id]
+        assert (
+            session.get(StatisticsUpdateJob, 1).status
+            == StatisticsUpdateJobStatus.failed
+        )
+
+
+def test_statistics_update_heartbeat(file_databases, monkeypatch):
+    monkeypatch.setattr(statistics_jobs, "STATISTICS_UPDATE_HEARTBEAT_SECONDS", 0.01)
+    with Session(file_databases) as session:
+        session.add(StatisticsUpdateJob(id=1, created_at=datetime.datetime.now()))
+        session.commit()
+        with statistics_jobs.statistics_update_heartbeat(file_databases, 1):
+            time.sleep(0.1)
+        first_heartbeat = session.get(StatisticsUpdateJob, 1).heartbeat_at
+        assert first_heartbeat is not None
+        time.sleep(0.1)
+        session.expire_all()
+        # no more heartbeats once the update is done
+        assert session.get(StatisticsUpdateJob, 1).heartbeat_at == first_heartbeat
+
+
+@pytest.mark.asyncio
+async def test_statistics_update_reports_its_phases(session, user_session):
+    phases = []
+    await async_update_stats(session, user_session, progress=phases.append)
+    assert phases == list(STATISTICS_UPDATE_PHASES)
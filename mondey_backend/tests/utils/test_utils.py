@@ -1,13 +1,22 @@
 import pytest
 from fastapi import HTTPException
+from sqlalchemy import event
 from sqlmodel import select
 
+from mondey_backend.models.children import Child
+from mondey_backend.models.milestones import Milestone
+from mondey_backend.models.milestones import MilestoneAgeScoreCollection
 from mondey_backend.models.milestones import MilestoneAnswerSession
 from mondey_backend.models.milestones import MilestoneGroup
+from mondey_backend.models.milestones import StatisticsState
+from mondey_backend.routers import utils
 from mondey_backend.routers.utils import count_milestone_answers_for_milestone
 from mondey_backend.routers.utils import get_answer_session_child_ages_in_months
 from mondey_backend.routers.utils import get_db_milestone_answer_session
+from mondey_backend.routers.utils import get_milestone_curves
 from mondey_backend.routers.utils import get_milestonegroups_for_answersession
+from mondey_backend.routers.utils import get_or_create_current_milestone_answer_session
+from mondey_backend.routers.utils import milestone_catalogue_changed
 
 
 def test_get_milestonegroups_for_answersession(session):
@@ -67,3 +76,70 @@ def test_get_db_milestone_answer_session_rejects_non_owner(
 def test_get_db_milestone_answer_session_allows_admin(session, active_admin_user):
     answer_session = get_db_milestone_answer_session(session, active_admin_user, 1)
     assert answer_session.id == 1
+
+
+def test_get_milestone_curves_is_cached_per_statistics_version(session, mocker):
+    load = mocker.spy(utils, "load_milestone_curves")
+    curves = get_milestone_curves(session)
+    assert get_milestone_curves(session) is curves
+    assert get_milestone_curves(session, version=0) is curves
+    assert load.call_count == 1
+
+    # a statistics update writes a new version and switches to it
+    collection = session.get(
+        MilestoneAgeScoreCollection, {"version": 0, "milestone_id": 1}
+    )
+    session.add(
+        MilestoneAgeScoreCollection(
+            **collection.model_dump(exclude={"version"}), version=1
+        )
+    )
+    session.add(StatisticsState(version=1))
+    session.commit()
+    new_curves = get_milestone_curves(session)
+    assert load.call_count == 2
+    assert list(new_curves) == [1]
+    assert get_milestone_curves(session) is new_curves
+    # a request that started before the switch still reads the version it started with
+    assert get_milestone_curves(session, version=0) == curves
+    assert load.call_count == 3
+
+
+def test_get_or_create_current_milestone_answer_session_queries(session, active_user):
+    child = session.get(Child, 1)
+
+    def create_answer_session() -> tuple[MilestoneAnswerSession, int]:
+        session.refresh(child)
+        statements = []
+
+        def record_statement(_conn, _cursor, statement, _parameters, _context, _many):
+            statements.append(statement)
+
+        engine = session.get_bind()
+        event.listen(engine, "before_cursor_execute", record_statement)
+        try:
+            answer_session = get_or_create_current_milestone_answer_session(
+                session, active_user, child
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", record_statement)
+        answer_session.expired = True
+        session.add(answer_session)
+        session.commit()
+        return answer_session, len(statements)
+
+    answer_session, n_statements = create_answer_session()
+    n_answers = len(answer_session.answers)
+    assert n_answers > 0
+    # many more age relevant milestones take the same number of queries
+    for _ in range(50):
+        session.add(Milestone(group_id=1, relevant_age_min=0, relevant_age_max=72))
+    session.commit()
+    # the milestone age ranges are cached until the milestones are marked as changed
+    answer_session, _ = create_answer_session()
+    assert len(answer_session.answers) == n_answers
+    milestone_catalogue_changed(session)
+    session.commit()
+    answer_session, n_more_statements = create_answer_session()
+    assert len(answer_session.answers) == n_answers + 50
+    assert n_more_statements == n_statements